@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the Python side of the docstamp render pipeline.
+
+The documents are rendered with the `null` backend, which creates empty files,
+so no external program is needed and the timings are the docstamp overhead only.
+The CSV files are generated with the requested number of rows.
+
+Examples:
+
+    python benchmarks/run_benchmarks.py -o results.json
+    python benchmarks/run_benchmarks.py --rows 1000 --compare results.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import random
+import logging
+import argparse
+import platform
+import contextlib
+import tempfile
+
+from docstamp.cli.cli import create
+from docstamp.cli.utils import get_items_from_csv, iter_items_from_csv
+from docstamp.pdf_utils import merge_pdfs
+from docstamp.qrcode import save_into_qrcode
+from docstamp.template import TextDocument, SVGDocument, LateXDocument, SVGDOMDocument
+from docstamp.version import __version__
+
+log = logging.getLogger(__name__)
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+
+DEFAULT_ROWS = '1000,100000,1000000'
+
+# the end-to-end runs write one file per row
+DEFAULT_CREATE_MAX_ROWS = 100000
+
+NAMES = ['Ane', 'Mikel', 'Jon', 'Maite', 'Iker', 'Nerea', 'Ainhoa', 'Unai']
+SURNAMES = ['Etxeberria', 'Garcia', 'Agirre', 'Lopez', 'Zubizarreta', "O'Neill"]
+# the XML special characters test the escaping of the SVG templates
+COMPANIES = ['ACPySS', 'Smith & Sons', '<Python> Labs', 'Café "Bilbo"', '']
+
+
+def create_argparser():
+    parser = argparse.ArgumentParser(description='Run the docstamp benchmarks.')
+    parser.add_argument('--rows', action='store', dest='rows', default=DEFAULT_ROWS,
+                        help='Comma separated numbers of CSV rows of each run')
+    parser.add_argument('--create-max-rows', type=int, action='store', dest='create_max_rows',
+                        default=DEFAULT_CREATE_MAX_ROWS,
+                        help='Maximum number of rows of the end-to-end `docstamp create` runs')
+    parser.add_argument('--repeat', type=int, action='store', dest='repeat', default=3,
+                        help='Number of times each benchmark is run, the fastest one is kept')
+    parser.add_argument('-k', '--keyword', action='store', dest='keyword', default='',
+                        help='Run only the benchmarks with this text in their names')
+    parser.add_argument('-o', '--output', action='store', dest='output',
+                        help='Output JSON file path of the results')
+    parser.add_argument('--compare', action='store', dest='compare',
+                        help='JSON file with previous results to compare with')
+    parser.add_argument('--threshold', type=float, action='store', dest='threshold', default=1.2,
+                        help='Ratio to the previous time over which a benchmark is a regression')
+    return parser
+
+
+def write_csv(csv_filepath, n_rows, seed=0):
+    """ Write a CSV file with `n_rows` synthetic attendees. """
+    rand = random.Random(seed)
+    with open(csv_filepath, 'w', encoding='utf-8') as f:
+        f.write('name,surname,company,email\n')
+        for idx in range(n_rows):
+            name, surname = rand.choice(NAMES), rand.choice(SURNAMES)
+            company = rand.choice(COMPANIES)
+            email = '{}.{}{}@example.com'.format(name, surname, idx).lower().replace("'", '')
+            f.write('{},{},"{}",{}\n'.format(name, surname, company.replace('"', '""'), email))
+
+
+def write_blank_pdfs(folder, n_files):
+    """ Write `n_files` one page PDF files in `folder` and return their paths. """
+    from PyPDF2 import PdfWriter
+
+    paths = []
+    for idx in range(n_files):
+        writer = PdfWriter()
+        writer.add_blank_page(width=255, height=170)
+        path = os.path.join(folder, 'blank_{:05d}.pdf'.format(idx))
+        with open(path, 'wb') as f:
+            writer.write(f)
+        paths.append(path)
+    return paths
+
+
+def bench_read_csv(csv_filepath, n_rows, work_dir):
+    items, _ = get_items_from_csv(csv_filepath)
+    return len(items)
+
+
+def bench_iter_csv(csv_filepath, n_rows, work_dir):
+    return sum(1 for _ in iter_items_from_csv(csv_filepath))
+
+
+def _bench_fill(doc_type, template_name):
+    def bench(csv_filepath, n_rows, work_dir):
+        doc = doc_type(os.path.join(TEMPLATES_DIR, template_name))
+        count = 0
+        for _, item in iter_items_from_csv(csv_filepath):
+            doc.fill(item)
+            count += 1
+        return count
+    return bench
+
+
+def bench_save_into_qrcode(csv_filepath, n_rows, work_dir):
+    # one QR code per attendee, of its email and company, which are often repeated
+    count = 0
+    for _, item in iter_items_from_csv(csv_filepath):
+        save_into_qrcode(item['company'] or item['email'], os.path.join(work_dir, 'qr.svg'))
+        count += 1
+    return count
+
+
+def setup_merge_pdfs(csv_filepath, n_rows, work_dir):
+    pdf_dir = os.path.join(work_dir, 'pdfs')
+    if not os.path.exists(pdf_dir):
+        os.mkdir(pdf_dir)
+        write_blank_pdfs(pdf_dir, n_rows)
+
+
+def bench_merge_pdfs(csv_filepath, n_rows, work_dir):
+    pdf_dir = os.path.join(work_dir, 'pdfs')
+    pdf_filepaths = sorted(os.path.join(pdf_dir, name) for name in os.listdir(pdf_dir))
+    merge_pdfs(pdf_filepaths, os.path.join(work_dir, 'merged.pdf'))
+    return len(pdf_filepaths)
+
+
+def _bench_create(template_name, *options):
+    def bench(csv_filepath, n_rows, work_dir):
+        out_dir = tempfile.mkdtemp(dir=work_dir)
+        args = ['-i', csv_filepath, '-t', os.path.join(TEMPLATES_DIR, template_name),
+                '-o', out_dir, '-c', 'null', '-d', 'pdf'] + list(options)
+        with contextlib.redirect_stdout(io.StringIO()):
+            create.main(args, standalone_mode=False)
+        return len(os.listdir(out_dir))
+    return bench
+
+
+# name, function, maximum number of rows (None for all), setup function
+BENCHMARKS = [
+    ('get_items_from_csv', bench_read_csv, None, None),
+    ('iter_items_from_csv', bench_iter_csv, None, None),
+    ('TextDocument.fill', _bench_fill(TextDocument, 'badge.txt'), None, None),
+    ('SVGDocument.fill', _bench_fill(SVGDocument, 'badge.svg'), None, None),
+    ('SVGDOMDocument.fill', _bench_fill(SVGDOMDocument, 'badge_dom.svg'), None, None),
+    ('LateXDocument.fill', _bench_fill(LateXDocument, 'badge.tex'), None, None),
+    ('save_into_qrcode', bench_save_into_qrcode, 100000, None),
+    ('merge_pdfs', bench_merge_pdfs, 10000, setup_merge_pdfs),
+    ('create svg', _bench_create('badge.svg'), 'create', None),
+    ('create svg --jobs 4', _bench_create('badge.svg', '--jobs', '4'), 'create', None),
+    ('create txt', _bench_create('badge.txt'), 'create', None),
+]
+
+
+def run_benchmark(function, csv_filepath, n_rows, work_dir, repeat):
+    """ Return the fastest time of `repeat` runs of the benchmark and the number of processed items. """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = function(csv_filepath, n_rows, work_dir)
+        times.append(time.perf_counter() - start)
+    return min(times), count
+
+
+def run_benchmarks(rows, repeat=3, keyword='', create_max_rows=DEFAULT_CREATE_MAX_ROWS):
+    """ Run the benchmarks with CSV files of each number of `rows`.
+
+    Returns
+    -------
+    results: list of dict
+    """
+    results = []
+    for n_rows in rows:
+        with tempfile.TemporaryDirectory(prefix='docstamp_bench_') as work_dir:
+            csv_filepath = os.path.join(work_dir, 'attendees.csv')
+            write_csv(csv_filepath, n_rows)
+
+            for name, function, max_rows, setup in BENCHMARKS:
+                if keyword not in name:
+                    continue
+
+                if max_rows == 'create':
+                    max_rows = create_max_rows
+                if max_rows is not None and n_rows > max_rows:
+                    log.info('Skipping {} with {} rows.'.format(name, n_rows))
+                    continue
+
+                if setup is not None:
+                    setup(csv_filepath, n_rows, work_dir)
+
+                seconds, count = run_benchmark(function, csv_filepath, n_rows, work_dir, repeat)
+                result = {'name': name,
+                          'rows': n_rows,
+                          'seconds': seconds,
+                          'items_per_second': count / seconds if seconds else None}
+                print('{:<24} {:>8} rows {:>10.4f} s {:>12.1f} items/s'.format(
+                    name, n_rows, seconds, result['items_per_second'] or 0))
+                results.append(result)
+    return results
+
+
+def compare_results(results, previous, threshold):
+    """ Return the results that are more than `threshold` times slower than in `previous`. """
+    previous_times = {(result['name'], result['rows']): result['seconds']
+                      for result in previous['results']}
+
+    regressions = []
+    for result in results:
+        before = previous_times.get((result['name'], result['rows']))
+        if not before:
+            continue
+
+        ratio = result['seconds'] / before
+        print('{:<24} {:>8} rows {:>6.2f}x'.format(result['name'], result['rows'], ratio))
+        if ratio > threshold:
+            regressions.append(dict(result, ratio=ratio))
+    return regressions
+
+
+if __name__ == '__main__':
+
+    logging.basicConfig(level=logging.INFO)
+
+    parser = create_argparser()
+    args = parser.parse_args()
+
+    rows = [int(n_rows) for n_rows in args.rows.split(',')]
+    results = run_benchmarks(rows, repeat=args.repeat, keyword=args.keyword,
+                             create_max_rows=args.create_max_rows)
+
+    # the CLI sets the level of the root logger
+    logging.getLogger().setLevel(logging.INFO)
+
+    report = {'docstamp_version': __version__,
+              'python_version': platform.python_version(),
+              'platform': platform.platform(),
+              'cpu_count': os.cpu_count(),
+              'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'results': results}
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare_results(results, json.load(f), args.threshold)
+
+        for regression in regressions:
+            log.error('Regression: {} with {} rows is {:.2f} times slower.'.format(
+                regression['name'], regression['rows'], regression['ratio']))
+
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,381 @@
+"""
+Registry of the rendering backends: the commands or libraries that
+convert the content of a filled document into the output file.
+
+Each backend declares the input and output file types it handles, whether
+it supports unicode, whether it can run concurrently in threads or in a pool
+of processes, and its relative cost per document. The cheapest capable backend
+is picked for each document, unless another one is preferred.
+"""
+import logging
+
+from docstamp.commands import which
+from docstamp.config import get_inkscape_binpath
+from docstamp.file_utils import get_tempfile, write_to_file
+from docstamp.inkscape import svg2pdf, svg2png, inkscape_pipe_export
+from docstamp.inkscape_shell import get_shell_pool
+from docstamp.pdflatex import tex2pdf, xetex2pdf, make_format, split_preamble
+from docstamp.svg_utils import rsvg_export_content, cairosvg_export, cairosvg_supports
+
+log = logging.getLogger(__name__)
+
+BACKENDS = {}
+
+
+class UnsupportedDocument(Exception):
+    """ Raised by a backend that can not render a document,
+    the next capable backend should be used instead.
+    """
+    pass
+
+
+class Backend(object):
+    """ A rendering backend. Subclass it and use `register_backend`
+    to make it available.
+    """
+    # name of the backend, also used as the `--command` CLI option value
+    name = None
+
+    # file types of the filled documents that it can read
+    input_types = ()
+
+    # file types that it can write
+    output_types = ()
+
+    # whether the output files support unicode text
+    supports_unicode = False
+
+    # whether it can render many documents at the same time in a pool of processes
+    poolable = True
+
+    # whether it renders in the docstamp process, without calling an external command
+    in_process = False
+
+    # relative cost of rendering one document, the lower the cheaper
+    cost = 10
+
+    # whether it can be picked when it is not explicitly requested
+    auto_select = True
+
+    # name of the external command it calls, if any
+    binary = None
+
+    # name of the backend to try next when this one is preferred but can not
+    # render a document, before the other capable ones
+    fallback = None
+
+    def is_available(self):
+        """ Return True if the backend can be used in this system. """
+        if self.binary is None:
+            return True
+        return which(self.binary) is not None
+
+    def can_render(self, input_type, output_type, support_unicode=False):
+        """ Return True if the backend can convert `input_type` documents
+        into `output_type` files.
+        """
+        if support_unicode and not self.supports_unicode:
+            return False
+        return input_type in self.input_types and output_type in self.output_types
+
+    def supports(self, content):
+        """ Return False if the backend knows it can not render the document `content`. """
+        return True
+
+    def export(self, content, output_file, file_type='pdf', dpi=150, **kwargs):
+        """ Render the document `content` into `output_file`.
+
+        Parameters
+        ----------
+        content: str
+            Filled document content.
+
+        output_file: str
+            Path to the output file.
+
+        file_type: str
+            Output file type.
+
+        dpi: int
+            Dots-per-inch of the output file.
+
+        Raises
+        ------
+        UnsupportedDocument
+            If the document could not be rendered by this backend.
+        """
+        raise NotImplementedError
+
+
+def register_backend(backend_cls):
+    """ Register an instance of `backend_cls` by its name.
+    Can be used as a class decorator.
+    """
+    BACKENDS[backend_cls.name] = backend_cls()
+    return backend_cls
+
+
+def get_backend(name):
+    """ Return the backend registered with `name`.
+
+    Raises
+    ------
+    ValueError
+        If there is no backend with that name.
+    """
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError('Could not find a rendering backend named {}.'.format(name))
+
+
+def find_backends(input_type, output_type, support_unicode=False, content=None, preferred=None):
+    """ Return the backends that can render `input_type` documents into `output_type` files:
+    `preferred` and its fallback first if they are capable, then the available ones sorted by cost.
+
+    Parameters
+    ----------
+    input_type: str
+        Filled document file type, e.g., 'svg' or 'tex'.
+
+    output_type: str
+        Output file type, e.g., 'pdf'.
+
+    support_unicode: bool
+        Whether the backends must support unicode text.
+
+    content: str
+        If given, the backends that do not support this document content are left out.
+
+    preferred: str
+        Name of the preferred backend.
+
+    Returns
+    -------
+    backends: list of Backend
+    """
+    capable = [backend for backend in BACKENDS.values()
+               if backend.can_render(input_type, output_type, support_unicode)]
+    if content is not None:
+        capable = [backend for backend in capable if backend.supports(content)]
+
+    first = [preferred]
+    if preferred in BACKENDS:
+        first.append(BACKENDS[preferred].fallback)
+
+    backends = [backend for name in first for backend in capable if backend.name == name]
+    backends += sorted((backend for backend in capable
+                        if backend.name not in first and backend.auto_select and backend.is_available()),
+                       key=lambda backend: backend.cost)
+    return backends
+
+
+def select_backend(input_type, output_type, support_unicode=False, content=None, preferred=None):
+    """ Return the first of `find_backends`.
+
+    Raises
+    ------
+    ValueError
+        If no backend is capable.
+    """
+    backends = find_backends(input_type, output_type, support_unicode=support_unicode,
+                             content=content, preferred=preferred)
+    if not backends:
+        raise ValueError('Could not find a rendering backend for {} to {}{}.'.format(
+            input_type, output_type, ' with unicode support' if support_unicode else ''))
+    return backends[0]
+
+
+def export_content(content, output_file, input_type, file_type='pdf', dpi=150, support_unicode=False,
+                   preferred=None, **kwargs):
+    """ Render the document `content` into `output_file` with the `preferred` backend,
+    trying the next capable ones if it can not render it. See find_backends.
+
+    Raises
+    ------
+    UnsupportedDocument
+        If no backend could render the document.
+    """
+    backends = find_backends(input_type, file_type, support_unicode=support_unicode,
+                             content=content, preferred=preferred)
+    for backend in backends:
+        try:
+            backend.export(content, output_file, file_type=file_type, dpi=dpi, **kwargs)
+        except UnsupportedDocument:
+            log.warning('Backend {} could not render {}, trying the next '
+                        'one.'.format(backend.name, output_file), exc_info=True)
+        else:
+            return backend
+
+    raise UnsupportedDocument('No backend could render {}.'.format(output_file))
+
+
+@register_backend
+class InkscapeBackend(Backend):
+    name = 'inkscape'
+    input_types = ('svg',)
+    output_types = ('pdf', 'png')
+    cost = 10
+
+    def is_available(self):
+        return get_inkscape_binpath() is not None
+
+    def export(self, content, output_file, file_type='pdf', dpi=150, inkscape_pipe=False, **kwargs):
+        """ See Backend.export.
+
+        Kwargs
+        ------
+        inkscape_pipe: bool
+            Whether to pass the content to Inkscape through its standard input
+            instead of a temporary file. Requires Inkscape >= 1.0.
+        """
+        if inkscape_pipe and get_shell_pool() is None:
+            return inkscape_pipe_export(content, output_file, export_type=file_type, dpi=dpi)
+
+        # the inkscape shell and older inkscape versions need a file
+        temp = get_tempfile(suffix='.svg')
+        write_to_file(temp.name, content, encoding='utf-8')
+        if file_type == 'png':
+            return svg2png(temp.name, output_file, dpi=dpi)
+        return svg2pdf(temp.name, output_file, dpi=dpi)
+
+
+@register_backend
+class RSVGBackend(Backend):
+    name = 'rsvg-convert'
+    input_types = ('svg',)
+    output_types = ('pdf',)
+    supports_unicode = True
+    binary = 'rsvg-convert'
+    cost = 3
+
+    def export(self, content, output_file, file_type='pdf', dpi=150, **kwargs):
+        return rsvg_export_content(content, output_file, dpi=dpi)
+
+
+@register_backend
+class CairoSVGBackend(Backend):
+    name = 'cairosvg'
+    input_types = ('svg',)
+    output_types = ('pdf', 'png')
+    supports_unicode = True
+    in_process = True
+    cost = 1
+    fallback = 'inkscape'
+
+    # whether cairosvg and the cairo library can be loaded, the failed imports are not cached
+    _available = None
+
+    def is_available(self):
+        if self._available is None:
+            try:
+                import cairosvg  # noqa
+            except (ImportError, OSError):
+                self._available = False
+            else:
+                self._available = True
+        return self._available
+
+    def supports(self, content):
+        return cairosvg_supports(content)
+
+    def export(self, content, output_file, file_type='pdf', dpi=150, **kwargs):
+        try:
+            cairosvg_export(content, output_file, file_type=file_type, dpi=dpi)
+        except ImportError:
+            raise
+        except Exception as exc:
+            raise UnsupportedDocument('CairoSVG could not render {}.'.format(output_file)) from exc
+
+
+class LatexBackend(Backend):
+    input_types = ('tex',)
+    output_types = ('pdf',)
+
+    _render_function = None
+
+    def export(self, content, output_file, file_type='pdf', dpi=150, precompile_preamble=False,
+               scratch_dir=None, **kwargs):
+        """ See Backend.export.
+
+        Kwargs
+        ------
+        precompile_preamble: bool
+            Whether to compile the document body against a format file with its
+            preamble, built once for every different preamble. See pdflatex.make_format.
+
+        scratch_dir: str
+            Folder where to write the intermediate files.
+            If None, will use a new temporary folder.
+        """
+        fmt_file = None
+        if precompile_preamble:
+            try:
+                preamble, body = split_preamble(content)
+                fmt_file = make_format(preamble, cmd_name=self.binary)
+            except (ValueError, IOError):
+                log.warning('Could not precompile the LaTeX preamble for {}, compiling '
+                            'the whole document.'.format(output_file), exc_info=True)
+            else:
+                # the preamble is already in the format
+                content = body
+
+        temp = get_tempfile(suffix='.tex')
+        write_to_file(temp.name, content, encoding='utf-8')
+        return self._render_function(temp.name, output_file, output_format='pdf',
+                                     fmt_file=fmt_file, scratch_dir=scratch_dir)
+
+
+@register_backend
+class PDFLatexBackend(LatexBackend):
+    name = 'pdflatex'
+    binary = 'pdflatex'
+    cost = 20
+    _render_function = staticmethod(tex2pdf)
+
+
+@register_backend
+class XeLatexBackend(LatexBackend):
+    name = 'xelatex'
+    binary = 'xelatex'
+    supports_unicode = True
+    cost = 30
+    _render_function = staticmethod(xetex2pdf)
+
+
+@register_backend
+class CopyBackend(Backend):
+    """ Write the filled document as it is. The text documents are written
+    as they are whatever the output file type.
+    """
+    name = 'copy'
+    input_types = ('txt', 'svg', 'tex', 'pdf')
+    output_types = input_types
+    supports_unicode = True
+    in_process = True
+    cost = 0
+
+    def can_render(self, input_type, output_type, support_unicode=False):
+        if input_type == 'txt':
+            return True
+        return input_type == output_type and input_type in self.input_types
+
+    def export(self, content, output_file, file_type='pdf', dpi=150, **kwargs):
+        write_to_file(output_file, content, encoding='utf-8')
+
+
+@register_backend
+class NullBackend(Backend):
+    """ Create empty output files without rendering anything.
+    Useful to measure the cost of docstamp without the rendering.
+    """
+    name = 'null'
+    input_types = ('txt', 'svg', 'tex', 'pdf')
+    output_types = ('txt', 'svg', 'tex', 'pdf', 'png')
+    supports_unicode = True
+    in_process = True
+    cost = 0
+    auto_select = False
+
+    def export(self, content, output_file, file_type='pdf', dpi=150, **kwargs):
+        open(output_file, 'wb').close()
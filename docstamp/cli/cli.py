@@ -3,22 +3,37 @@ import click
 
 import os
 import math
+import time
 import logging
+from contextlib import closing, contextmanager
 
-from docstamp.file_utils import get_extension
-from docstamp.template import TextDocument
-from docstamp.config import LOGGING_LVL
+from docstamp.file_utils import get_extension, file_hash
+from docstamp.config import LOGGING_LVL, get_cache_dir, set_cache_dir, restored_settings
+from docstamp.journal import RenderJournal, NullJournal, row_hash
+from docstamp.backends import BACKENDS
+from docstamp.template import TextDocument, enable_bytecode_cache
+from docstamp.parallel import render_items
+from docstamp.pdf_utils import merge_pdfs, DEFAULT_MERGE_BATCH_SIZE
+from docstamp.imposition import PAPER_SIZES, SheetLayout, svg_size, iter_sheets, render_sheet
+from docstamp.inkscape_shell import enable_shell_mode, close_shell_pools
+from docstamp.commands import DEFAULT_COMMAND_TIMEOUT, set_command_timeout
+from docstamp.timing import RunReport
 
 from docstamp.cli.utils import (
     CONTEXT_SETTINGS,
     verbose_switch,
-    get_items_from_csv,
+    get_csv_fieldnames,
+    count_items_in_csv,
+    iter_items_from_csv,
     ExistingFilePath,
+    UnexistingFilePath,
     DirPath
 )
 
 ACCEPTED_DOCS = "Inkscape (.svg), PDFLatex (.tex), XeLatex (.tex)"
 
+log = logging.getLogger(__name__)
+
 
 # declare the CLI group
 @click.group(context_settings=CONTEXT_SETTINGS)
@@ -46,10 +61,12 @@ def cli():
 @click.option('-d', '--otype', type=click.Choice(['pdf', 'png', 'svg']),
               default='pdf', show_default=True,
               help='Output file type.')
-@click.option('-c', '--command', type=click.Choice(['inkscape', 'pdflatex', 'xelatex']),
+@click.option('-c', '--command', type=click.Choice(list(BACKENDS)),
               default='inkscape', show_default=True,
-              help='The rendering command to be used in case file name '
-                   'extension is not specific.')
+              help='The preferred rendering command. The template type is given by its file '
+                   'name extension, or by this command in case the extension is not specific. '
+                   'If this command can not render the documents, the cheapest one that can '
+                   'will be used.')
 @click.option('--index', type=int, multiple=True,
               help='Index/es of the CSV file that you want to create the '
                    'document from. Note that the samples numbers start from 0 '
@@ -59,8 +76,53 @@ def cli():
               help='Output debug logs.')
 @click.option('-u', '--unicode_support', is_flag=True, default=False,
               help='Allows unicode characters to be correctly encoded in the PDF.')
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=1, show_default=True,
+              help='Number of worker processes used to render the documents.')
+@click.option('--inkscape-shell', type=click.IntRange(min=0), default=0, show_default=True,
+              help='Number of long-lived `inkscape --shell` processes per job used to '
+                   'export the documents. If 0, will call Inkscape once per document. '
+                   'Requires Inkscape >= 1.0.')
+@click.option('--inkscape-pipe', is_flag=True, default=False,
+              help='Pass the documents to Inkscape through its standard input '
+                   'instead of temporary files. Requires Inkscape >= 1.0.')
+@click.option('--static-background', is_flag=True, default=False,
+              help='Render the elements of SVG templates without template fields only once, '
+                   'and stamp the rest of each document on them. Only for PDF output.')
+@click.option('--embed-font', type=ExistingFilePath, multiple=True,
+              help='Font file (.ttf or .otf) to embed in each SVG document, with only the '
+                   'glyphs of its text if fontTools is installed. Use many of this to embed many fonts.')
+@click.option('--precompile-preamble', is_flag=True, default=False,
+              help='Compile the preamble of LaTeX templates once into a format file and '
+                   'compile only the body of each document. Requires the mylatexformat package.')
+@click.option('--chunk-size', type=click.IntRange(min=0), default=0, show_default=True,
+              help='Fill this number of documents and then render all of them at once, '
+                   'e.g., with only one Inkscape call, or as the pages of one LaTeX '
+                   'document split afterwards in one file per document. If 0, will render each '
+                   'document after filling it.')
+@click.option('--resume', is_flag=True, default=False,
+              help='Record the rendered documents in a journal in the output folder and skip the '
+                   'items whose output files have been completely rendered by a previous run '
+                   'with --resume and the same template and options.')
+@click.option('--cache', is_flag=True, default=False,
+              help='Reuse the documents rendered before with the same content and options.')
+@click.option('--template-cache', is_flag=True, default=False,
+              help='Store the compiled templates in the cache folder, so they are not '
+                   'compiled again by the next runs.')
+@click.option('--cache-dir', type=DirPath, default=get_cache_dir(), show_default=True,
+              help='Render, template and LaTeX format cache folder path.')
+@click.option('--cache-max-size', type=click.IntRange(min=1), default=1024, show_default=True,
+              help='Maximum size of the render cache folder, in MB.')
+@click.option('--command-timeout', type=click.FloatRange(min=0), default=DEFAULT_COMMAND_TIMEOUT,
+              show_default=True,
+              help='Maximum seconds of each call to a rendering command, it is killed afterwards '
+                   'and the documents are marked as failed. If 0, the calls are not limited.')
+@click.option('--report', type=UnexistingFilePath,
+              help='Write a JSON report of the run in this file path, with the time of each '
+                   'stage of each document, their p50, p95 and max, and the failures.')
 def create(input, template, field, outdir, prefix, otype, command, index,
-           dpi, verbose, unicode_support):
+           dpi, verbose, unicode_support, jobs, inkscape_shell, inkscape_pipe,
+           static_background, embed_font, precompile_preamble, chunk_size, resume, cache, template_cache,
+           cache_dir, cache_max_size, command_timeout, report):
     """Use docstamp to create documents from the content of a CSV file or
     a Google Spreadsheet.
 
@@ -69,91 +131,398 @@ def create(input, template, field, outdir, prefix, otype, command, index,
     docstamp create -i badge.csv -t badge_template.svg -o ./badges -d pdf
     """
     logging.basicConfig(level=LOGGING_LVL)
-    log = logging.getLogger(__name__)
 
     # setup verbose mode
     verbose_switch(verbose)
 
     input_file = input
     fields = field
+    n_zeros = _check_input_file(input_file, fields, index)
 
-    # init set of template contents
-    log.debug('Reading CSV elements from {}.'.format(input_file))
-    items, fieldnames = get_items_from_csv(input_file)
+    # make output folder
+    if not os.path.exists(outdir):
+        os.mkdir(outdir)
 
-    # check if got any item
-    if len(items) == 0:
-        click.echo('Quiting because found 0 items.')
+    # set output file name prefix
+    if prefix is None:
+        file_extension = get_extension(template)
+        prefix = os.path.basename(template).replace(file_extension, '')
+
+    render_options = {'file_type': otype,
+                      'dpi': dpi,
+                      'support_unicode': unicode_support}
+
+    kwargs = dict(render_options,
+                  inkscape_pipe=inkscape_pipe,
+                  static_background=static_background,
+                  embed_fonts=list(embed_font),
+                  precompile_preamble=precompile_preamble)
+    if cache:
+        kwargs['cache_dir'] = cache_dir
+        kwargs['cache_max_size'] = cache_max_size * 1024 * 1024
+
+    backend, jobs = _select_backend(template, command, jobs)
+
+    # the journal records the rendered documents to be able to resume the run,
+    # with all the options that change them, so the run is not resumed if they changed
+    journal_options = dict(render_options,
+                           command=command,
+                           backend=backend.name,
+                           inkscape_shell=bool(inkscape_shell),
+                           inkscape_pipe=inkscape_pipe,
+                           static_background=static_background,
+                           precompile_preamble=precompile_preamble,
+                           embed_fonts=[[font, file_hash(font)] for font in embed_font])
+    journal = RenderJournal(outdir, template, journal_options) if resume else NullJournal()
+
+    run_report = None
+    if report:
+        run_report = RunReport(template=template, input=input_file, command=command, file_type=otype,
+                               jobs=jobs, chunk_size=chunk_size)
+
+    render_jobs = RenderJobs(input_file, index, fields, n_zeros, outdir, prefix, otype, journal,
+                             timed=run_report is not None)
+
+    # let's stamp them!
+    log.debug('Rendering documents from the template file {} '
+              'using {} job(s).'.format(template, jobs))
+    with _worker_settings(command_timeout, cache_dir, inkscape_shell, template_cache), journal:
+        results = render_items(template, command, render_jobs, n_jobs=jobs, chunk_size=chunk_size, **kwargs)
+        n_rendered, failures = _record_results(results, render_jobs, journal, run_report)
+
+    if resume:
+        click.echo('Skipped {} documents already rendered.'.format(render_jobs.n_skipped))
+
+    click.echo('Rendered {} of {} documents.'.format(n_rendered, n_rendered + len(failures)))
+    for result in failures:
+        click.echo('Failed item {} ({}): {}'.format(result.idx, result.file_path, result.error))
+
+    if run_report is not None:
+        run_report.n_skipped = render_jobs.n_skipped
+        run_report.write(report)
+        click.echo('Wrote the run report in {}.'.format(report))
+
+    if failures:
         exit(-1)
 
+
+def _check_input_file(input_file, fields, index):
+    """ Check that the CSV file `input_file` has items, the `fields` and
+    the items with `index`.
+
+    Returns
+    -------
+    n_zeros: int
+        The number of digits of the output file names without `fields`, else None.
+    """
+    log.debug('Reading CSV elements from {}.'.format(input_file))
+    with closing(iter_items_from_csv(input_file)) as items:
+        if next(items, None) is None:
+            click.echo('Quiting because found 0 items.')
+            exit(-1)
+
+    n_zeros = None
     if not fields:
         # set the number of zeros that the files will have
-        n_zeros = int(math.floor(math.log10(len(items))) + 1)
+        n_zeros = int(math.floor(math.log10(count_items_in_csv(input_file))) + 1)
     else:
         # check that fields has all valid fields
+        fieldnames = get_csv_fieldnames(input_file)
         for field_name in fields:
             if field_name not in fieldnames:
                 raise ValueError('Field name {} not found in input file '
                                  ' header.'.format(field_name))
 
-    # filter the items if index
     if index:
-        myitems = {idx: items[idx] for idx in index}
-        items = myitems
         log.debug('Using the elements with index {} of the input '
                   'file.'.format(index))
+        missing = set(index).difference(idx for idx, _ in iter_items_from_csv(input_file, index=index))
+        if missing:
+            raise click.BadParameter('Could not find the non-empty items with index {} in the input '
+                                     'file.'.format(', '.join(str(idx) for idx in sorted(missing))),
+                                     param_hint='--index')
 
-    # make output folder
-    if not os.path.exists(outdir):
-        os.mkdir(outdir)
+    return n_zeros
 
-    # create template document model
-    log.debug('Creating the template object using the file {}.'.format(template))
-    template_doc = TextDocument.from_template_file(template, command)
-    log.debug('Created an object of type {}.'.format(type(template_doc)))
 
-    # let's stamp them!
-    for idx in items:
-        item = items[idx]
+@contextmanager
+def _worker_settings(command_timeout, cache_dir, inkscape_shell, template_cache):
+    """ Set the rendering settings of this process and its worker processes, and
+    restore them on exit, so they are not inherited by the next runs in this process.
+    """
+    with restored_settings():
+        set_command_timeout(command_timeout)
+        set_cache_dir(cache_dir)
+
+        if inkscape_shell:
+            enable_shell_mode(inkscape_shell)
+
+        if template_cache:
+            enable_bytecode_cache(os.path.join(cache_dir, 'templates'))
 
-        if not len(fields):
-            file_name = str(idx).zfill(n_zeros)
-        else:
-            field_values = []
-            try:
-                for field_name in fields:
-                    field_values.append(item[field_name].replace(' ', ''))
-            except:
-                log.exception('Could not get field {} value from'
-                              ' {}'.format(field_name, item))
-                exit(-1)
-            else:
-                file_name = '_'.join(field_values)
-
-        log.debug('Filling template {} with values of item {}.'.format(file_name, idx))
         try:
-            template_doc.fill(item)
-        except:
-            log.exception('Error filling document for {}th item'.format(idx))
-            continue
+            yield
+        finally:
+            close_shell_pools()
 
-        # set output file path
-        file_extension = get_extension(template)
-        if prefix is None:
-            basename = os.path.basename(template).replace(file_extension, '')
 
-        file_name = basename + '_' + file_name
-        file_path = os.path.join(outdir, file_name + '.' + otype)
+def _select_backend(template, command, jobs):
+    """ Return the preferred backend for `template` and the number of jobs it can use. """
+    backend = BACKENDS[TextDocument.from_template_file(template, command).backend]
+    if jobs > 1 and not backend.poolable:
+        log.warning('The {} backend can not render documents in parallel, '
+                    'using only one job.'.format(backend.name))
+        jobs = 1
+    return backend, jobs
+
+
+def _record_results(results, render_jobs, journal, run_report):
+    """ Record the render `results` in the `journal` and the `run_report`.
+
+    Returns
+    -------
+    n_rendered: int
+        The number of documents rendered.
+
+    failures: list of RenderResult
+        The results of the documents that failed.
+    """
+    n_rendered = 0
+    failures = []
+    for result in results:
+        start = time.perf_counter()
+        journal.record(result, render_jobs.item_hashes.pop(result.idx))
+        if run_report is not None:
+            timings = dict(result.timings or {}, read=render_jobs.read_times.pop(result.idx),
+                           journal=time.perf_counter() - start)
+            run_report.add_item(result.idx, result.file_path, result.success, result.error, timings)
+
+        if result.success:
+            n_rendered += 1
+        else:
+            failures.append(result)
+    return n_rendered, failures
+
+
+class RenderJobs(object):
+    """ Lazily read the items of the CSV file `input_file` and set the output file
+    path of each one, skipping the ones already rendered in the `journal`.
+    See parallel.render_items.
+
+    Parameters
+    ----------
+    input_file: str
+        Path to the CSV file.
 
-        kwargs = {'file_type': otype,
-                  'dpi': dpi,
-                  'support_unicode': unicode_support}
+    index: iterable of int
+        If given, only the rows with these indices will be read.
 
-        log.debug('Rendering file {}.'.format(file_path))
+    fields: list of str
+        The fields used to name the output files. If empty, they are numbered
+        with `n_zeros` digits.
+
+    n_zeros: int
+
+    outdir: str
+        Output folder path.
+
+    prefix: str
+        Output files prefix.
+
+    otype: str
+        Output file type.
+
+    journal: RenderJournal
+
+    timed: bool
+        Whether to keep the seconds to read each of the items being rendered.
+    """
+
+    def __init__(self, input_file, index, fields, n_zeros, outdir, prefix, otype, journal, timed=False):
+        self.input_file = input_file
+        self.index = index
+        self.fields = fields
+        self.n_zeros = n_zeros
+        self.outdir = outdir
+        self.prefix = prefix
+        self.otype = otype
+        self.journal = journal
+        self.timed = timed
+
+        # row hashes of the items being rendered, for the journal
+        self.item_hashes = {}
+        # seconds to read each of the items being rendered, for the report
+        self.read_times = {}
+        self.n_skipped = 0
+
+    def _file_name(self, idx, item):
+        if not len(self.fields):
+            return str(idx).zfill(self.n_zeros)
+
+        field_values = []
         try:
-            template_doc.render(file_path, **kwargs)
-        except:
-            log.exception('Error creating {} for {}.'.format(file_path, item))
+            for field_name in self.fields:
+                field_values.append(item[field_name].replace(' ', ''))
+        except (KeyError, AttributeError):
+            log.exception('Could not get field {} value from'
+                          ' {}'.format(field_name, item))
             exit(-1)
         else:
-            log.debug('Successfully rendered {}.'.format(file_path))
+            return '_'.join(field_values)
+
+    def __iter__(self):
+        with closing(iter_items_from_csv(self.input_file, index=self.index)) as items:
+            while True:
+                start = time.perf_counter()
+                row = next(items, None)
+                if row is None:
+                    break
+
+                idx, item = row
+                read_time = time.perf_counter() - start
+                file_name = self.prefix + '_' + self._file_name(idx, item)
+                file_path = os.path.join(self.outdir, file_name + '.' + self.otype)
+
+                item_hash = row_hash(item)
+                if self.journal.is_done(item_hash, file_path):
+                    self.n_skipped += 1
+                    continue
+
+                self.item_hashes[idx] = item_hash
+                if self.timed:
+                    self.read_times[idx] = read_time
+                yield idx, item, file_path
+
+
+@cli.command(context_settings=CONTEXT_SETTINGS)
+@click.argument('inputs', nargs=-1, required=True,
+                type=click.Path(exists=True, resolve_path=True))
+@click.option('-o', '--output', type=UnexistingFilePath, required=True,
+              help='Output PDF file path.')
+@click.option('-b', '--bookmarks', is_flag=True, default=False,
+              help='Add a bookmark to the first page of each input file, '
+                   'with its file name as title.')
+@click.option('--batch-size', type=click.IntRange(min=2), default=DEFAULT_MERGE_BATCH_SIZE,
+              show_default=True,
+              help='Maximum number of files merged at once.')
+@click.option('-j', '--jobs', type=click.IntRange(min=1), default=1, show_default=True,
+              help='Number of worker processes used to merge the batches of files.')
+@click.option('-v', '--verbose', is_flag=True,
+              help='Output debug logs.')
+def merge(inputs, output, bookmarks, batch_size, jobs, verbose):
+    """Merge PDF files in one PDF file. The folders in INPUTS are replaced
+    by the PDF files they contain, sorted by name.
+
+    Examples: \n
+    docstamp merge -o badges.pdf stamped
+    docstamp merge -o badges.pdf -b stamped/badge_001.pdf stamped/badge_002.pdf
+    """
+    logging.basicConfig(level=LOGGING_LVL)
+    log = logging.getLogger(__name__)
+
+    # setup verbose mode
+    verbose_switch(verbose)
+
+    def iter_pdf_files():
+        for path in inputs:
+            if not os.path.isdir(path):
+                yield path
+                continue
+
+            for file_name in sorted(os.listdir(path)):
+                if file_name.lower().endswith('.pdf'):
+                    yield os.path.join(path, file_name)
+
+    titles = None
+    if bookmarks:
+        titles = (os.path.splitext(os.path.basename(path))[0] for path in iter_pdf_files())
+
+    log.debug('Merging PDF files into {}.'.format(output))
+    try:
+        merge_pdfs(iter_pdf_files(), output, bookmarks=titles, batch_size=batch_size, n_jobs=jobs)
+    except ValueError as exc:
+        click.echo(str(exc))
+        exit(-1)
+
+    click.echo('Merged PDF files into {}.'.format(output))
+
+
+@cli.command(context_settings=CONTEXT_SETTINGS)
+@click.option('-i', '--input', type=ExistingFilePath, required=True,
+              help='Path to the CSV file with the data elements to be used to '
+                   'fill the template.')
+@click.option('-t', '--template', type=ExistingFilePath, required=True,
+              help='SVG template file path.')
+@click.option('-o', '--outdir', type=DirPath, default='sheets',
+              show_default=True, help='Output folder path.')
+@click.option('-p', '--prefix', type=str,
+              help='Output files prefix. Default: Template file name.')
+@click.option('-d', '--otype', type=click.Choice(['pdf', 'png', 'svg']),
+              default='pdf', show_default=True,
+              help='Output file type.')
+@click.option('-c', '--command', type=click.Choice(list(BACKENDS)),
+              default='inkscape', show_default=True,
+              help='The preferred rendering command.')
+@click.option('--paper', type=click.Choice(sorted(PAPER_SIZES)), default='a4', show_default=True,
+              help='Sheet paper size.')
+@click.option('--landscape', is_flag=True, default=False,
+              help='Use the sheets in landscape orientation.')
+@click.option('--margin', type=click.FloatRange(min=0), default=10, show_default=True,
+              help='Minimum sheet margin, in millimeters.')
+@click.option('--bleed', type=click.FloatRange(min=0), default=0, show_default=True,
+              help='Width of the template artwork beyond its cut edges, in millimeters.')
+@click.option('--crop-marks', is_flag=True, default=False,
+              help='Draw crop marks at the cut edges of the documents.')
+@click.option('--dpi', type=int, default=150, help='Output file resolution')
+@click.option('-v', '--verbose', is_flag=True,
+              help='Output debug logs.')
+@click.option('-u', '--unicode_support', is_flag=True, default=False,
+              help='Allows unicode characters to be correctly encoded in the PDF.')
+def impose(input, template, outdir, prefix, otype, command, paper, landscape, margin, bleed,
+           crop_marks, dpi, verbose, unicode_support):
+    """Fill an SVG template with the content of a CSV file and lay out
+    the documents in print sheets, rendering each sheet at once.
+
+    Examples: \n
+    docstamp impose -i badge.csv -t badge_template.svg -o sheets --paper a4 --crop-marks
+    """
+    logging.basicConfig(level=LOGGING_LVL)
+    log = logging.getLogger(__name__)
+
+    # setup verbose mode
+    verbose_switch(verbose)
+
+    document = TextDocument.from_template_file(template, command)
+    if document.input_type != 'svg':
+        raise click.BadParameter('Only SVG templates can be imposed.', param_hint='--template')
+
+    with closing(iter_items_from_csv(input)) as items:
+        first_item = next(items, None)
+    if first_item is None:
+        click.echo('Quiting because found 0 items.')
+        exit(-1)
+
+    layout = SheetLayout(*svg_size(document.fill(first_item[1])), paper=paper, landscape=landscape,
+                         margin=margin, bleed=bleed, crop_marks=crop_marks)
+    log.debug('Laying out {} documents per sheet.'.format(layout.per_sheet))
+
+    if not os.path.exists(outdir):
+        os.mkdir(outdir)
+
+    if prefix is None:
+        prefix = os.path.basename(template).replace(get_extension(template), '')
+
+    n_sheets = int(math.ceil(count_items_in_csv(input) / layout.per_sheet))
+    n_zeros = int(math.floor(math.log10(n_sheets)) + 1)
+
+    def iter_filled():
+        for _, item in iter_items_from_csv(input):
+            yield document.fill(item)
+
+    for sheet_idx, sheet_content in enumerate(iter_sheets(iter_filled(), layout)):
+        file_path = os.path.join(outdir, '{}_sheet_{}.{}'.format(prefix, str(sheet_idx).zfill(n_zeros), otype))
+        log.debug('Rendering sheet {}.'.format(file_path))
+        render_sheet(sheet_content, file_path, file_type=otype, dpi=dpi,
+                     support_unicode=unicode_support, backend=document.backend)
+
+    click.echo('Rendered {} sheets of {} documents.'.format(n_sheets, layout.per_sheet))
@@ -3,14 +3,11 @@
 Utilities for the CLI functions.
 """
 import re
-import json
 import logging
 from csv import DictReader
 
 import click
 
-from docstamp.model import json_to_dict
-
 # different context options
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 UNKNOWN_OPTIONS = dict(allow_extra_args=True,
@@ -49,20 +46,55 @@ def echo_list(alist):
         click.echo(i)
 
 
-def get_items_from_csv(csv_filepath):
-    # CSV to JSON
-    # one JSON object for each item
-    items = {}
+def get_csv_fieldnames(csv_filepath):
+    """ Return the field names in the header of the CSV file. """
+    with open(str(csv_filepath), 'r') as csvfile:
+        return DictReader(csvfile).fieldnames
+
+
+def iter_items_from_csv(csv_filepath, index=None):
+    """ Lazily read the non-empty rows of the CSV file.
+
+    Parameters
+    ----------
+    csv_filepath: str
+        Path to the CSV file.
+
+    index: iterable of int
+        If given, only the rows with these indices will be read.
+
+    Returns
+    -------
+    items: generator of (int, dict)
+        The index of the row in the file (the empty rows also count) and its values.
+    """
+    if index:
+        index = set(index)
+        last_idx = max(index)
+
     with open(str(csv_filepath), 'r') as csvfile:
+        for idx, row in enumerate(DictReader(csvfile)):
+            if index:
+                if idx > last_idx:
+                    break
+                if idx not in index:
+                    continue
 
-        reader = DictReader(csvfile)
+            if any(value != '' for value in row.values()):
+                yield idx, row
 
-        for idx, row in enumerate(reader):
-            item = json_to_dict(json.dumps(row))
-            if any([item[i] != '' for i in item]):
-                items[idx] = item
 
-    return items, reader.fieldnames
+def count_items_in_csv(csv_filepath):
+    """ Return the number of non-empty rows of the CSV file. """
+    return sum(1 for _ in iter_items_from_csv(csv_filepath))
+
+
+def get_items_from_csv(csv_filepath):
+    """ Return a dict with the non-empty rows of the CSV file by row index
+    and the field names of the file. See iter_items_from_csv.
+    """
+    items = dict(iter_items_from_csv(csv_filepath))
+    return items, get_csv_fieldnames(csv_filepath)
 
 
 def verbose_switch(verbose=False):
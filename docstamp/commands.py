@@ -10,16 +10,67 @@
 
 import os
 import sys
+import shlex
 import shutil
+import asyncio
 import logging
 import subprocess
-from subprocess import CalledProcessError
+from collections import namedtuple
+
+from docstamp.timing import stage
 
 log = logging.getLogger(__name__)
 
+# environment variable with the maximum seconds of each command call, 0 for no limit.
+# Set it with `set_command_timeout`, it is inherited by the worker processes.
+COMMAND_TIMEOUT_ENV = 'DOCSTAMP_COMMAND_TIMEOUT'
+
+DEFAULT_COMMAND_TIMEOUT = 600
+
+# number of characters of the output of a failed command written in the log.
+OUTPUT_LOG_LENGTH = 2000
+
+# the standard output and error are bytes, `returncode` is None if the command timed out.
+CommandResult = namedtuple('CommandResult', ['args', 'returncode', 'stdout', 'stderr'])
+
+
+class CommandError(Exception):
+    """ Raised when a command fails. The `result` attribute has its output. """
+
+    def __init__(self, message, result=None):
+        # all the arguments are in `args`, so it can be pickled to the parent process
+        super(CommandError, self).__init__(message, result)
+        self.result = result
+
+    def __str__(self):
+        return str(self.args[0])
+
+
+class CommandTimeoutError(CommandError, TimeoutError):
+    """ Raised when a command does not finish in time, it is killed. """
+    pass
+
+
+def get_command_timeout():
+    """ Return the maximum seconds of each command call, None for no limit.
+    See COMMAND_TIMEOUT_ENV.
+    """
+    timeout = float(os.environ.get(COMMAND_TIMEOUT_ENV, DEFAULT_COMMAND_TIMEOUT) or 0)
+    return timeout if timeout > 0 else None
+
+
+def set_command_timeout(seconds):
+    """ Set the maximum seconds of each command call in this process and in its
+    child processes. If 0 or None, the commands are not limited.
+    """
+    os.environ[COMMAND_TIMEOUT_ENV] = str(seconds or 0)
+
 
 def simple_call(cmd_args):
-    return subprocess.call(' '.join(cmd_args), shell=True)
+    """ Call the command in the argument list `cmd_args` and return its return code.
+    See run_command.
+    """
+    return run_command(cmd_args).returncode
 
 
 def is_exe(fpath):
@@ -73,7 +124,7 @@ def check_command(cmd_name):
         raise FileNotFoundError('Could not find command named {}.'.format(cmd_name))
 
 
-def call_command(cmd_name, args_strings):
+def call_command(cmd_name, args_strings, stdin_content=None, timeout=None, check=False):
     """Call CLI command with arguments and returns its return value.
 
     Parameters
@@ -82,28 +133,159 @@ def call_command(cmd_name, args_strings):
         Command name or full path to the binary file.
 
     arg_strings: List[str]
-        Argument strings list.
+        Argument list, each one is passed as it is, without shell quoting.
+
+    stdin_content: bytes
+        If given, this content will be written to the command standard input.
+
+    timeout: float
+        Maximum seconds to wait for the command. Default: get_command_timeout()
+
+    check: bool
+        Whether to raise a CommandError if the command fails.
+        Otherwise its output is logged.
 
     Returns
     -------
     return_value
         Command return value.
     """
-    if not os.path.isabs(cmd_name):
-        cmd_fullpath = which(cmd_name)
-    else:
-        cmd_fullpath = cmd_name
+    return run_command([cmd_name] + list(args_strings), stdin_content=stdin_content,
+                       timeout=timeout, check=check).returncode
+
+
+def _command_args(cmd_args):
+    cmd_args = [str(arg) for arg in cmd_args]
+    if not os.path.isabs(cmd_args[0]):
+        cmd_args[0] = which(cmd_args[0]) or cmd_args[0]
+    return cmd_args
+
+
+def _command_line(cmd_args):
+    return ' '.join(shlex.quote(arg) for arg in cmd_args)
+
+
+def _check_result(result, check):
+    if result.returncode == 0:
+        return result
+
+    # some commands, e.g., pdflatex, write their errors in the standard output
+    output = (result.stderr or result.stdout or b'').decode('utf-8', errors='replace')[-OUTPUT_LOG_LENGTH:]
+    message = 'Command `{}` exited with code {}.'.format(_command_line(result.args), result.returncode)
+    if check:
+        raise CommandError('{} {}'.format(message, output).strip(), result)
+
+    log.warning('{} Output:\n{}'.format(message, output))
+    return result
+
+
+def run_command(cmd_args, stdin_content=None, timeout=None, check=False, cwd=None):
+    """ Call the command in the argument list `cmd_args`, without a shell,
+    and capture its standard output and error.
+
+    Parameters
+    ----------
+    cmd_args: list of str
+        The command name or full path to the binary file, and its arguments.
+        The arguments are passed as they are, so they need no quoting.
+
+    stdin_content: bytes
+        If given, this content will be written to the command standard input.
+
+    timeout: float
+        Maximum seconds to wait for the command, it is killed afterwards.
+        Default: get_command_timeout()
+
+    check: bool
+        Whether to raise a CommandError if the command fails.
+        Otherwise its output is logged.
+
+    cwd: str
+        Working folder of the command.
+
+    Returns
+    -------
+    result: CommandResult
 
+    Raises
+    ------
+    CommandTimeoutError
+        If the command does not finish in time.
+    """
+    cmd_args = _command_args(cmd_args)
+    if timeout is None:
+        timeout = get_command_timeout()
+
+    kwargs = {'input': stdin_content} if stdin_content is not None else {'stdin': subprocess.DEVNULL}
+
+    log.debug('Calling: `{}`.'.format(_command_line(cmd_args)))
+    with stage('command'):
+        try:
+            proc = subprocess.run(cmd_args, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                  timeout=timeout, cwd=cwd, **kwargs)
+        except subprocess.TimeoutExpired as exc:
+            raise CommandTimeoutError('Command `{}` did not finish in {} seconds.'.format(
+                _command_line(cmd_args), timeout), CommandResult(cmd_args, None, exc.stdout, exc.stderr)) from exc
+
+    return _check_result(CommandResult(cmd_args, proc.returncode, proc.stdout, proc.stderr), check)
+
+
+async def run_command_async(cmd_args, stdin_content=None, timeout=None, check=False, cwd=None):
+    """ Coroutine version of run_command. """
+    cmd_args = _command_args(cmd_args)
+    if timeout is None:
+        timeout = get_command_timeout()
+
+    log.debug('Calling: `{}`.'.format(_command_line(cmd_args)))
+    proc = await asyncio.create_subprocess_exec(
+        *cmd_args, cwd=cwd,
+        stdin=subprocess.PIPE if stdin_content is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
     try:
-        cmd_line = [cmd_fullpath] + args_strings
-        log.debug('Calling: `{}`.'.format(' '.join(cmd_line)))
-        # retval = subprocess.check_call(cmd_line)
-        retval = subprocess.call(' '.join(cmd_line), shell=True)
-    except CalledProcessError as ce:
-        log.exception(
-            "Error calling command with arguments: "
-            "{} \n With return code: {}".format(cmd_line, ce.returncode)
-        )
-        raise
-    else:
-        return retval
+        stdout, stderr = await asyncio.wait_for(proc.communicate(stdin_content), timeout)
+    except asyncio.TimeoutError as exc:
+        proc.kill()
+        await proc.wait()
+        raise CommandTimeoutError('Command `{}` did not finish in {} seconds.'.format(
+            _command_line(cmd_args), timeout), CommandResult(cmd_args, None, None, None)) from exc
+
+    return _check_result(CommandResult(cmd_args, proc.returncode, stdout, stderr), check)
+
+
+async def run_commands_async(commands, max_concurrency=4, timeout=None, check=False):
+    """ Coroutine version of run_commands. """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(cmd_args):
+        async with semaphore:
+            return await run_command_async(cmd_args, timeout=timeout, check=check)
+
+    return await asyncio.gather(*(run(cmd_args) for cmd_args in commands), return_exceptions=True)
+
+
+def run_commands(commands, max_concurrency=4, timeout=None, check=False):
+    """ Call many commands, at most `max_concurrency` of them at the same time.
+    See run_command.
+
+    Parameters
+    ----------
+    commands: list of list of str
+        The argument list of each command.
+
+    max_concurrency: int
+        Maximum number of commands running at the same time.
+
+    Returns
+    -------
+    results: list of CommandResult or Exception
+        In the same order as `commands`. The exceptions raised by the calls, e.g.,
+        CommandTimeoutError, are returned in their place, so one failed command
+        does not stop the others.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        with stage('command'):
+            return loop.run_until_complete(run_commands_async(commands, max_concurrency=max_concurrency,
+                                                              timeout=timeout, check=check))
+    finally:
+        loop.close()
@@ -11,6 +11,7 @@
 import os
 import re
 import logging
+from contextlib import contextmanager
 from sys import platform as _platform
 
 from docstamp.commands import which, is_exe
@@ -18,6 +19,12 @@ from docstamp.commands import which, is_exe
 LOGGING_LVL = logging.INFO
 logging.basicConfig(level=LOGGING_LVL)
 
+# environment variable with the docstamp cache folder path, see get_cache_dir.
+CACHE_DIR_ENV = 'DOCSTAMP_CACHE_DIR'
+
+# prefix of the environment variables with the docstamp settings inherited by the child processes.
+SETTINGS_ENV_PREFIX = 'DOCSTAMP_'
+
 
 def find_file_match(folder_path, regex=''):
     """
@@ -76,6 +83,43 @@ def get_temp_dir():
         return None
 
 
+def get_cache_dir():
+    """ Return the docstamp cache folder path.
+    Set the `DOCSTAMP_CACHE_DIR` environment variable to change it, see set_cache_dir.
+    """
+    if CACHE_DIR_ENV in os.environ:
+        return os.environ[CACHE_DIR_ENV]
+
+    if _platform == "win32":
+        cache_root = os.environ.get('LOCALAPPDATA', os.path.expanduser('~'))
+    else:
+        cache_root = os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache'))
+
+    return os.path.join(cache_root, 'docstamp')
+
+
+def set_cache_dir(cache_dir):
+    """ Set the docstamp cache folder path in this process and in its child processes,
+    e.g., for the LaTeX format files of `pdflatex.make_format`.
+    """
+    os.environ[CACHE_DIR_ENV] = cache_dir
+
+
+@contextmanager
+def restored_settings():
+    """ Restore the docstamp settings in the environment variables, e.g., the ones
+    of `set_cache_dir`, to their values before entering the context.
+    """
+    saved = {name: value for name, value in os.environ.items() if name.startswith(SETTINGS_ENV_PREFIX)}
+    try:
+        yield
+    finally:
+        for name in [name for name in os.environ if name.startswith(SETTINGS_ENV_PREFIX)]:
+            if name not in saved:
+                del os.environ[name]
+        os.environ.update(saved)
+
+
 def find_in_other_programs_folders(app_name):
     app_name_regex = '^' + app_name + '$'
     other_folders = get_other_program_folders()
@@ -9,11 +9,14 @@
 # -------------------------------------------------------------------------------
 
 import os
+import shutil
+import hashlib
 import tempfile
 import logging
 from glob import glob
 
 from docstamp.config import get_temp_dir
+from docstamp.timing import stage
 
 log = logging.getLogger(__name__)
 
@@ -115,6 +118,62 @@ def get_tempfile(suffix='.txt', dirpath=None):
     return tempfile.NamedTemporaryFile(suffix=suffix, dir=dirpath)
 
 
+def get_tempdir(dirpath=None):
+    """ Return a temporary folder within dirpath, removed with all its content
+    when closed or when used as a context manager.
+    If dirpath is None, will look for a temporary folder in your system.
+
+    Parameters
+    ----------
+    dirpath: str
+        Folder path where create the temporary folder
+
+    Returns
+    -------
+    temp_dir: tempfile.TemporaryDirectory
+        The temporary folder, its path is in `temp_dir.name`.
+    """
+    if dirpath is None:
+        dirpath = get_temp_dir()
+
+    return tempfile.TemporaryDirectory(dir=dirpath)
+
+
+def move_file(src, dst):
+    """ Move the file `src` to `dst` atomically, `dst` is either
+    the previous file or the complete new one, even between file systems.
+
+    Parameters
+    ----------
+    src: str
+        Path to the file to move.
+
+    dst: str
+        Destination file path.
+    """
+    with stage('move'):
+        _move_file(src, dst)
+
+
+def _move_file(src, dst):
+    try:
+        os.replace(src, dst)
+        return
+    except OSError:
+        log.debug('Could not rename {} to {}, copying it.'.format(src, dst))
+
+    # copy it next to the destination and rename it there
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(dst)))
+    os.close(fd)
+    try:
+        shutil.copyfile(src, temp_path)
+        os.replace(temp_path, dst)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    os.remove(src)
+
+
 def cleanup(workdir, extension):
     """ Remove the files in workdir that have the given extension.
 
@@ -177,24 +236,32 @@ def write_to_file(file_path, content, encoding=None):
     file_path: str
         Path to the output file. Will be overwritten if exists.
 
-    content: str
+    content: str or bytes
         The content you want in the file.
 
     encoding: str
-        The name of the encoding.
+        The name of the encoding, if `content` is a `str`.
     """
     try:
-        # TODO: check if in Python2 this should be this way
-        # it's possible that we have to make this function more complex
-        # to check type(content) and depending on that set 'w' without enconde
-        # or 'wb' with encode.
-        with open(file_path, "wb") as f:
-            f.write(content.encode(encoding))
+        if isinstance(content, str):
+            content = content.encode(encoding)
+
+        with stage('write'), open(file_path, "wb") as f:
+            f.write(content)
     except:
         log.exception('Error writing to file in {}'.format(file_path))
         raise
 
 
+def file_hash(file_path, block_size=65536):
+    """ Return the SHA-256 hex digest of the content of `file_path`. """
+    sha = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
 def replace_file_content(filepath, old, new, max=1):
     """ Modify the content of `filepath`, replacing `old` for `new`.
 
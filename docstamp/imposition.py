@@ -0,0 +1,278 @@
+"""
+Function helpers to lay out many filled SVG documents on print sheets,
+so each sheet is rendered with only one call to the rendering backend.
+
+All the lengths are in millimeters.
+"""
+import re
+import logging
+
+from lxml import etree
+
+from docstamp.backends import export_content
+
+log = logging.getLogger(__name__)
+
+SVG_NAMESPACE = 'http://www.w3.org/2000/svg'
+
+# paper sizes (width, height) in portrait orientation.
+PAPER_SIZES = {
+    'a5': (148, 210),
+    'a4': (210, 297),
+    'a3': (297, 420),
+    'letter': (215.9, 279.4),
+    'legal': (215.9, 355.6),
+    'tabloid': (279.4, 431.8),
+}
+
+# millimeters per unit of the SVG lengths, the user units are CSS pixels at 96 dpi.
+UNITS_MM = {
+    '': 25.4 / 96,
+    'px': 25.4 / 96,
+    'pt': 25.4 / 72,
+    'pc': 25.4 / 6,
+    'in': 25.4,
+    'cm': 10,
+    'mm': 1,
+}
+
+# distance from the cut edge of the documents to the crop marks, and their length.
+CROP_MARK_OFFSET = 2
+CROP_MARK_LENGTH = 5
+CROP_MARK_WIDTH = 0.25
+
+_length_regex = re.compile(r'^\s*([0-9.eE+-]+)\s*([a-z]*)\s*$')
+
+
+def svg_length_mm(length):
+    """ Return the SVG `length` string, e.g., '85mm' or '300', in millimeters.
+
+    Raises
+    ------
+    ValueError
+        If the length is a percentage or has an unknown unit.
+    """
+    match = _length_regex.match(length)
+    if match is None or match.group(2) not in UNITS_MM:
+        raise ValueError('Can not convert the SVG length {} to millimeters.'.format(length))
+
+    value, unit = match.groups()
+    return float(value) * UNITS_MM[unit]
+
+
+def _svg_root(svg_content):
+    if isinstance(svg_content, str):
+        svg_content = svg_content.encode('utf-8')
+    return etree.fromstring(svg_content)
+
+
+def svg_size(svg_content):
+    """ Return the width and height of the SVG document in `svg_content`, in millimeters.
+
+    Parameters
+    ----------
+    svg_content: str
+
+    Returns
+    -------
+    width: float
+
+    height: float
+    """
+    root = _svg_root(svg_content)
+    width, height = root.get('width'), root.get('height')
+    if width is None or height is None:
+        raise ValueError('The SVG document must have a width and a height to impose it.')
+
+    return svg_length_mm(width), svg_length_mm(height)
+
+
+class SheetLayout(object):
+    """ Grid of documents of the same size on a print sheet.
+
+    Parameters
+    ----------
+    item_width: float
+        Width of each document, including the bleed.
+
+    item_height: float
+        Height of each document, including the bleed.
+
+    paper: str
+        Sheet paper size, see PAPER_SIZES.
+
+    landscape: bool
+        Whether to use the sheet in landscape orientation.
+
+    margin: float
+        Minimum space between the border of the sheet and the documents.
+
+    bleed: float
+        Width of the artwork beyond the cut edge on each side of the documents,
+        included in the documents size.
+
+    crop_marks: bool
+        Whether to draw crop marks at the cut edges of the documents, in the sheet margins.
+    """
+
+    def __init__(self, item_width, item_height, paper='a4', landscape=False, margin=10, bleed=0,
+                 crop_marks=False):
+        try:
+            self.paper_width, self.paper_height = PAPER_SIZES[paper.lower()]
+        except KeyError:
+            raise ValueError('Unknown paper size {}, choose one of {}.'.format(paper, list(PAPER_SIZES)))
+
+        if landscape:
+            self.paper_width, self.paper_height = self.paper_height, self.paper_width
+
+        if bleed * 2 >= min(item_width, item_height):
+            raise ValueError('The bleed {} is too large for documents of {}x{}.'.format(
+                bleed, item_width, item_height))
+
+        self.item_width = item_width
+        self.item_height = item_height
+        self.margin = margin
+        self.bleed = bleed
+        self.crop_marks = crop_marks
+
+        self.columns = int((self.paper_width - 2 * margin) // item_width)
+        self.rows = int((self.paper_height - 2 * margin) // item_height)
+        if self.columns < 1 or self.rows < 1:
+            raise ValueError('Documents of {}x{} do not fit in {} paper with margin {}.'.format(
+                item_width, item_height, paper, margin))
+
+        # center the grid in the sheet
+        self.left = (self.paper_width - self.columns * item_width) / 2
+        self.top = (self.paper_height - self.rows * item_height) / 2
+
+    @property
+    def per_sheet(self):
+        """ Number of documents in each sheet. """
+        return self.columns * self.rows
+
+    def positions(self):
+        """ Return the (x, y) position of the top-left corner of each document in a sheet,
+        row by row.
+        """
+        return [(self.left + column * self.item_width, self.top + row * self.item_height)
+                for row in range(self.rows) for column in range(self.columns)]
+
+    def crop_mark_lines(self):
+        """ Return the (x1, y1, x2, y2) coordinates of the crop marks. """
+        right = self.left + self.columns * self.item_width
+        bottom = self.top + self.rows * self.item_height
+
+        cut_xs = [self.left + column * self.item_width + edge
+                  for column in range(self.columns)
+                  for edge in (self.bleed, self.item_width - self.bleed)]
+        cut_ys = [self.top + row * self.item_height + edge
+                  for row in range(self.rows)
+                  for edge in (self.bleed, self.item_height - self.bleed)]
+
+        lines = []
+        length = min(CROP_MARK_LENGTH, self.top - CROP_MARK_OFFSET)
+        if length > 0:
+            for x in cut_xs:
+                lines.append((x, self.top - CROP_MARK_OFFSET - length, x, self.top - CROP_MARK_OFFSET))
+                lines.append((x, bottom + CROP_MARK_OFFSET, x, bottom + CROP_MARK_OFFSET + length))
+
+        length = min(CROP_MARK_LENGTH, self.left - CROP_MARK_OFFSET)
+        if length > 0:
+            for y in cut_ys:
+                lines.append((self.left - CROP_MARK_OFFSET - length, y, self.left - CROP_MARK_OFFSET, y))
+                lines.append((right + CROP_MARK_OFFSET, y, right + CROP_MARK_OFFSET + length, y))
+
+        return lines
+
+
+def _fmt(value):
+    return '{:.3f}'.format(value).rstrip('0').rstrip('.')
+
+
+def impose_svg(svg_contents, layout):
+    """ Place the SVG documents in `svg_contents` on one sheet.
+
+    Each document is nested in the sheet as an `svg` element, keeping its own
+    coordinate system. Note that the `id`s of the documents are not renamed,
+    the references to them are resolved to the first document with that `id`.
+
+    Parameters
+    ----------
+    svg_contents: list of str
+        The content of the filled SVG documents, at most `layout.per_sheet`.
+
+    layout: SheetLayout
+
+    Returns
+    -------
+    sheet_content: str
+        The SVG content of the sheet.
+    """
+    if len(svg_contents) > layout.per_sheet:
+        raise ValueError('Got {} documents for a sheet of {}.'.format(len(svg_contents), layout.per_sheet))
+
+    sheet = etree.Element('{%s}svg' % SVG_NAMESPACE, nsmap={None: SVG_NAMESPACE})
+    sheet.set('version', '1.1')
+    sheet.set('width', '{}mm'.format(_fmt(layout.paper_width)))
+    sheet.set('height', '{}mm'.format(_fmt(layout.paper_height)))
+    sheet.set('viewBox', '0 0 {} {}'.format(_fmt(layout.paper_width), _fmt(layout.paper_height)))
+
+    for svg_content, (x, y) in zip(svg_contents, layout.positions()):
+        item = _svg_root(svg_content)
+        if item.get('viewBox') is None:
+            # without a viewBox the document user units are pixels
+            item.set('viewBox', '0 0 {} {}'.format(
+                _fmt(svg_length_mm(item.get('width')) / UNITS_MM['px']),
+                _fmt(svg_length_mm(item.get('height')) / UNITS_MM['px'])))
+
+        item.set('x', _fmt(x))
+        item.set('y', _fmt(y))
+        item.set('width', _fmt(layout.item_width))
+        item.set('height', _fmt(layout.item_height))
+        sheet.append(item)
+
+    if layout.crop_marks:
+        marks = etree.SubElement(sheet, '{%s}g' % SVG_NAMESPACE)
+        marks.set('id', 'docstamp-crop-marks')
+        marks.set('style', 'fill:none;stroke:#000000;stroke-width:{}'.format(CROP_MARK_WIDTH))
+        for x1, y1, x2, y2 in layout.crop_mark_lines():
+            line = etree.SubElement(marks, '{%s}line' % SVG_NAMESPACE)
+            line.set('x1', _fmt(x1))
+            line.set('y1', _fmt(y1))
+            line.set('x2', _fmt(x2))
+            line.set('y2', _fmt(y2))
+
+    return etree.tostring(sheet, encoding='unicode')
+
+
+def iter_sheets(svg_contents, layout):
+    """ Lay out the SVG documents in `svg_contents` on as many sheets as needed.
+
+    Parameters
+    ----------
+    svg_contents: iterable of str
+        It is read lazily, so it can be a generator.
+
+    layout: SheetLayout
+
+    Returns
+    -------
+    sheet_contents: generator of str
+    """
+    batch = []
+    for svg_content in svg_contents:
+        batch.append(svg_content)
+        if len(batch) == layout.per_sheet:
+            yield impose_svg(batch, layout)
+            batch = []
+
+    if batch:
+        yield impose_svg(batch, layout)
+
+
+def render_sheet(sheet_content, file_path, file_type='pdf', dpi=150, support_unicode=False, backend=None):
+    """ Render the SVG `sheet_content` into `file_path` with one call to the
+    `backend` or to the cheapest capable backend. See backends.export_content.
+    """
+    export_content(sheet_content, file_path, 'svg', file_type=file_type, dpi=dpi,
+                   support_unicode=support_unicode, preferred=backend)
@@ -12,13 +12,20 @@ import os
 import logging
 
 from docstamp.config import get_inkscape_binpath
-from docstamp.commands import call_command
+from docstamp.commands import call_command, run_commands
 from docstamp.svg_utils import rsvg_export
+from docstamp.inkscape_shell import get_shell_pool, export_actions
 
 log = logging.getLogger(__name__)
 
+# output file type of each Inkscape export flag
+EXPORT_FLAG_TYPES = {'-A': 'pdf',
+                     '--export-pdf': 'pdf',
+                     '-e': 'png',
+                     '--export-png': 'png'}
 
-def call_inkscape(args_strings, inkscape_binpath=None):
+
+def call_inkscape(args_strings, inkscape_binpath=None, stdin_content=None, check=False):
     """Call inkscape CLI with arguments and returns its return value.
 
     Parameters
@@ -27,11 +34,22 @@ def call_inkscape(args_strings, inkscape_binpath=None):
 
     inkscape_binpath: str
 
+    stdin_content: bytes
+        If given, this content will be written to the Inkscape standard input.
+
+    check: bool
+        Whether to raise a CommandError if Inkscape fails.
+
     Returns
     -------
     return_value
         Inkscape command CLI call return value.
     """
+    return call_command(_inkscape_binpath(inkscape_binpath), args_strings, stdin_content=stdin_content,
+                        check=check)
+
+
+def _inkscape_binpath(inkscape_binpath=None):
     log.debug('Looking for the binary file for inkscape.')
 
     if inkscape_binpath is None:
@@ -42,7 +60,7 @@ def call_inkscape(args_strings, inkscape_binpath=None):
             'Inkscape binary has not been found. Please check configuration.'
         )
 
-    return call_command(inkscape_binpath, args_strings)
+    return inkscape_binpath
 
 
 def inkscape_export(input_file, output_file, export_flag="-A", dpi=90, inkscape_binpath=None):
@@ -66,22 +84,135 @@ def inkscape_export(input_file, output_file, export_flag="-A", dpi=90, inkscape_
     return_value
         Command call return value
 
+    Raises
+    ------
+    CommandError
+        If Inkscape fails.
+
+    Notes
+    -----
+    If the Inkscape shell mode is enabled (see `inkscape_shell.enable_shell_mode`),
+    the export will be done by a long-lived Inkscape process.
     """
     if not os.path.exists(input_file):
         log.error('File {} not found.'.format(input_file))
         raise IOError((0, 'File not found.', input_file))
 
-    if '=' not in export_flag:
-        export_flag += ' '
+    shell_pool = get_shell_pool() if inkscape_binpath is None else None
+    if shell_pool is not None:
+        export_type = EXPORT_FLAG_TYPES[export_flag.rstrip('=')]
+        return shell_pool.export(input_file, output_file, export_type=export_type, dpi=dpi)
 
     arg_strings = []
     arg_strings += ['--without-gui']
     arg_strings += ['--export-text-to-path']
-    arg_strings += ['{}"{}"'.format(export_flag, output_file)]
+    if export_flag.endswith('='):
+        arg_strings += [export_flag + output_file]
+    else:
+        arg_strings += [export_flag, output_file]
     arg_strings += ['--export-dpi={}'.format(dpi)]
-    arg_strings += ['"{}"'.format(input_file)]
+    arg_strings += [input_file]
 
-    return call_inkscape(arg_strings, inkscape_binpath=inkscape_binpath)
+    return call_inkscape(arg_strings, inkscape_binpath=inkscape_binpath, check=True)
+
+
+def inkscape_pipe_export(svg_content, output_file, export_type='pdf', dpi=90, inkscape_binpath=None):
+    """ Call Inkscape to export the SVG content to output_file, passing
+    the content through the Inkscape standard input.
+    Requires Inkscape >= 1.0.
+
+    Parameters
+    ----------
+    svg_content: str
+        SVG document content.
+
+    output_file: str
+        Path to the output file
+
+    export_type: str
+        Output file type, e.g., 'pdf' or 'png'.
+
+    dpi: int
+        Dots-per-inch of the output file.
+
+    Returns
+    -------
+    return_value
+        Command call return value
+
+    Raises
+    ------
+    CommandError
+        If Inkscape fails.
+    """
+    arg_strings = []
+    arg_strings += ['--pipe']
+    arg_strings += ['--export-text-to-path']
+    arg_strings += ['--export-type={}'.format(export_type)]
+    arg_strings += ['--export-filename={}'.format(output_file)]
+    arg_strings += ['--export-dpi={}'.format(dpi)]
+
+    return call_inkscape(arg_strings, inkscape_binpath=inkscape_binpath,
+                         stdin_content=svg_content.encode('utf-8'), check=True)
+
+
+def inkscape_export_batch(jobs, chunk_size=50, inkscape_binpath=None, max_concurrency=1):
+    """ Call Inkscape to export many files, each call exporting a chunk of
+    `chunk_size` files using the Inkscape 1.x `--actions` option.
+    A failed or timed out call does not stop the others.
+
+    Parameters
+    ----------
+    jobs: list of (str, str, str, int)
+        Tuples with the input file path, the output file path,
+        the output file type (e.g., 'pdf' or 'png') and the dpi.
+
+    chunk_size: int
+        Maximum number of files exported by each Inkscape call.
+
+    inkscape_binpath: str
+
+    max_concurrency: int
+        Maximum number of Inkscape calls running at the same time.
+
+    Returns
+    -------
+    exported: list of bool
+        Whether each output file of `jobs` has been created.
+
+    Raises
+    ------
+    ValueError
+        If a path has a character that separates the Inkscape actions, see export_actions.
+    """
+    for input_file, _, _, _ in jobs:
+        if not os.path.exists(input_file):
+            log.error('File {} not found.'.format(input_file))
+            raise IOError((0, 'File not found.', input_file))
+
+    inkscape_binpath = _inkscape_binpath(inkscape_binpath)
+
+    # check all the paths before removing any previous output file
+    job_actions = [export_actions(input_file, output_file, export_type=export_type, dpi=dpi)
+                   for input_file, output_file, export_type, dpi in jobs]
+
+    commands = []
+    for start in range(0, len(jobs), chunk_size):
+        actions = []
+        for (_, output_file, _, _), file_actions in zip(jobs[start:start + chunk_size],
+                                                        job_actions[start:start + chunk_size]):
+            if os.path.exists(output_file):
+                os.remove(output_file)
+            actions += file_actions
+
+        commands.append([inkscape_binpath, '--actions={}'.format(';'.join(actions))])
+
+    log.debug('Exporting {} files with {} Inkscape calls.'.format(len(jobs), len(commands)))
+    for result in run_commands(commands, max_concurrency=max_concurrency):
+        if isinstance(result, Exception):
+            log.error('Error calling Inkscape: {}'.format(result))
+
+    return [os.path.exists(output_file) for _, output_file, _, _ in jobs]
 
 
 def svg2pdf(svg_file_path, pdf_file_path, dpi=150, command_binpath=None, support_unicode=False):
@@ -0,0 +1,302 @@
+# coding=utf-8
+"""
+Keep a pool of long-lived `inkscape --shell` processes to export files
+without paying the Inkscape startup cost for every document.
+
+The shell commands use the Inkscape 1.x actions syntax.
+"""
+import os
+import queue
+import atexit
+import logging
+import threading
+import subprocess
+
+from docstamp.config import get_inkscape_binpath
+from docstamp.commands import get_command_timeout
+from docstamp.timing import stage
+
+log = logging.getLogger(__name__)
+
+# environment variable with the number of shell processes per docstamp process.
+# Set it to a positive number to make `inkscape_export` use the shell pool,
+# it is inherited by the `docstamp create --jobs` worker processes.
+INKSCAPE_SHELL_ENV = 'DOCSTAMP_INKSCAPE_SHELL'
+
+_SHELL_POOLS = {}
+
+
+def export_actions(input_file, output_file, export_type='pdf', dpi=90, text_to_path=True):
+    """ Return the list of Inkscape 1.x actions to export `input_file` to `output_file`.
+
+    Parameters
+    ----------
+    input_file: str
+        Path to the input file
+
+    output_file: str
+        Path to the output file
+
+    export_type: str
+        Output file type, e.g., 'pdf' or 'png'.
+
+    dpi: int
+        Dots-per-inch of the output file.
+
+    text_to_path: bool
+        Whether to convert the texts to paths.
+
+    Returns
+    -------
+    actions: list of str
+
+    Raises
+    ------
+    ValueError
+        If a path has a character that separates the actions, e.g., ';'.
+    """
+    for path in (input_file, output_file):
+        # Inkscape has no way to escape them
+        if ';' in path or '\n' in path:
+            raise ValueError('Inkscape can not export files with ";" or line breaks in their '
+                             'paths, got {!r}.'.format(path))
+
+    actions = ['file-open:{}'.format(os.path.abspath(input_file)),
+               'export-filename:{}'.format(os.path.abspath(output_file)),
+               'export-type:{}'.format(export_type),
+               'export-dpi:{}'.format(dpi)]
+    if text_to_path:
+        actions += ['export-text-to-path']
+    actions += ['export-do', 'file-close']
+    return actions
+
+
+class InkscapeShellError(Exception):
+    pass
+
+
+class InkscapeShell(object):
+    """ A long-lived `inkscape --shell` process.
+
+    Parameters
+    ----------
+    inkscape_binpath: str
+        Path to the Inkscape binary file.
+
+    timeout: float
+        Seconds to wait for the answer of each command, None for no limit.
+        Default: commands.get_command_timeout()
+    """
+    prompt = b'> '
+
+    def __init__(self, inkscape_binpath, timeout=None):
+        self.inkscape_binpath = inkscape_binpath
+        self.timeout = timeout if timeout is not None else get_command_timeout()
+        self._proc = None
+        self._output = None
+        self.start()
+
+    def start(self):
+        """ Start the Inkscape process and wait for its first prompt. """
+        log.debug('Starting Inkscape shell process {}.'.format(self.inkscape_binpath))
+        self._proc = subprocess.Popen([self.inkscape_binpath, '--shell'],
+                                      stdin=subprocess.PIPE,
+                                      stdout=subprocess.PIPE,
+                                      stderr=subprocess.DEVNULL)
+
+        # read the output in a thread, so we can wait for it with a timeout
+        self._output = queue.Queue()
+        reader = threading.Thread(target=self._read_output,
+                                  args=(self._proc.stdout, self._output),
+                                  daemon=True)
+        reader.start()
+        self._wait_for_prompt()
+
+    @staticmethod
+    def _read_output(stream, output):
+        while True:
+            chunk = os.read(stream.fileno(), 4096)
+            output.put(chunk)
+            if not chunk:
+                break
+
+    def _wait_for_prompt(self):
+        """ Return the output of the process until the next prompt. """
+        received = b''
+        while not received.endswith(self.prompt):
+            try:
+                chunk = self._output.get(timeout=self.timeout)
+            except queue.Empty:
+                raise TimeoutError('Inkscape shell did not answer in {} seconds.'.format(self.timeout))
+
+            if not chunk:
+                raise InkscapeShellError('Inkscape shell process closed its output.')
+            received += chunk
+
+        return received[:-len(self.prompt)].decode('utf-8', errors='replace')
+
+    def is_alive(self):
+        return self._proc is not None and self._proc.poll() is None
+
+    def run(self, command):
+        """ Send `command` to the shell and return its output.
+
+        Raises
+        ------
+        InkscapeShellError
+            If the process died.
+
+        TimeoutError
+            If the process did not answer on time.
+        """
+        if not self.is_alive():
+            raise InkscapeShellError('Inkscape shell process is not running.')
+
+        log.debug('Inkscape shell: `{}`.'.format(command))
+        try:
+            self._proc.stdin.write(command.encode('utf-8') + b'\n')
+            self._proc.stdin.flush()
+        except OSError as exc:
+            raise InkscapeShellError('Could not write to the Inkscape shell process.') from exc
+
+        return self._wait_for_prompt()
+
+    def close(self):
+        """ Quit the Inkscape process, kill it if it does not exit on time. """
+        if self._proc is None:
+            return
+
+        if self.is_alive():
+            try:
+                self._proc.stdin.write(b'quit\n')
+                self._proc.stdin.close()
+                self._proc.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                self._proc.kill()
+                self._proc.wait()
+        self._proc = None
+
+    def restart(self):
+        self.close()
+        self.start()
+
+
+class InkscapeShellPool(object):
+    """ A thread-safe pool of `InkscapeShell` processes.
+
+    Parameters
+    ----------
+    size: int
+        Number of Inkscape processes.
+
+    inkscape_binpath: str
+        Path to the Inkscape binary file.
+
+    timeout: float
+        Seconds to wait for each export before restarting the process.
+        Default: commands.get_command_timeout()
+    """
+
+    def __init__(self, size=1, inkscape_binpath=None, timeout=None):
+        if inkscape_binpath is None:
+            inkscape_binpath = get_inkscape_binpath()
+
+        if inkscape_binpath is None or not os.path.exists(inkscape_binpath):
+            raise IOError(
+                'Inkscape binary has not been found. Please check configuration.'
+            )
+
+        self._shells = [InkscapeShell(inkscape_binpath, timeout=timeout) for _ in range(size)]
+        self._idle = queue.Queue()
+        for shell in self._shells:
+            self._idle.put(shell)
+
+    def export(self, input_file, output_file, export_type='pdf', dpi=90, text_to_path=True):
+        """ Export `input_file` to `output_file` using one of the shells.
+        A crashed or hung process is restarted and the export retried once.
+
+        Parameters
+        ----------
+        input_file: str
+            Path to the input file
+
+        output_file: str
+            Path to the output file
+
+        export_type: str
+            Output file type, e.g., 'pdf' or 'png'.
+
+        dpi: int
+            Dots-per-inch of the output file.
+
+        text_to_path: bool
+            Whether to convert the texts to paths.
+
+        Returns
+        -------
+        return_value: int
+            0 if the export succeeded.
+        """
+        command = '; '.join(export_actions(input_file, output_file, export_type=export_type,
+                                           dpi=dpi, text_to_path=text_to_path))
+
+        # the export is checked by the creation of the file
+        if os.path.exists(output_file):
+            os.remove(output_file)
+
+        shell = self._idle.get()
+        try:
+            with stage('command'):
+                for attempt in range(2):
+                    if not shell.is_alive():
+                        shell.restart()
+                    try:
+                        shell.run(command)
+                    except (InkscapeShellError, TimeoutError):
+                        log.warning('Inkscape shell failed exporting {}, restarting '
+                                    'it.'.format(output_file), exc_info=True)
+                        shell.restart()
+                        if attempt > 0:
+                            raise
+                    else:
+                        break
+        finally:
+            self._idle.put(shell)
+
+        if not os.path.exists(output_file):
+            raise IOError('Inkscape shell did not create the file {}.'.format(output_file))
+
+        return 0
+
+    def close(self):
+        for shell in self._shells:
+            shell.close()
+
+
+def get_shell_pool():
+    """ Return the Inkscape shell pool of the current process, or None
+    if the shell mode is not enabled in the environment variable `INKSCAPE_SHELL_ENV`.
+    """
+    size = int(os.environ.get(INKSCAPE_SHELL_ENV, '0') or 0)
+    if size <= 0:
+        return None
+
+    # each process (e.g., a worker of `docstamp create --jobs`) gets its own pool.
+    pid = os.getpid()
+    if pid not in _SHELL_POOLS:
+        _SHELL_POOLS[pid] = InkscapeShellPool(size=size)
+    return _SHELL_POOLS[pid]
+
+
+def enable_shell_mode(size=1):
+    """ Make `inkscape_export` use a pool of `size` Inkscape shell processes
+    in this process and in its child processes.
+    """
+    os.environ[INKSCAPE_SHELL_ENV] = str(size)
+
+
+@atexit.register
+def close_shell_pools():
+    pool = _SHELL_POOLS.pop(os.getpid(), None)
+    if pool is not None:
+        pool.close()
@@ -0,0 +1,190 @@
+"""
+A render journal to record the documents created in an output folder,
+so an interrupted or partially failed run can be resumed.
+
+The journal is a JSON-lines file. The first line is a header with the hash of the
+template and the render options, each of the other lines is the record of one rendered item.
+It is compacted when opened, keeping only the last record of each document rendered successfully.
+"""
+import os
+import json
+import hashlib
+import logging
+
+from docstamp.file_utils import file_hash
+
+log = logging.getLogger(__name__)
+
+JOURNAL_FILENAME = '.docstamp_journal.jsonl'
+
+
+def row_hash(item):
+    """ Return the SHA-256 hex digest of the values in the `item` dict. """
+    content = json.dumps(item, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def _file_state(file_path):
+    """ Return the size and modification time of `file_path`, or None if it does not exist. """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class RenderJournal(object):
+    """ Journal of the documents rendered in `outdir`.
+    The journal of a previous run is reused only if it has the same template and options,
+    otherwise it is replaced when the first document is recorded.
+
+    Parameters
+    ----------
+    outdir: str
+        Output folder path, the journal file will be stored there.
+
+    template_file_path: str
+        Document template file path.
+
+    options: dict
+        Render options, e.g., the output file type and dpi.
+        Must be JSON serializable.
+    """
+
+    def __init__(self, outdir, template_file_path, options):
+        self.journal_path = os.path.join(outdir, JOURNAL_FILENAME)
+        self.header = {'template_hash': file_hash(template_file_path),
+                       'options': json.loads(json.dumps(options, sort_keys=True))}
+        self._new_journal = True
+        self._entries = self._read_entries()
+        self._journal_file = None
+
+    def _read_entries(self):
+        """ Return the row hash and output file state of the last journal entry
+        of each output file path, and rewrite the journal file with only those
+        if it has other lines.
+        """
+        entries = {}
+        if not os.path.exists(self.journal_path):
+            return entries
+
+        n_lines = 0
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            if self._read_line(f.readline()) != self.header:
+                log.debug('The render journal {} is from another template or '
+                          'options.'.format(self.journal_path))
+                return entries
+
+            for line in f:
+                n_lines += 1
+                entry = self._read_line(line)
+                if entry is None:
+                    continue
+                if entry['success']:
+                    entries[entry['output']] = (entry['row_hash'], entry['state'])
+                else:
+                    entries.pop(entry['output'], None)
+
+        self._new_journal = False
+        if n_lines > len(entries):
+            self._compact(entries)
+        return entries
+
+    def _read_line(self, line):
+        """ Return the JSON value of the journal `line`, None if it is not valid. """
+        try:
+            return json.loads(line)
+        except ValueError:
+            # an interrupted run may leave a truncated last line
+            log.debug('Ignoring invalid journal line: {}'.format(line))
+            return None
+
+    def _write_line(self, f, value):
+        f.write(json.dumps(value, ensure_ascii=False) + '\n')
+
+    def _compact(self, entries):
+        """ Replace the journal file with one that has only `entries`. """
+        log.debug('Compacting the render journal {}.'.format(self.journal_path))
+        tmp_path = '{}.{}.tmp'.format(self.journal_path, os.getpid())
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            self._write_line(f, self.header)
+            for output, (item_hash, state) in entries.items():
+                self._write_line(f, {'output': output, 'success': True,
+                                     'row_hash': item_hash, 'state': state})
+        os.replace(tmp_path, self.journal_path)
+
+    def is_done(self, item_hash, file_path):
+        """ Return True if the document for the item with hash `item_hash`
+        (see `row_hash`) has been rendered in `file_path` by a previous run with
+        the same template and options, and the file has not been modified since then.
+        """
+        entry = self._entries.get(file_path)
+        if entry is None:
+            return False
+
+        done_hash, done_state = entry
+        if done_hash != item_hash:
+            return False
+
+        return done_state == _file_state(file_path)
+
+    def record(self, result, item_hash):
+        """ Append to the journal the `result` of rendering an item.
+
+        Parameters
+        ----------
+        result: docstamp.parallel.RenderResult
+
+        item_hash: str
+            Hash of the values used to fill the document, see `row_hash`.
+        """
+        state = None
+        if result.success:
+            state = _file_state(result.file_path)
+
+        entry = {'idx': result.idx,
+                 'output': result.file_path,
+                 'success': state is not None,
+                 'error': result.error,
+                 'row_hash': item_hash,
+                 'state': state}
+
+        if self._journal_file is None:
+            if self._new_journal:
+                self._journal_file = open(self.journal_path, 'w', encoding='utf-8')
+                self._write_line(self._journal_file, self.header)
+            else:
+                self._journal_file = open(self.journal_path, 'a', encoding='utf-8')
+
+        self._write_line(self._journal_file, entry)
+        self._journal_file.flush()
+
+    def close(self):
+        if self._journal_file is not None:
+            self._journal_file.close()
+            self._journal_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class NullJournal(object):
+    """ A render journal that records nothing, for the runs that will not be resumed. """
+
+    def is_done(self, item_hash, file_path):
+        return False
+
+    def record(self, result, item_hash):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,244 @@
+"""
+Function helpers to fill and render many documents, optionally using
+a pool of worker processes.
+"""
+import logging
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from docstamp.template import TextDocument
+from docstamp.timing import record_timings, stage
+
+log = logging.getLogger(__name__)
+
+# `timings` has the seconds of each stage of the document, see timing.record_timings.
+RenderResult = namedtuple('RenderResult', ['idx', 'file_path', 'success', 'error', 'timings'])
+RenderResult.__new__.__defaults__ = (None,)
+
+# maximum number of tasks waiting in the pool per worker process.
+MAX_PENDING_PER_WORKER = 4
+
+# document model of the current worker process, one per (template, command).
+_WORKER_DOCS = {}
+
+
+def _get_worker_document(template_file_path, command):
+    """ Return the document model for `template_file_path` owned by this process.
+    Each worker process creates its own instance, so the `fill` state is never shared.
+    """
+    key = (template_file_path, command)
+    if key not in _WORKER_DOCS:
+        _WORKER_DOCS[key] = TextDocument.from_template_file(template_file_path, command)
+    return _WORKER_DOCS[key]
+
+
+def render_item(document, idx, item, file_path, **kwargs):
+    """ Fill `document` with the values in `item` and render it into `file_path`.
+
+    Parameters
+    ----------
+    document: TextDocument
+
+    idx: int
+        Index of the item in the input data.
+
+    item: dict
+        Set of values to fill the template document.
+
+    file_path: str
+        Path to the output file.
+
+    kwargs:
+        Rendering options, see `TextDocument.render`.
+
+    Returns
+    -------
+    result: RenderResult
+    """
+    with record_timings() as timings:
+        try:
+            with stage('fill'):
+                document.fill(item)
+        except Exception as exc:
+            log.exception('Error filling document for {}th item'.format(idx))
+            return RenderResult(idx, file_path, False, 'fill: {}'.format(exc), timings)
+
+        log.debug('Rendering file {}.'.format(file_path))
+        try:
+            with stage('render'):
+                document.render(file_path, **kwargs)
+        except Exception as exc:
+            log.exception('Error creating {} for {}.'.format(file_path, item))
+            return RenderResult(idx, file_path, False, 'render: {}'.format(exc), timings)
+
+    log.debug('Successfully rendered {}.'.format(file_path))
+    return RenderResult(idx, file_path, True, None, timings)
+
+
+def render_chunk(document, chunk, **kwargs):
+    """ Fill and render all the jobs in `chunk` at once with `document.render_batch`.
+
+    Parameters
+    ----------
+    document: TextDocument
+
+    chunk: list of (int, dict, str)
+        Tuples with the item index, the item values and the output file path.
+
+    kwargs:
+        Rendering options, see `TextDocument.render`.
+
+    Returns
+    -------
+    results: list of RenderResult
+        The stage timings of the chunk are split evenly among its documents.
+    """
+    with record_timings() as timings:
+        with stage('render'):
+            errors = document.render_batch([(item, file_path) for _, item, file_path in chunk], **kwargs)
+
+    timings = {name: seconds / len(chunk) for name, seconds in timings.items()}
+    return [RenderResult(idx, file_path, error is None, error, timings)
+            for (idx, _, file_path), error in zip(chunk, errors)]
+
+
+def _render_in_worker(template_file_path, command, idx, item, file_path, kwargs):
+    document = _get_worker_document(template_file_path, command)
+    return render_item(document, idx, item, file_path, **kwargs)
+
+
+def _render_chunk_in_worker(template_file_path, command, chunk, kwargs):
+    document = _get_worker_document(template_file_path, command)
+    return render_chunk(document, chunk, **kwargs)
+
+
+def _iter_chunks(jobs, chunk_size):
+    chunk = []
+    for job in jobs:
+        chunk.append(job)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _iter_results(future, task_jobs, chunk_size):
+    """ Yield the results of the `future` of a task, or a failed result for
+    each of its `task_jobs`, a list of (idx, file_path), if the task failed.
+    """
+    try:
+        results = future.result()
+    except BrokenProcessPool as exc:
+        log.error('A worker process died rendering {} document(s): {}'.format(len(task_jobs), exc))
+        error = 'render: worker crashed: {}'.format(exc)
+    except Exception as exc:
+        log.error('Error rendering {} document(s) in a worker process.'.format(len(task_jobs)),
+                  exc_info=True)
+        error = 'render: {}'.format(exc)
+    else:
+        if chunk_size > 0:
+            yield from results
+        else:
+            yield results
+        return
+
+    for idx, file_path in task_jobs:
+        yield RenderResult(idx, file_path, False, error)
+
+
+def render_items(template_file_path, command, jobs, n_jobs=1, chunk_size=0, **kwargs):
+    """ Fill and render each of the `jobs` with the template in `template_file_path`.
+
+    Parameters
+    ----------
+    template_file_path: str
+        Document template file path.
+
+    command: str
+        Rendering command, see `TextDocument.from_template_file`.
+
+    jobs: iterable of (int, dict, str)
+        Tuples with the item index, the item values and the output file path.
+        It is read lazily, so it can be a generator.
+
+    n_jobs: int
+        Number of worker processes. If 1, all the documents will be
+        rendered in the current process.
+
+    chunk_size: int
+        If larger than 0, the jobs will be grouped in chunks of `chunk_size`
+        documents and each chunk rendered at once, see `TextDocument.render_batch`.
+
+    kwargs:
+        Rendering options, see `TextDocument.render`.
+
+    Returns
+    -------
+    results: generator of RenderResult
+        One result per job, in the same order as `jobs`. If a worker process
+        dies, the documents being rendered in the pool fail and the next ones
+        are rendered in a new pool.
+    """
+    if n_jobs <= 1:
+        yield from _render_in_process(template_file_path, command, jobs, chunk_size, kwargs)
+    else:
+        tasks = _iter_tasks(template_file_path, command, jobs, chunk_size, kwargs)
+        yield from _render_in_pool(tasks, n_jobs, chunk_size)
+
+
+def _render_in_process(template_file_path, command, jobs, chunk_size, kwargs):
+    """ Yield the results of rendering `jobs` in the current process, see `render_items`. """
+    document = TextDocument.from_template_file(template_file_path, command)
+    if chunk_size > 0:
+        for chunk in _iter_chunks(jobs, chunk_size):
+            yield from render_chunk(document, chunk, **kwargs)
+    else:
+        for idx, item, file_path in jobs:
+            yield render_item(document, idx, item, file_path, **kwargs)
+
+
+def _iter_tasks(template_file_path, command, jobs, chunk_size, kwargs):
+    """ Yield the (idx, file_path) of the jobs of each worker task, and the task. """
+    if chunk_size > 0:
+        for chunk in _iter_chunks(jobs, chunk_size):
+            yield ([(idx, file_path) for idx, _, file_path in chunk],
+                   (_render_chunk_in_worker, template_file_path, command, chunk, kwargs))
+    else:
+        for idx, item, file_path in jobs:
+            yield ([(idx, file_path)],
+                   (_render_in_worker, template_file_path, command, idx, item, file_path, kwargs))
+
+
+def _drain(pending, chunk_size, n_left=0):
+    """ Yield the results of the `pending` tasks, in order, until only `n_left` are left. """
+    while len(pending) > n_left:
+        yield from _iter_results(*pending.popleft(), chunk_size)
+
+
+def _render_in_pool(tasks, n_jobs, chunk_size):
+    """ Yield the results of the `tasks` rendered in a pool of `n_jobs` worker processes,
+    see `render_items`.
+    """
+    pool = ProcessPoolExecutor(max_workers=n_jobs)
+    try:
+        # only read the next tasks when there is room in the pool,
+        # so the memory use does not grow with the number of jobs
+        pending = deque()
+        for task_jobs, task in tasks:
+            try:
+                future = pool.submit(*task)
+            except BrokenProcessPool:
+                # a worker died: the tasks in the pool fail, the next ones go to a new pool
+                yield from _drain(pending, chunk_size)
+                pool.shutdown()
+                pool = ProcessPoolExecutor(max_workers=n_jobs)
+                future = pool.submit(*task)
+
+            pending.append((future, task_jobs))
+            yield from _drain(pending, chunk_size, n_left=n_jobs * MAX_PENDING_PER_WORKER - 1)
+
+        yield from _drain(pending, chunk_size)
+    finally:
+        pool.shutdown()
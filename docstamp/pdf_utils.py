@@ -1,36 +1,363 @@
 """
 Function helpers to manage PDF files.
 """
-from PyPDF2 import PdfFileMerger, PdfFileReader
+import os
+import itertools
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
 
-from docstamp.commands import call_command
+from PyPDF2 import PdfReader, PdfWriter, PageObject, __version__ as pypdf2_version
+from PyPDF2.generic import (NameObject, BooleanObject, DictionaryObject, DecodedStreamObject,
+                            ArrayObject, TextStringObject)
 
+from docstamp.commands import run_command
+from docstamp.file_utils import get_tempdir, move_file
 
-def merge_pdfs(pdf_filepaths, out_filepath):
+
+# major and minor version numbers of the installed PyPDF2.
+PYPDF2_VERSION = tuple(int(number) for number in pypdf2_version.split('.')[:2])
+
+# maximum number of PDF files open at the same time in each merge.
+DEFAULT_MERGE_BATCH_SIZE = 100
+
+
+def _merge_batch(inputs, out_filepath):
+    """ Merge the PDF files in `inputs` in `out_filepath`.
+    All the files are closed when it returns.
+
+    Parameters
+    ----------
+    inputs: list of (str, list of (str, int))
+        The path to each PDF file and its bookmarks: their titles and page indices.
+
+    out_filepath: str
+
+    Returns
+    -------
+    out_filepath: str
+
+    bookmarks: list of (str, int)
+        The bookmarks of the output file.
+    """
+    bookmarks = []
+    writer = PdfWriter()
+    with ExitStack() as stack:
+        for pdf, pdf_bookmarks in inputs:
+            reader = PdfReader(stack.enter_context(open(pdf, 'rb')))
+            n_pages = len(writer.pages)
+            bookmarks.extend((title, n_pages + page) for title, page in pdf_bookmarks)
+            for page in reader.pages:
+                writer.add_page(page)
+
+        for title, page in bookmarks:
+            _add_bookmark(writer, title, page)
+
+        # the pages are read from the input files when writing
+        with open(out_filepath, 'wb') as out:
+            writer.write(out)
+
+    return out_filepath, bookmarks
+
+
+def _add_bookmark(writer, title, page_idx):
+    """ Add a bookmark to the page `page_idx` of `writer`.
+
+    The destination is the indirect reference to the page object, as the PDF
+    specification requires: `PdfWriter.add_outline_item` of PyPDF2 2.x, up to 2.12,
+    writes the page index instead, which the viewers resolve to the wrong pages.
+    It is fixed in PyPDF2 3.0.
+    """
+    if PYPDF2_VERSION >= (3, 0):
+        return writer.add_outline_item(title, page_idx)
+
+    # the private page tree reference of PyPDF2 2.x, to work around its add_outline_item bug
+    page_ref = writer.get_object(writer._pages)['/Kids'][page_idx]
+    bookmark = DictionaryObject()
+    bookmark[NameObject('/Title')] = TextStringObject(title)
+    bookmark[NameObject('/Dest')] = ArrayObject([page_ref, NameObject('/Fit')])
+    return writer.add_outline_item_dict(bookmark)
+
+
+def _iter_batches(inputs, batch_size):
+    inputs = iter(inputs)
+    while True:
+        batch = list(itertools.islice(inputs, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+def merge_pdfs(pdf_filepaths, out_filepath, bookmarks=None, batch_size=DEFAULT_MERGE_BATCH_SIZE, n_jobs=1):
     """ Merge all the PDF files in `pdf_filepaths` in a new PDF file `out_filepath`.
 
+    The files are merged in batches of `batch_size` files into intermediate
+    files, which are merged again the same way until there is only one, so the
+    number of open files and the memory use do not grow with the number of inputs.
+
     Parameters
     ----------
-    pdf_filepaths: list of str
-        Paths to PDF files.
+    pdf_filepaths: iterable of str
+        Paths to PDF files. It is read lazily, so it can be a generator.
 
     out_filepath: str
         Path to the result PDF file.
 
+    bookmarks: iterable of str
+        If given, the title of the bookmark to the first page of each of the `pdf_filepaths`.
+
+    batch_size: int
+        Maximum number of files merged at once.
+
+    n_jobs: int
+        Number of worker processes used to merge the batches of each level.
+
     Returns
     -------
     path: str
         The output file path.
     """
-    merger = PdfFileMerger()
-    for pdf in pdf_filepaths:
-        merger.append(PdfFileReader(open(pdf, 'rb')))
+    if batch_size < 2:
+        raise ValueError('The merge batch size must be at least 2, got {}.'.format(batch_size))
+
+    if bookmarks is None:
+        inputs = ((pdf, []) for pdf in pdf_filepaths)
+    else:
+        inputs = ((pdf, [(title, 0)]) for pdf, title in zip(pdf_filepaths, bookmarks))
+
+    out_dir = os.path.dirname(os.path.abspath(out_filepath))
+    with get_tempdir(out_dir) as temp_dir, ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        shard_paths = (os.path.join(temp_dir, '{}.pdf'.format(idx)) for idx in itertools.count())
+
+        def merge_level(inputs):
+            tasks = ((batch, next(shard_paths)) for batch in _iter_batches(inputs, batch_size))
+            if n_jobs > 1:
+                return list(pool.map(_merge_batch, *zip(*tasks)))
+            return [_merge_batch(*task) for task in tasks]
 
-    merger.write(out_filepath)
+        shards = merge_level(inputs)
+        if not shards:
+            raise ValueError('Got no PDF files to merge.')
+
+        while len(shards) > 1:
+            shards = merge_level(shards)
+
+        move_file(shards[0][0], out_filepath)
 
     return out_filepath
 
 
+def split_pdf(pdf_filepath, page_ranges, out_filepaths):
+    """ Split the pages of the PDF file `pdf_filepath` in many PDF files.
+
+    Parameters
+    ----------
+    pdf_filepath: str
+        Path to the PDF file.
+
+    page_ranges: list of (int, int)
+        The first page index and the index after the last page of each output file.
+
+    out_filepaths: list of str
+        Paths to the result PDF files, one for each of `page_ranges`.
+
+    Returns
+    -------
+    paths: list of str
+        The output file paths.
+    """
+    with open(pdf_filepath, 'rb') as pdf:
+        reader = PdfReader(pdf)
+        n_pages = len(reader.pages)
+        for (start, stop), out_filepath in zip(page_ranges, out_filepaths):
+            if not 0 <= start < stop <= n_pages:
+                raise ValueError('Invalid page range {}-{} for {} with {} pages.'.format(
+                    start, stop, pdf_filepath, n_pages))
+
+            writer = PdfWriter()
+            for page_idx in range(start, stop):
+                writer.add_page(reader.pages[page_idx])
+
+            with open(out_filepath, 'wb') as out:
+                writer.write(out)
+
+    return out_filepaths
+
+
+def stamp_pdf(background_filepath, overlay_filepath, out_filepath):
+    """ Draw the first page of `overlay_filepath` on top of the first page
+    of `background_filepath` and save it in `out_filepath`.
+
+    Parameters
+    ----------
+    background_filepath: str
+        Path to a PDF file.
+
+    overlay_filepath: str
+        Path to a PDF file with the same page size.
+
+    out_filepath: str
+        Path to the result PDF file.
+
+    Returns
+    -------
+    path: str
+        The output file path.
+    """
+    with open(background_filepath, 'rb') as background, open(overlay_filepath, 'rb') as overlay:
+        page = PdfReader(background).pages[0]
+        page.merge_page(PdfReader(overlay).pages[0])
+
+        writer = PdfWriter()
+        writer.add_page(page)
+        with open(out_filepath, 'wb') as out:
+            writer.write(out)
+
+    return out_filepath
+
+
+# font used to write the text at the named destinations of the PDF forms.
+ANCHOR_FONT_NAME = '/DocstampHelvetica'
+
+
+def get_pdf_form_fields(pdf_file):
+    """ Return the form fields of the PDF file and their current values.
+
+    Parameters
+    ----------
+    pdf_file: str or file object
+        Path to the PDF file or the opened file.
+
+    Returns
+    -------
+    fields: dict
+        The value of each field by name, '' if it has no value.
+    """
+    fields = PdfReader(pdf_file).get_fields() or {}
+    return {name: field.get('/V') or '' for name, field in fields.items()}
+
+
+def get_pdf_anchors(pdf_file):
+    """ Return the names of the named destinations of the PDF file.
+
+    Parameters
+    ----------
+    pdf_file: str or file object
+        Path to the PDF file or the opened file.
+
+    Returns
+    -------
+    anchors: list of str
+    """
+    return list(PdfReader(pdf_file).named_destinations)
+
+
+def _pdf_string(text):
+    """ Return `text` as a PDF literal string for a WinAnsi encoded font. """
+    data = text.encode('cp1252', errors='replace')
+    for char in (b'\\', b'(', b')'):
+        data = data.replace(char, b'\\' + char)
+    return b'(' + data + b')'
+
+
+def _text_page(width, height, texts, font_size):
+    """ Return a blank page of `width` and `height` with the `texts`,
+    a list of (x, y, str), written in Helvetica.
+    """
+    page = PageObject.create_blank_page(None, width, height)
+
+    font = DictionaryObject()
+    font[NameObject('/Type')] = NameObject('/Font')
+    font[NameObject('/Subtype')] = NameObject('/Type1')
+    font[NameObject('/BaseFont')] = NameObject('/Helvetica')
+    font[NameObject('/Encoding')] = NameObject('/WinAnsiEncoding')
+    fonts = DictionaryObject()
+    fonts[NameObject(ANCHOR_FONT_NAME)] = font
+    resources = DictionaryObject()
+    resources[NameObject('/Font')] = fonts
+    page[NameObject('/Resources')] = resources
+
+    lines = [b'BT', '{} {} Tf'.format(ANCHOR_FONT_NAME, font_size).encode('ascii')]
+    for x, y, text in texts:
+        lines.append('1 0 0 1 {} {} Tm'.format(x, y).encode('ascii'))
+        lines.append(_pdf_string(text) + b' Tj')
+    lines.append(b'ET')
+
+    contents = DecodedStreamObject()
+    contents.set_data(b'\n'.join(lines))
+    page[NameObject('/Contents')] = contents
+    return page
+
+
+def fill_pdf_form(pdf_file, out_file, field_values, anchor_texts=None, font_size=10):
+    """ Fill the form fields of a PDF file and write text at its named destinations,
+    without calling any external command.
+
+    Parameters
+    ----------
+    pdf_file: str or file object
+        Path to the PDF file or the opened file.
+
+    out_file: str or file object
+        Path to the result PDF file or a binary file object to write it.
+
+    field_values: dict
+        The values of the form fields by name.
+
+    anchor_texts: dict
+        The text to write at each named destination by name. The text baseline
+        starts at the left and top coordinates of the destination.
+
+    font_size: float
+        Size of the text written at the named destinations.
+
+    Returns
+    -------
+    out_file: str or file object
+    """
+    reader = PdfReader(pdf_file)
+    writer = PdfWriter()
+    writer.append_pages_from_reader(reader)
+
+    catalog = reader.trailer['/Root']
+    if '/AcroForm' in catalog and field_values:
+        acro_form = catalog['/AcroForm']
+        # ask the viewers to draw the fields with the new values
+        acro_form[NameObject('/NeedAppearances')] = BooleanObject(True)
+        writer._root_object[NameObject('/AcroForm')] = acro_form
+
+        for page in writer.pages:
+            writer.update_page_form_field_values(page, field_values)
+
+    if anchor_texts:
+        destinations = reader.named_destinations
+        page_texts = {}
+        for name, text in anchor_texts.items():
+            if name not in destinations:
+                continue
+            destination = destinations[name]
+            page_idx = reader.get_destination_page_number(destination)
+            page_texts.setdefault(page_idx, []).append((destination.left or 0, destination.top or 0, text))
+
+        for page_idx, texts in page_texts.items():
+            page = writer.pages[page_idx]
+            box = page.mediabox
+            page.merge_page(_text_page(box.width, box.height, texts, font_size))
+
+    if hasattr(out_file, 'write'):
+        writer.write(out_file)
+    else:
+        with open(out_file, 'wb') as out:
+            writer.write(out)
+
+    return out_file
+
+
+def count_pdf_pages(pdf_filepath):
+    """ Return the number of pages of the PDF file `pdf_filepath`. """
+    with open(pdf_filepath, 'rb') as pdf:
+        return len(PdfReader(pdf).pages)
+
+
 def pdf_to_cmyk(input_file, output_file):
     """ User `gs` (Ghostscript) to convert the colore model of a PDF to CMYK.
 
@@ -48,6 +375,7 @@ def pdf_to_cmyk(input_file, output_file):
         '-sDEVICE=pdfwrite',
         '-sColorConversionStrategy=CMYK',
         '-dProcessColorModel=/DeviceCMYK',
-        '-sOutputFile="{}" "{}"'.format(output_file, input_file),
+        '-sOutputFile={}'.format(output_file),
+        input_file,
     ]
-    call_command('gs', cmd_args)
+    run_command(['gs'] + cmd_args, check=True)
@@ -9,17 +9,252 @@
 # -------------------------------------------------------------------------------
 
 import os
-import shutil
+import hashlib
 import logging
 
-from docstamp.commands import simple_call, check_command
-from docstamp.file_utils import remove_ext, cleanup
+from docstamp.config import get_cache_dir
+from docstamp.commands import simple_call, check_command, run_command, CommandError
+from docstamp.file_utils import remove_ext, write_to_file, get_tempdir, move_file
+from docstamp.timing import stage
 
 log = logging.getLogger(__name__)
 
+BEGIN_DOCUMENT = '\\begin{document}'
+END_DOCUMENT = '\\end{document}'
 
-def tex2pdf(tex_file, output_file=None, output_format='pdf'):
+# maximum number of format files kept in the format folder, see make_format.
+MAX_FORMAT_FILES = 8
+
+# name of the file where the documents joined with `join_tex_documents`
+# write the number of pages shipped out before each of them.
+PAGE_MARKS_FILENAME = 'docstamp_page_marks.txt'
+
+# the shipout counter is not changed by the templates, unlike the page counter,
+# but it is only available since LaTeX 2020-10.
+_PAGE_MARK = ('\\clearpage\\immediate\\write\\docstamppagemarks{'
+              '\\ifdefined\\ReadonlyShipoutCounter\\number\\ReadonlyShipoutCounter'
+              '\\else\\number\\numexpr\\value{page}-1\\relax\\fi}\n')
+
+
+def split_preamble(tex_content):
+    """ Split the LaTeX document content in its preamble and its body.
+
+    Parameters
+    ----------
+    tex_content: str
+
+    Returns
+    -------
+    preamble: str
+        The content before `\\begin{document}`.
+
+    body: str
+        The content from `\\begin{document}` to the end.
+    """
+    position = tex_content.find(BEGIN_DOCUMENT)
+    if position < 0:
+        raise ValueError('Could not find {} in the LaTeX document.'.format(BEGIN_DOCUMENT))
+
+    return tex_content[:position], tex_content[position:]
+
+
+def join_tex_documents(tex_contents):
+    """ Join many LaTeX documents with the same preamble in one document,
+    each of them starting in a new page.
+
+    When compiled, the joined document writes in the `PAGE_MARKS_FILENAME` file of the
+    output folder the number of pages before each of the documents, see `read_page_marks`.
+
+    Parameters
+    ----------
+    tex_contents: list of str
+        The content of the LaTeX documents.
+
+    Returns
+    -------
+    tex_content: str
+        The joined document.
+
+    Raises
+    ------
+    ValueError
+        If the documents do not have the same preamble.
+    """
+    preamble = None
+    bodies = []
+    for tex_content in tex_contents:
+        doc_preamble, body = split_preamble(tex_content)
+        if preamble is None:
+            preamble = doc_preamble
+        elif doc_preamble != preamble:
+            raise ValueError('Can not join LaTeX documents with different preambles.')
+
+        end = body.rfind(END_DOCUMENT)
+        if end < 0:
+            raise ValueError('Could not find {} in the LaTeX document.'.format(END_DOCUMENT))
+        bodies.append(body[len(BEGIN_DOCUMENT):end])
+
+    lines = [preamble + BEGIN_DOCUMENT + '\n']
+    lines.append('\\newwrite\\docstamppagemarks\n')
+    lines.append('\\immediate\\openout\\docstamppagemarks={}\n'.format(PAGE_MARKS_FILENAME))
+    for body in bodies:
+        lines.append(_PAGE_MARK)
+        lines.append(body + '\n')
+    lines.append(_PAGE_MARK)
+    lines.append('\\immediate\\closeout\\docstamppagemarks\n')
+    lines.append(END_DOCUMENT + '\n')
+    return ''.join(lines)
+
+
+def read_page_marks(marks_file):
+    """ Return the page ranges of the documents joined with `join_tex_documents`.
+
+    Parameters
+    ----------
+    marks_file: str
+        Path to the `PAGE_MARKS_FILENAME` file written by the compiler.
+
+    Returns
+    -------
+    page_ranges: list of (int, int)
+        The first page index and the index after the last page of each document.
+    """
+    with open(marks_file, 'r') as f:
+        marks = [int(line) for line in f if line.strip()]
+
+    return list(zip(marks[:-1], marks[1:]))
+
+
+def make_format(preamble, cmd_name='pdflatex', format_dir=None, max_files=MAX_FORMAT_FILES):
+    """ Dump the LaTeX `preamble` into a format file, using the `mylatexformat` package,
+    so the documents with this preamble can be compiled without loading its packages again.
+    The format files are cached by the content of the preamble, only the `max_files`
+    most recently used ones are kept.
+
+    Note that fonts loaded with `fontspec` in XeLaTeX preambles can not be
+    stored in a format file.
+
+    Parameters
+    ----------
+    preamble: str
+        The LaTeX content before `\\begin{document}`.
+
+    cmd_name: str
+        The LaTeX command the format is for. Choices: 'pdflatex', 'xelatex'.
+
+    format_dir: str
+        Folder where to store the format files.
+        Default: the 'formats' folder in the docstamp cache folder.
+
+    max_files: int
+        Maximum number of format files in `format_dir`.
+
+    Returns
+    -------
+    fmt_file: str
+        Path to the format file.
+    """
+    if format_dir is None:
+        format_dir = os.path.join(get_cache_dir(), 'formats')
+    os.makedirs(format_dir, exist_ok=True)
+
+    fmt_name = '{}-{}'.format(cmd_name, hashlib.sha256(preamble.encode('utf-8')).hexdigest())
+    fmt_file = os.path.join(format_dir, fmt_name + '.fmt')
+    if os.path.exists(fmt_file):
+        # the modification time is the last use, for the eviction
+        os.utime(fmt_file)
+        return fmt_file
+
+    check_command(cmd_name)
+
+    # build with a name of this process and rename it, so other processes never see a partial file
+    job_name = '{}-{}'.format(fmt_name, os.getpid())
+    tex_file = os.path.join(format_dir, job_name + '.tex')
+    write_to_file(tex_file, preamble + BEGIN_DOCUMENT + '\n\\end{document}\n', encoding='utf-8')
+
+    args_strings = [cmd_name]
+    args_strings += ['-ini']
+    args_strings += ['-interaction=batchmode']
+    args_strings += ['-jobname={}'.format(job_name)]
+    args_strings += ['-output-directory={}'.format(format_dir)]
+    args_strings += ['&{}'.format(cmd_name)]
+    args_strings += ['mylatexformat.ltx']
+    args_strings += [tex_file]
+
+    log.debug('Building LaTeX format {}.'.format(fmt_file))
+    simple_call(args_strings)
+
+    built_file = os.path.join(format_dir, job_name + '.fmt')
+    for ext in ('tex', 'log'):
+        path = os.path.join(format_dir, '{}.{}'.format(job_name, ext))
+        if os.path.exists(path):
+            os.remove(path)
+
+    if not os.path.exists(built_file):
+        raise IOError('Could not build the LaTeX format {}. '
+                      'Is the mylatexformat package installed?'.format(fmt_file))
+
+    os.replace(built_file, fmt_file)
+    _evict_formats(format_dir, max_files)
+    return fmt_file
+
+
+def _evict_formats(format_dir, max_files):
+    """ Remove the least recently used format files of `format_dir`, keeping `max_files`. """
+    fmt_files = []
+    for entry in os.scandir(format_dir):
+        if not entry.name.endswith('.fmt'):
+            continue
+        try:
+            fmt_files.append((entry.stat().st_mtime, entry.path))
+        except OSError:
+            # removed by another process
+            continue
+
+    for _, path in sorted(fmt_files, reverse=True)[max_files:]:
+        log.debug('Removing the LaTeX format {}.'.format(path))
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _compile_in_scratch_dir(args_strings, tex_file, output_file, output_format, scratch_dir):
+    """ Call the LaTeX command in `args_strings` on `tex_file`, writing all the intermediate
+    files in `scratch_dir` or in a new private folder, and move the result to `output_file`.
+    """
+    if output_file is None:
+        output_file = remove_ext(tex_file) + '.' + output_format
+
+    temp_dir = get_tempdir()
+    try:
+        if scratch_dir is None:
+            scratch_dir = temp_dir.name
+
+        args_strings += ['-output-directory={}'.format(os.path.abspath(scratch_dir))]
+        args_strings += [tex_file]
+
+        log.debug('Calling command {} with args: {}.'.format(args_strings[0], args_strings))
+        result = run_command(args_strings)
+
+        # LaTeX exits with an error code also for recoverable errors, so only a missing result fails
+        result_file = os.path.join(scratch_dir, remove_ext(os.path.basename(tex_file)) + '.' + output_format)
+        if not os.path.exists(result_file):
+            raise CommandError('Could not find {} result file, it exited with code {}.'.format(
+                args_strings[0], result.returncode), result)
+
+        move_file(result_file, output_file)
+    finally:
+        with stage('cleanup'):
+            temp_dir.cleanup()
+
+    return result.returncode
+
+
+def tex2pdf(tex_file, output_file=None, output_format='pdf', fmt_file=None, scratch_dir=None):
     """ Call PDFLatex to convert TeX files to PDF.
+    The intermediate files are written in a private folder, so many
+    documents can be compiled at the same time.
 
     Parameters
     ----------
@@ -33,10 +268,22 @@ def tex2pdf(tex_file, output_file=None, output_format='pdf'):
     output_format: str
         Output file format. Choices: 'pdf' or 'dvi'. Default: 'pdf'
 
+    fmt_file: str
+        Path to a format file with the preamble of `tex_file`, see `make_format`.
+
+    scratch_dir: str
+        Folder where to write the intermediate files. It is not cleaned up.
+        If None, will use a new temporary folder.
+
     Returns
     -------
     return_value
         PDFLatex command call return value.
+
+    Raises
+    ------
+    CommandError
+        If the command does not write the output file.
     """
     if not os.path.exists(tex_file):
         raise IOError('Could not find file {}.'.format(tex_file))
@@ -48,32 +295,17 @@ def tex2pdf(tex_file, output_file=None, output_format='pdf'):
     check_command(cmd_name)
 
     args_strings = [cmd_name]
-    if output_file is not None:
-        args_strings += ['-output-directory="{}" '.format(os.path.abspath(os.path.dirname(output_file)))]
-
-    result_dir = os.path.dirname(output_file) if output_file else os.path.dirname(tex_file)
-
-    args_strings += ['-output-format="{}"'.format(output_format)]
-    args_strings += ['"' + tex_file + '"']
-
-    log.debug('Calling command {} with args: {}.'.format(cmd_name, args_strings))
-    ret = simple_call(args_strings)
-
-    result_file = os.path.join(result_dir, remove_ext(os.path.basename(tex_file)) + '.' + output_format)
-    if os.path.exists(result_file):
-        shutil.move(result_file, output_file)
-    else:
-        raise IOError('Could not find PDFLatex result file.')
+    args_strings += ['-output-format={}'.format(output_format)]
+    if fmt_file is not None:
+        args_strings += ['-fmt={}'.format(remove_ext(fmt_file))]
 
-    log.debug('Cleaning *.aux and *.log files from folder {}.'.format(result_dir))
-    cleanup(result_dir, 'aux')
-    cleanup(result_dir, 'log')
+    return _compile_in_scratch_dir(args_strings, tex_file, output_file, output_format, scratch_dir)
 
-    return ret
 
-
-def xetex2pdf(tex_file, output_file=None, output_format='pdf'):
+def xetex2pdf(tex_file, output_file=None, output_format='pdf', fmt_file=None, scratch_dir=None):
     """ Call XeLatex to convert TeX files to PDF.
+    The intermediate files are written in a private folder, so many
+    documents can be compiled at the same time.
 
     Parameters
     ----------
@@ -87,10 +319,22 @@ def xetex2pdf(tex_file, output_file=None, output_format='pdf'):
     output_format: str
         Output file format. Choices: 'pdf' or 'dvi'. Default: 'pdf'
 
+    fmt_file: str
+        Path to a format file with the preamble of `tex_file`, see `make_format`.
+
+    scratch_dir: str
+        Folder where to write the intermediate files. It is not cleaned up.
+        If None, will use a new temporary folder.
+
     Returns
     -------
     return_value
         XeLatex command call return value.
+
+    Raises
+    ------
+    CommandError
+        If the command does not write the output file.
     """
     if not os.path.exists(tex_file):
         raise IOError('Could not find file {}.'.format(tex_file))
@@ -102,25 +346,14 @@ def xetex2pdf(tex_file, output_file=None, output_format='pdf'):
     check_command(cmd_name)
 
     args_strings = [cmd_name]
-    if output_file is not None:
-        args_strings += ['-output-directory="{}"'.format(os.path.abspath(os.path.dirname(output_file)))]
-
     if output_format == 'dvi':
         args_strings += ['-no-pdf']
-
-    result_dir = os.path.dirname(output_file) if output_file else os.path.dirname(tex_file)
-    args_strings += ['"' + tex_file + '"']
-
-    log.debug('Calling command {} with args: {}.'.format(cmd_name, args_strings))
-    ret = simple_call(args_strings)
-
-    result_file = os.path.join(result_dir, remove_ext(os.path.basename(tex_file)) + '.pdf')
-    if os.path.exists(result_file):
-        shutil.move(result_file, output_file)
+        # xelatex writes extended DVI files
+        result_format = 'xdv'
     else:
-        raise IOError('Could not find PDFLatex result file.')
+        result_format = 'pdf'
+
+    if fmt_file is not None:
+        args_strings += ['-fmt={}'.format(remove_ext(fmt_file))]
 
-    log.debug('Cleaning *.aux and *.log files from folder {}.'.format(result_dir))
-    cleanup(result_dir, 'aux')
-    cleanup(result_dir, 'log')
-    return ret
+    return _compile_in_scratch_dir(args_strings, tex_file, output_file, result_format, scratch_dir)
@@ -1,58 +1,194 @@
 """
 Utility functions to create QRCodes using `qrcode`.
 """
+import itertools
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
 import qrcode
-import qrcode.image.svg
 
-from docstamp.file_utils import replace_file_content
+from docstamp.file_utils import write_to_file
 
+ERROR_CORRECTIONS = {'L': qrcode.constants.ERROR_CORRECT_L,
+                     'M': qrcode.constants.ERROR_CORRECT_M,
+                     'Q': qrcode.constants.ERROR_CORRECT_Q,
+                     'H': qrcode.constants.ERROR_CORRECT_H}
 
-def save_into_qrcode(text, out_filepath, color='', box_size=10, pixel_size=1850):
-    """ Save `text` in a qrcode svg image file.
+# maximum number of QR codes kept in memory.
+QRCODE_CACHE_SIZE = 1024
+
+# SVG QR codes by (text, error correction, box size, color).
+_QRCODES = OrderedDict()
+
+SVG_NAMESPACE = 'http://www.w3.org/2000/svg'
+
+
+def qrcode_matrix(text, error_correction='L'):
+    """ Return the modules of the QR code of `text`, True for the dark ones.
 
     Parameters
     ----------
     text: str
         The string to be codified in the QR image.
 
-    out_filepath: str
-        Path to the output file
+    error_correction: str
+        The error correction level. Choices: 'L', 'M', 'Q', 'H'.
 
-    color: str
-        A RGB color expressed in 6 hexadecimal values.
-
-    box_size: scalar
-        Size of the QR code boxes.
+    Returns
+    -------
+    matrix: list of list of bool
     """
     try:
-        qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L,
-                           box_size=box_size, border=0, )
+        qr = qrcode.QRCode(version=1, error_correction=ERROR_CORRECTIONS[error_correction.upper()],
+                           border=0)
         qr.add_data(text)
         qr.make(fit=True)
+    except KeyError:
+        raise ValueError('Unknown error correction level {}, choose one of '
+                         '{}.'.format(error_correction, list(ERROR_CORRECTIONS)))
     except Exception as exc:
         raise Exception('Error trying to generate QR code '
                         ' from `vcard_string`: {}'.format(text)) from exc
+
+    return qr.get_matrix()
+
+
+def qrcode_path(matrix):
+    """ Return the SVG path data that draws the dark modules of the QR code `matrix`,
+    with one unit per module. The dark modules of each row are joined in runs.
+
+    Parameters
+    ----------
+    matrix: list of list of bool
+        See qrcode_matrix.
+
+    Returns
+    -------
+    path_data: str
+    """
+    path = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < len(row):
+            if not row[x]:
+                x += 1
+                continue
+
+            start = x
+            while x < len(row) and row[x]:
+                x += 1
+            path.append('M{},{}h{}v1h-{}z'.format(start, y, x - start, x - start))
+
+    return ''.join(path)
+
+
+def _make_qrcode_svg(text, error_correction, box_size, color):
+    matrix = qrcode_matrix(text, error_correction=error_correction)
+    modules = len(matrix)
+    # as in `qrcode`, a box_size of 10 is 1mm
+    size = '{:g}mm'.format(modules * box_size / 10)
+    return ('<svg xmlns="{ns}" version="1.1" width="{size}" height="{size}" viewBox="0 0 {n} {n}">'
+            '<path d="{path}" style="fill:#{color};fill-opacity:1;fill-rule:nonzero;stroke:none"/>'
+            '</svg>').format(ns=SVG_NAMESPACE, size=size, n=modules, path=qrcode_path(matrix),
+                             color=color or '000000')
+
+
+def _cache_qrcode(key, svg):
+    _QRCODES[key] = svg
+    if len(_QRCODES) > QRCODE_CACHE_SIZE:
+        _QRCODES.popitem(last=False)
+
+
+def qrcode_svg(text, color='', box_size=10, error_correction='L'):
+    """ Return the QR code of `text` as an SVG element, with the color already applied,
+    so it can be written to a file or inlined in an SVG document.
+    The QR codes are cached by all the parameters.
+
+    Parameters
+    ----------
+    text: str
+        The string to be codified in the QR image.
+
+    color: str
+        A RGB color expressed in 6 hexadecimal values. Default: black.
+
+    box_size: scalar
+        Size of the QR code boxes, 10 is 1mm.
+
+    error_correction: str
+        The error correction level. Choices: 'L', 'M', 'Q', 'H'.
+
+    Returns
+    -------
+    svg_content: str
+    """
+    key = (text, error_correction, box_size, color)
+    if key in _QRCODES:
+        _QRCODES.move_to_end(key)
+        return _QRCODES[key]
+
+    svg = _make_qrcode_svg(*key)
+    _cache_qrcode(key, svg)
+    return svg
+
+
+def qrcode_svgs(texts, color='', box_size=10, error_correction='L', n_jobs=1):
+    """ Return the QR codes of all the `texts`, see qrcode_svg.
+    Each different text is codified only once, in a pool of `n_jobs` processes
+    if it is greater than 1.
+
+    Parameters
+    ----------
+    texts: iterable of str
+
+    n_jobs: int
+        Number of processes to generate the QR codes.
+
+    Returns
+    -------
+    svg_contents: list of str
+        In the same order as `texts`.
+    """
+    texts = list(texts)
+    missing = [text for text in OrderedDict.fromkeys(texts)
+               if (text, error_correction, box_size, color) not in _QRCODES]
+
+    if n_jobs > 1 and len(missing) > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            chunksize = max(1, len(missing) // (n_jobs * 4))
+            svgs = pool.map(_make_qrcode_svg, missing, itertools.repeat(error_correction),
+                            itertools.repeat(box_size), itertools.repeat(color), chunksize=chunksize)
+            generated = dict(zip(missing, svgs))
     else:
-        img = qr.make_image(image_factory=qrcode.image.svg.SvgPathImage)
+        generated = {text: _make_qrcode_svg(text, error_correction, box_size, color) for text in missing}
+
+    for text, svg in generated.items():
+        _cache_qrcode((text, error_correction, box_size, color), svg)
 
-    _ = _qrcode_to_file(img, out_filepath)
+    return [generated[text] if text in generated else
+            qrcode_svg(text, color=color, box_size=box_size, error_correction=error_correction)
+            for text in texts]
 
-    if color:
-        replace_file_content(out_filepath, 'fill:#000000', 'fill:#{}'.format(color))
 
+def save_into_qrcode(text, out_filepath, color='', box_size=10, pixel_size=1850):
+    """ Save `text` in a qrcode svg image file.
 
-def _qrcode_to_file(qrcode, out_filepath):
-    """ Save a `qrcode` object into `out_filepath`.
     Parameters
     ----------
-    qrcode: qrcode object
+    text: str
+        The string to be codified in the QR image.
 
     out_filepath: str
-        Path to the output file.
+        Path to the output file
+
+    color: str
+        A RGB color expressed in 6 hexadecimal values.
+
+    box_size: scalar
+        Size of the QR code boxes.
     """
+    svg = qrcode_svg(text, color=color, box_size=box_size)
     try:
-        qrcode.save(out_filepath)
+        write_to_file(out_filepath, '<?xml version="1.0" encoding="UTF-8"?>\n' + svg, encoding='utf-8')
     except Exception as exc:
         raise IOError('Error trying to save QR code file {}.'.format(out_filepath)) from exc
-    else:
-        return qrcode
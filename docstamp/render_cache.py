@@ -0,0 +1,162 @@
+"""
+A content-addressed cache of rendered documents shared across runs.
+
+The rendered files are stored by the hash of the filled document content
+and the render options, so a document is only rendered again when its
+content or the way to render it changes.
+"""
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+
+log = logging.getLogger(__name__)
+
+# default maximum size of the cache folder, in bytes.
+DEFAULT_CACHE_MAX_SIZE = 1024 * 1024 * 1024
+
+_RENDER_CACHES = {}
+
+
+def get_render_cache(cache_dir, max_size=None):
+    """ Return the `RenderCache` of this process for `cache_dir`,
+    or None if `cache_dir` is None.
+    """
+    if cache_dir is None:
+        return None
+
+    if max_size is None:
+        max_size = DEFAULT_CACHE_MAX_SIZE
+
+    key = (os.getpid(), cache_dir, max_size)
+    if key not in _RENDER_CACHES:
+        _RENDER_CACHES[key] = RenderCache(cache_dir, max_size=max_size)
+    return _RENDER_CACHES[key]
+
+
+class RenderCache(object):
+    """ Cache of rendered documents stored in `cache_dir`, with least recently
+    used eviction when the size of the cache is larger than `max_size`.
+
+    Note that the files referenced by the document content, e.g.,
+    linked images, are not part of the cache key.
+
+    Parameters
+    ----------
+    cache_dir: str
+        Path to the cache folder. Will be created if it does not exist.
+
+    max_size: int
+        Maximum size of the cached files, in bytes.
+    """
+
+    def __init__(self, cache_dir, max_size=DEFAULT_CACHE_MAX_SIZE):
+        self.cache_dir = os.path.join(cache_dir, 'renders')
+        self.max_size = max_size
+        self._size = None
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(content, **options):
+        """ Return the cache key for the document `content` rendered with `options`.
+
+        Parameters
+        ----------
+        content: str or bytes
+            Filled document content.
+
+        options:
+            Render options, e.g., backend, file_type, dpi and support_unicode.
+
+        Returns
+        -------
+        key: str
+        """
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        sha = hashlib.sha256(content)
+        sha.update(json.dumps(options, sort_keys=True).encode('utf-8'))
+        return sha.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def fetch(self, key, file_path):
+        """ Put the cached file for `key` in `file_path`.
+
+        Returns
+        -------
+        found: bool
+            False if `key` is not in the cache.
+        """
+        cached_path = self._path(key)
+        try:
+            shutil.copyfile(cached_path, file_path)
+        except FileNotFoundError:
+            return False
+
+        # mark it as recently used
+        os.utime(cached_path)
+        log.debug('Using cached render {} for {}.'.format(key, file_path))
+        return True
+
+    def store(self, key, file_path):
+        """ Add the rendered file in `file_path` to the cache with `key`. """
+        cached_path = self._path(key)
+        os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+
+        # the size of the entry replaced, if any
+        try:
+            old_size = os.path.getsize(cached_path)
+        except OSError:
+            old_size = 0
+
+        # copy and rename, so other processes never see a partial file
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(cached_path))
+        os.close(fd)
+        try:
+            shutil.copyfile(file_path, temp_path)
+            os.replace(temp_path, cached_path)
+        except OSError:
+            os.remove(temp_path)
+            raise
+
+        if self._size is None:
+            self._size = self.size()
+        else:
+            self._size += os.path.getsize(cached_path) - old_size
+
+        if self._size > self.max_size:
+            self.evict()
+
+    def _cached_files(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for file_name in files:
+                yield os.path.join(root, file_name)
+
+    def size(self):
+        """ Return the total size of the cached files, in bytes. """
+        return sum(os.path.getsize(path) for path in self._cached_files())
+
+    def evict(self):
+        """ Remove the least recently used files until the cache is smaller than `max_size`. """
+        cached = []
+        for path in self._cached_files():
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            cached.append((stat.st_mtime, stat.st_size, path))
+
+        self._size = sum(size for _, size, _ in cached)
+        for _, size, path in sorted(cached):
+            if self._size <= self.max_size:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+            log.debug('Evicted cached render {}.'.format(path))
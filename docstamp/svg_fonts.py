@@ -8,19 +8,120 @@
 # -------------------------------------------------------------------------------
 
 
+import io
 import os
 import base64
+import logging
+from collections import OrderedDict
+
 from lxml import etree
 
-from .file_utils import get_extension
+from .file_utils import get_extension, file_hash
+
+try:
+    from fontTools import subset as font_subset
+except ImportError:
+    font_subset = None
+
+log = logging.getLogger(__name__)
+
+# fontTools logs every step of each subsetting
+logging.getLogger('fontTools.subset').setLevel(logging.WARNING)
 
 FONT_TYPES = {'ttf': 'truetype',
               'otf': 'opentype'}
 
+# maximum number of base64 encoded fonts kept in memory.
+ENCODED_FONTS_CACHE_SIZE = 64
+
+# base64 encoded fonts by (font file hash, glyph set).
+_ENCODED_FONTS = OrderedDict()
+
+# font file hashes by (path, modification time, size).
+_FONT_HASHES = {}
+
 
 def get_base64_encoding(bin_filepath):
     """Return the base64 encoding of the given binary file"""
-    return base64.b64encode(open(bin_filepath, 'r').read())
+    with open(bin_filepath, 'rb') as f:
+        return base64.b64encode(f.read()).decode('ascii')
+
+
+def _font_hash(filepath):
+    stat = os.stat(filepath)
+    key = (os.path.abspath(filepath), stat.st_mtime, stat.st_size)
+    if key not in _FONT_HASHES:
+        _FONT_HASHES[key] = file_hash(filepath)
+    return _FONT_HASHES[key]
+
+
+def subset_font(filepath, text):
+    """ Return the content of the font file in `filepath` with only the glyphs
+    needed to write `text`. Requires the `fontTools` package.
+
+    Parameters
+    ----------
+    filepath: str
+        Path to a .ttf or .otf file.
+
+    text: str
+
+    Returns
+    -------
+    font_content: bytes
+    """
+    if font_subset is None:
+        raise ImportError('The fontTools package is needed to subset fonts. '
+                          'Install it with `pip install docstamp[fonts]`.')
+
+    options = font_subset.Options()
+    font = font_subset.load_font(filepath, options)
+    subsetter = font_subset.Subsetter(options)
+    subsetter.populate(text=text)
+    subsetter.subset(font)
+
+    out = io.BytesIO()
+    font_subset.save_font(font, out, options)
+    return out.getvalue()
+
+
+def get_encoded_font(filepath, text=None):
+    """ Return the base64 encoding of the font file in `filepath`, subset to the glyphs
+    of `text` if it is given and fontTools is installed.
+    The encodings are cached by the font file content and the set of glyphs.
+
+    Parameters
+    ----------
+    filepath: str
+        Path to a .ttf or .otf file.
+
+    text: str
+        The text that will be written with the font.
+
+    Returns
+    -------
+    encoding: str
+    """
+    glyphs = None
+    if text is not None and font_subset is not None:
+        glyphs = ''.join(sorted(set(text)))
+    elif text is not None:
+        log.debug('Embedding the whole font {}, fontTools is not installed.'.format(filepath))
+
+    key = (_font_hash(filepath), glyphs)
+    if key in _ENCODED_FONTS:
+        _ENCODED_FONTS.move_to_end(key)
+        return _ENCODED_FONTS[key]
+
+    if glyphs is None:
+        encoding = get_base64_encoding(filepath)
+    else:
+        encoding = base64.b64encode(subset_font(filepath, glyphs)).decode('ascii')
+
+    _ENCODED_FONTS[key] = encoding
+    if len(_ENCODED_FONTS) > ENCODED_FONTS_CACHE_SIZE:
+        _ENCODED_FONTS.popitem(last=False)
+    return encoding
 
 
 def remove_ext(filepath):
@@ -31,10 +132,12 @@ def remove_ext(filepath):
 class FontFace(object):
     """CSS font-face object"""
 
-    def __init__(self, filepath, fonttype=None, name=None):
+    def __init__(self, filepath, fonttype=None, name=None, text=None):
         self.filepath = filepath
         self.ftype = fonttype
         self.given_name = name
+        # if given, only the glyphs of this text are embedded
+        self.text = text
 
     @classmethod
     def from_file(cls, filepath):
@@ -49,18 +152,18 @@ class FontFace(object):
 
     @property
     def base64(self):
-        return get_base64_encoding(self.filepath)
+        return get_encoded_font(self.filepath, text=self.text)
 
     @property
     def fonttype(self):
         if self.ftype is None:
-            return FONT_TYPES[get_extension(self.filepath)]
+            return FONT_TYPES[self.ext]
         else:
             return self.ftype
 
     @property
     def ext(self):
-        return get_extension(self.filepath)
+        return get_extension(self.filepath).lstrip('.').lower()
 
     @property
     def css_text(self):
@@ -94,22 +197,26 @@ class FontFaceGroup(object):
         self.fontfaces.append(font_face)
 
 
-def _embed_font_to_svg(filepath, font_files):
-    """ Return the ElementTree of the SVG content in `filepath`
-    with the font content embedded.
-    """
-    with open(filepath, 'r') as svgf:
-        tree = etree.parse(svgf)
+def _svg_text(tree):
+    """ Return all the text in the SVG tree, but the one in `style` elements. """
+    return ''.join(text for element in tree.iter()
+                   if isinstance(element.tag, str) and etree.QName(element).localname != 'style'
+                   for text in (element.text, element.tail) if text)
 
+
+def _insert_fonts(tree, font_files, subset=True):
+    """ Insert a style element with the fonts in `font_files` in the `svg` element of `tree`. """
     if not font_files:
         return tree
 
+    text = _svg_text(tree) if subset else None
+
     fontfaces = FontFaceGroup()
     for font_file in font_files:
-        fontfaces.append(FontFace(font_file))
+        fontfaces.append(FontFace(font_file, text=text))
 
     for element in tree.iter():
-        if element.tag.split("}")[1] == 'svg':
+        if isinstance(element.tag, str) and etree.QName(element).localname == 'svg':
             break
 
     element.insert(0, fontfaces.xml_elem)
@@ -117,7 +224,18 @@ def _embed_font_to_svg(filepath, font_files):
     return tree
 
 
-def embed_font_to_svg(filepath, outfile, font_files):
+def _embed_font_to_svg(filepath, font_files, subset=False):
+    """ Return the ElementTree of the SVG content in `filepath`
+    with the font content embedded.
+    If `subset` is True, only the glyphs of the text in the SVG are embedded.
+    """
+    with open(filepath, 'rb') as svgf:
+        tree = etree.parse(svgf)
+
+    return _insert_fonts(tree, font_files, subset=subset)
+
+
+def embed_font_to_svg(filepath, outfile, font_files, subset=False):
     """ Write ttf and otf font content from `font_files`
     in the svg file in `filepath` and write the result in
     `outfile`.
@@ -132,6 +250,35 @@ def embed_font_to_svg(filepath, outfile, font_files):
 
     font_files: iterable of str
         List of paths to .ttf or .otf files.
+
+    subset: bool
+        If True, only the glyphs of the text in the SVG are embedded.
+        Requires the `fontTools` package.
     """
-    tree = _embed_font_to_svg(filepath, font_files)
+    tree = _embed_font_to_svg(filepath, font_files, subset=subset)
     tree.write(outfile, encoding='utf-8', pretty_print=True)
+
+
+def embed_fonts_in_svg_content(svg_content, font_files, subset=True):
+    """ Return the SVG content with the font content from `font_files` embedded.
+    If `subset` is True, only the glyphs of the text in the SVG are embedded.
+    To embed the fonts in each filled document.
+
+    Parameters
+    ----------
+    svg_content: str
+
+    font_files: iterable of str
+        List of paths to .ttf or .otf files.
+
+    subset: bool
+        If True, only the glyphs of the text in the SVG are embedded.
+        Requires the `fontTools` package.
+
+    Returns
+    -------
+    svg_content: str
+    """
+    root = etree.fromstring(svg_content.encode('utf-8'))
+    tree = _insert_fonts(etree.ElementTree(root), font_files, subset=subset)
+    return etree.tostring(tree.getroot(), encoding='unicode')
@@ -2,16 +2,28 @@
 Function helpers to do stuff on svg files.
 """
 import os
+import re
+import copy
 import logging
 
 from docstamp.commands import call_command, which, check_command
 import svgutils.transform as sg
+from lxml import etree
 
 log = logging.getLogger(__name__)
 
 
+# XML codes of the special characters in SVG text and attribute values.
+_SVG_CHAR_CODES = str.maketrans({
+    '&': '&amp;',
+    '>': '&gt;',
+    '<': '&lt;',
+    '"': '&quot;',
+})
+
+
 def replace_chars_for_svg_code(svg_content):
-    """ Replace known special characters to SVG code.
+    """ Replace known special characters to SVG code, in one pass.
 
     Parameters
     ----------
@@ -22,18 +34,13 @@ def replace_chars_for_svg_code(svg_content):
     corrected_svg: str
         Corrected SVG content
     """
-    result = svg_content
-    svg_char = [
-        ('&', '&amp;'),
-        ('>', '&gt;'),
-        ('<', '&lt;'),
-        ('"', '&quot;'),
-    ]
+    return svg_content.translate(_SVG_CHAR_CODES)
+
 
-    for c, entity in svg_char:
-        result = result.replace(c, entity)
+# SVG elements not supported by the in-process CairoSVG renderer.
+CAIROSVG_UNSUPPORTED_TAGS = ('flowRoot', 'foreignObject', 'filter', 'textPath')
 
-    return result
+_cairosvg_unsupported = re.compile(r'<(\w+:)?({})\b'.format('|'.join(CAIROSVG_UNSUPPORTED_TAGS)))
 
 
 def _check_svg_file(svg_file):
@@ -125,20 +132,224 @@ def rsvg_export(input_file, output_file, dpi=90, rsvg_binpath=None):
     return_value
         Command call return value
 
+    Raises
+    ------
+    CommandError
+        If `rsvg-convert` fails.
     """
     if not os.path.exists(input_file):
         log.error('File {} not found.'.format(input_file))
         raise IOError((0, 'File not found.', input_file))
 
+    args_strings = _rsvg_args(output_file, dpi=dpi)
+    args_strings += [input_file]
+
+    return call_command(_rsvg_binpath(rsvg_binpath), args_strings, check=True)
+
+
+def rsvg_export_content(svg_content, output_file, dpi=90, rsvg_binpath=None):
+    """ Calls the `rsvg-convert` command to convert the SVG content to a PDF (with unicode),
+    passing the content through the command standard input.
+
+    Parameters
+    ----------
+    svg_content: str
+        SVG document content.
+
+    output_file: str
+        Path to the output file
+
+    rsvg_binpath: str
+        Path to `rsvg-convert` command
+
+    Returns
+    -------
+    return_value
+        Command call return value
+
+    Raises
+    ------
+    CommandError
+        If `rsvg-convert` fails.
+    """
+    args_strings = _rsvg_args(output_file, dpi=dpi)
+    return call_command(_rsvg_binpath(rsvg_binpath), args_strings,
+                        stdin_content=svg_content.encode('utf-8'), check=True)
+
+
+def _rsvg_binpath(rsvg_binpath=None):
     if rsvg_binpath is None:
+        check_command('rsvg-convert')
         rsvg_binpath = which('rsvg-convert')
-        check_command(rsvg_binpath)
+    return rsvg_binpath
 
+
+def _rsvg_args(output_file, dpi=90):
     args_strings = []
-    args_strings += ["-f pdf"]
-    args_strings += ["-o {}".format(output_file)]
-    args_strings += ["--dpi-x {}".format(dpi)]
-    args_strings += ["--dpi-y {}".format(dpi)]
-    args_strings += [input_file]
+    args_strings += ['-f', 'pdf']
+    args_strings += ['-o', output_file]
+    args_strings += ['--dpi-x', str(dpi)]
+    args_strings += ['--dpi-y', str(dpi)]
+    return args_strings
+
+
+def cairosvg_supports(svg_content):
+    """ Return True if the in-process CairoSVG renderer supports all the
+    elements in `svg_content`. See CAIROSVG_UNSUPPORTED_TAGS.
+
+    CairoSVG supports shapes, paths, text with system fonts, gradients,
+    patterns, clipping paths, masks, embedded images and CSS styles.
+    It does not support Inkscape flowed text, filter effects, foreign objects
+    and text on a path.
+    """
+    return _cairosvg_unsupported.search(svg_content) is None
+
+
+def cairosvg_export(svg_content, output_file, file_type='pdf', dpi=90):
+    """ Render the SVG content into `output_file` using CairoSVG,
+    without calling any external command.
+
+    Parameters
+    ----------
+    svg_content: str
+        SVG document content.
+
+    output_file: str
+        Path to the output file
+
+    file_type: str
+        Choices: 'pdf', 'png'
+
+    dpi: int
+        Dots-per-inch of the output file.
+
+    Raises
+    ------
+    ImportError
+        If CairoSVG or the cairo library are not installed.
+    """
+    try:
+        import cairosvg
+    except (ImportError, OSError) as exc:
+        raise ImportError('CairoSVG and the cairo library are needed to render SVG in-process. '
+                          'Install it with `pip install docstamp[cairo]`.') from exc
+
+    exporters = {'pdf': cairosvg.svg2pdf,
+                 'png': cairosvg.svg2png}
+
+    if file_type not in exporters:
+        raise ValueError('CairoSVG can not export to file type {}.'.format(file_type))
+
+    exporters[file_type](bytestring=svg_content.encode('utf-8'), write_to=output_file, dpi=dpi)
+
+
+# markers of the Jinja2 expressions, statements and comments in a template.
+JINJA_MARKERS = ('{{', '{%', '{#')
+
+# elements that may be referenced by the other elements, kept in both layers.
+_SHARED_TAGS = ('defs', 'style')
+
+
+def _has_jinja(text):
+    return text is not None and any(marker in text for marker in JINJA_MARKERS)
 
-    return call_command(rsvg_binpath, args_strings)
+
+def _local_tag(element):
+    return etree.QName(element).localname if isinstance(element.tag, str) else None
+
+
+def _is_dynamic(element):
+    """ Return True if the text or the attributes of `element`,
+    or the text after its children, have Jinja2 markup.
+    """
+    texts = [element.text]
+    texts.extend(element.attrib.values())
+    texts.extend(child.tail for child in element)
+    return any(_has_jinja(text) for text in texts)
+
+
+def split_svg_layers(svg_template):
+    """ Split the SVG template content in a static background layer and a
+    dynamic overlay layer with the elements that have Jinja2 markup,
+    both with the size of the template.
+
+    The overlay is drawn on top of the background, so the dynamic elements should
+    not be covered by static ones.
+
+    Parameters
+    ----------
+    svg_template: str
+        SVG template content.
+
+    Returns
+    -------
+    background: str
+        The template without the dynamic elements.
+
+    overlay: str
+        The template with only the dynamic elements, their parents and the shared
+        definitions and styles. It is still a template to be filled.
+
+    Raises
+    ------
+    ValueError
+        If the template can not be split, e.g., if the Jinja2 statements are not
+        inside XML elements or the root element is dynamic.
+    """
+    try:
+        root = etree.fromstring(svg_template.encode('utf-8'))
+    except etree.XMLSyntaxError as exc:
+        raise ValueError('Could not parse the SVG template as XML.') from exc
+
+    if _is_dynamic(root) or _has_jinja(root.tail):
+        raise ValueError('The root element of the SVG template has Jinja2 markup.')
+
+    dynamic = [element for element in root.iter() if isinstance(element.tag, str) and _is_dynamic(element)]
+    if not dynamic:
+        raise ValueError('The SVG template does not have any Jinja2 markup.')
+
+    # only the outermost dynamic elements.
+    # the sets hold the lxml elements, so they are the same proxy objects when iterating again.
+    dynamic_set = set(dynamic)
+    dynamic = [element for element in dynamic
+               if not any(parent in dynamic_set for parent in element.iterancestors())]
+
+    # elements to keep in the overlay: the dynamic ones with their ancestors and descendants
+    keep = set()
+    for element in dynamic:
+        keep.update(element.iter())
+        keep.update(element.iterancestors())
+
+    for element in root.iter():
+        if _local_tag(element) in _SHARED_TAGS:
+            keep.update(element.iter())
+
+    # the outermost elements not kept
+    overlay_removals = [element for element in root.iter()
+                        if element not in keep and element.getparent() in keep]
+
+    background = etree.tostring(_without(root, dynamic), encoding='unicode')
+    overlay = etree.tostring(_without(root, overlay_removals), encoding='unicode')
+    return background, overlay
+
+
+def _without(root, elements):
+    """ Return a copy of the `root` tree without `elements`. """
+    removals = set(elements)
+    tree = copy.deepcopy(root)
+    # both trees have the same structure until the removals
+    copies = [node for node, original in zip(tree.iter(), root.iter()) if original in removals]
+    for node in copies:
+        _remove_keeping_tail(node)
+    return tree
+
+
+def _remove_keeping_tail(element):
+    parent = element.getparent()
+    if element.tail:
+        previous = element.getprevious()
+        if previous is not None:
+            previous.tail = (previous.tail or '') + element.tail
+        else:
+            parent.text = (parent.text or '') + element.tail
+    parent.remove(element)
@@ -9,27 +9,63 @@
 # -------------------------------------------------------------------------------
 
 
+import io
 import os
-import shutil
+import re
+import copy
 import logging
 
-from jinja2 import Environment, FileSystemLoader
-
-from .inkscape import svg2pdf, svg2png
-from .pdflatex import tex2pdf, xetex2pdf
-from .file_utils import get_tempfile, write_to_file
-from .svg_utils import replace_chars_for_svg_code
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+from lxml import etree
+from PyPDF2.errors import PyPdfError
+
+from .inkscape import inkscape_export_batch
+from .backends import (BACKENDS, LatexBackend, UnsupportedDocument, get_backend,
+                       find_backends, select_backend, export_content)
+from .file_utils import get_tempdir, get_tempfile, write_to_file
+from .pdflatex import BEGIN_DOCUMENT, PAGE_MARKS_FILENAME, join_tex_documents, read_page_marks
+from .pdf_utils import (split_pdf, count_pdf_pages, stamp_pdf, fill_pdf_form,
+                        get_pdf_form_fields, get_pdf_anchors)
+from .svg_utils import JINJA_MARKERS
+from .svg_utils import split_svg_layers
+from .svg_fonts import embed_fonts_in_svg_content
+from .template_filters import TEMPLATE_FILTERS, TEMPLATE_GLOBALS
+from .render_cache import RenderCache, get_render_cache
+from .timing import stage
 
 log = logging.getLogger(__name__)
 
 
-def get_environment_for(file_path):
+# name of the environment variable with the folder of the Jinja2 bytecode cache.
+# The worker processes inherit it.
+BYTECODE_CACHE_ENV = 'DOCSTAMP_TEMPLATE_CACHE'
+
+# Jinja2 environments of this process, one per templates folder.
+_ENVIRONMENTS = {}
+
+
+def enable_bytecode_cache(cache_dir):
+    """ Store the compiled templates in `cache_dir`, for this process and its
+    child processes, so they are not parsed and compiled again in other processes or runs.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    os.environ[BYTECODE_CACHE_ENV] = cache_dir
+
+
+def get_environment_for(file_path, autoescape=False):
     """Return a Jinja2 environment for where file_path is.
+    The environments are shared by all the documents of the process with templates
+    in the same folder, so each template is compiled only once.
+    They have the filters and globals of `template_filters`, e.g., `vcard` and `qrcode_svg`.
 
     Parameters
     ----------
     file_path: str
 
+    autoescape: bool
+        Whether to replace the XML special characters in the values
+        printed by the templates, see jinja2.Environment.
+
     Returns
     -------
     jinja_env: Jinja2.Environment
@@ -40,40 +76,48 @@ def get_environment_for(file_path):
     if not os.path.exists(work_dir):
         raise IOError('Could not find folder for dirname of file {}.'.format(file_path))
 
-    try:
-        jinja_env = Environment(loader=FileSystemLoader(work_dir))
-    except:
-        raise
-    else:
-        return jinja_env
+    cache_dir = os.environ.get(BYTECODE_CACHE_ENV)
+    key = (work_dir, cache_dir, autoescape)
+    if key not in _ENVIRONMENTS:
+        bytecode_cache = None
+        if cache_dir:
+            # the compiled code depends on the autoescape option, but the cache keys do not
+            if autoescape:
+                cache_dir = os.path.join(cache_dir, 'autoescape')
+                os.makedirs(cache_dir, exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+        env = Environment(loader=FileSystemLoader(work_dir),
+                          bytecode_cache=bytecode_cache,
+                          autoescape=autoescape)
+        env.filters.update(TEMPLATE_FILTERS)
+        env.globals.update(TEMPLATE_GLOBALS)
+        _ENVIRONMENTS[key] = env
+
+    return _ENVIRONMENTS[key]
 
 
 def get_doctype_by_extension(extension):
-    if 'txt' in extension:
-        doc_type = TextDocument
-    elif 'svg' in extension:
-        doc_type = SVGDocument
-    elif 'tex' in extension:
-        doc_type = LateXDocument
-    else:
-        raise ValueError('Could not identify the `doc_type` for `extension` {}.'.format(extension))
+    for doc_type in (TextDocument, SVGDocument, LateXDocument, PDFFormDocument):
+        if doc_type.input_type in extension:
+            return doc_type
 
-    return doc_type
+    raise ValueError('Could not identify the `doc_type` for `extension` {}.'.format(extension))
 
 
 def get_doctype_by_command(command):
+    """ Return the document type for the input file type of
+    the rendering backend named `command`. See backends.BACKENDS.
+    """
     if not command:
-        doc_type = TextDocument
-    elif command == 'inkscape':
-        doc_type = SVGDocument
-    elif command == 'pdflatex':
-        doc_type = PDFLateXDocument
-    elif command == 'xelatex':
-        doc_type = XeLateXDocument
-    else:
+        return TextDocument
+
+    try:
+        backend = get_backend(command)
+    except ValueError:
         raise ValueError('Could not identify the `doc_type` for `command` {}.'.format(command))
 
-    return doc_type
+    return get_doctype_by_extension(backend.input_types[0])
 
 
 class TextDocument(object):
@@ -87,6 +131,17 @@ class TextDocument(object):
     doc_contents: dict
         Dictionary with content values for the template to be filled.
     """
+    # file type of the filled document
+    input_type = 'txt'
+
+    # default output file type
+    file_type = 'txt'
+
+    # name of the preferred rendering backend, see backends.BACKENDS
+    backend = 'copy'
+
+    # whether to replace the XML special characters in the filled values
+    autoescape = False
 
     def __init__(self, template_file_path, doc_contents=None):
         if not os.path.exists(template_file_path):
@@ -94,6 +149,7 @@ class TextDocument(object):
 
         self._setup_template_file(template_file_path)
 
+        self.file_content_ = None
         if doc_contents is not None:
             self.file_content_ = self.fill(doc_contents)
 
@@ -107,7 +163,7 @@ class TextDocument(object):
         """
         try:
             template_file = template_file_path
-            template_env = get_environment_for(template_file_path)
+            template_env = get_environment_for(template_file_path, autoescape=self.autoescape)
             template = template_env.get_template(os.path.basename(template_file))
         except:
             raise
@@ -139,6 +195,14 @@ class TextDocument(object):
             self.file_content_ = filled_doc
             return filled_doc
 
+    def _check_filled(self):
+        """ Raise a ValueError if the document has not been filled. """
+        if self.file_content_ is None:
+            msg = 'Template content has not been updated. \
+                   Please fill the template before rendering it.'
+            log.exception(msg)
+            raise ValueError(msg)
+
     def save_content(self, file_path, encoding='utf-8'):
         """ Save the content of the .txt file in a text file.
 
@@ -147,11 +211,7 @@ class TextDocument(object):
         file_path: str
             Path to the output file.
         """
-        if self.file_content_ is None:
-            msg = 'Template content has not been updated. \
-                   Please fill the template before rendering it.'
-            log.exception(msg)
-            raise ValueError(msg)
+        self._check_filled()
 
         try:
             write_to_file(file_path, content=self.file_content_,
@@ -163,13 +223,165 @@ class TextDocument(object):
             raise Exception(msg) from exc
 
     def render(self, file_path, **kwargs):
-        """ See self.save_content """
-        return self.save_content(file_path)
+        """ Render the content of the document into `file_path` with the
+        preferred backend, or the cheapest one that can render it.
+        See backends.find_backends.
+
+        Parameters
+        ----------
+        file_path: str
+            Path to the output file.
+
+        Kwargs
+        ------
+        file_type: str
+            Output file type, e.g., 'pdf', 'png', or the document type.
+            Default: self.file_type
+
+        dpi: int
+            Dots-per-inch for the png and pdf.
+            Default: 150
+
+        support_unicode: bool
+            Whether to allow unicode to be encoded in the PDF.
+            Default: False
+
+        backend: str
+            Name of the preferred rendering backend.
+            Default: self.backend
+
+        cache_dir: str
+            Path to the render cache folder. If None, will not use the cache.
+            Default: None
+
+        cache_max_size: int
+            Maximum size of the render cache, in bytes.
+            Default: render_cache.DEFAULT_CACHE_MAX_SIZE
+
+        Other options are passed to the backend, see backends.Backend.export.
+        """
+        self._check_filled()
+
+        options = dict(kwargs)
+        options['file_type'] = options.get('file_type', self.file_type)
+        options['dpi'] = options.get('dpi', 150)
+        support_unicode = options.pop('support_unicode', False)
+        backends = find_backends(self.input_type, options['file_type'],
+                                 support_unicode=support_unicode,
+                                 content=self.file_content_,
+                                 preferred=options.pop('backend', self.backend))
+        if not backends:
+            raise ValueError('Could not find a rendering backend for {} to {}.'.format(
+                self.input_type, options['file_type']))
+
+        cache_dir = options.pop('cache_dir', None)
+        cache_max_size = options.pop('cache_max_size', None)
+        cache = None
+        if backends[0].cost > 0:
+            cache = get_render_cache(cache_dir, cache_max_size)
+        if cache is not None:
+            with stage('cache'):
+                cache_key = self._render_cache_key(backends[0].name, support_unicode=support_unicode, **options)
+                if cache.fetch(cache_key, file_path):
+                    return
+
+        for backend in backends:
+            try:
+                backend.export(self.file_content_, file_path, **options)
+            except UnsupportedDocument:
+                log.warning('Backend {} could not render {}, trying the next '
+                            'one.'.format(backend.name, file_path), exc_info=True)
+            except:
+                log.exception(
+                    'Error exporting file {} to {}'.format(file_path, options['file_type'])
+                )
+                raise
+            else:
+                break
+        else:
+            raise UnsupportedDocument('No backend could render {}.'.format(file_path))
+
+        # the key is of the first backend, the documents rendered by a fallback one are not stored
+        if cache is not None and backend is backends[0]:
+            with stage('cache'):
+                cache.store(cache_key, file_path)
+
+    def _render_cache_key(self, backend, **kwargs):
+        """ Return the render cache key of the current content rendered by `backend`
+        with the options in `kwargs`. See render_cache.RenderCache.
+        """
+        return RenderCache.key(self.file_content_,
+                               backend=backend,
+                               file_type=kwargs.get('file_type', 'pdf'),
+                               dpi=kwargs.get('dpi', 150),
+                               support_unicode=kwargs.get('support_unicode', False))
+
+    def _fetch_from_cache(self, cache, backend, file_path, options):
+        """ Copy the current content rendered before from the render `cache` into `file_path`.
+
+        Returns
+        -------
+        fetched: bool
+            True if it was in the cache.
+
+        cache_key: str
+            The render cache key of the content, None if `cache` is None.
+        """
+        if cache is None:
+            return False, None
+
+        cache_key = self._render_cache_key(backend.name, **options)
+        return cache.fetch(cache_key, file_path), cache_key
+
+    def render_batch(self, jobs, **kwargs):
+        """ Fill and render many documents, one after the other.
+        Subclasses may override this to render all the `jobs` at once.
+
+        Parameters
+        ----------
+        jobs: list of (dict, str)
+            Tuples with the content values and the output file path of each document.
+
+        Kwargs
+        ------
+        See self.render
+
+        Returns
+        -------
+        errors: list of str or None
+            The error message of each of the `jobs`, None if it has been rendered.
+        """
+        errors = []
+        for doc_contents, file_path in jobs:
+            try:
+                self.fill(doc_contents)
+            except Exception as exc:
+                errors.append('fill: {}'.format(exc))
+                continue
+
+            try:
+                self.render(file_path, **kwargs)
+            except Exception as exc:
+                log.exception('Error creating {} for {}.'.format(file_path, doc_contents))
+                errors.append('render: {}'.format(exc))
+            else:
+                errors.append(None)
+
+        return errors
+
+    @classmethod
+    def get_doctype_for_template(cls, template_file_path):
+        """ Return the document type for the content of `template_file_path`,
+        this class or a subclass of it.
+        """
+        return cls
 
     @classmethod
     def from_template_file(cls, template_file_path, command=None):
         """ Factory function to create a specific document of the
-        class given by the `command` or the extension of `template_file_path`.
+        class given by the extension of `template_file_path` or the `command`,
+        if the extension is not specific. The document will be rendered with
+        the `command` backend if it is capable.
 
         See get_doctype_by_command and get_doctype_by_extension.
 
@@ -188,24 +400,32 @@ class TextDocument(object):
         ext = os.path.basename(template_file_path).split('.')[-1]
 
         try:
-            doc_type = get_doctype_by_command(command)
-        except ValueError:
             doc_type = get_doctype_by_extension(ext)
-        except:
-            raise
-        else:
-            return doc_type(template_file_path)
+        except ValueError:
+            doc_type = get_doctype_by_command(command)
+
+        doc = doc_type.get_doctype_for_template(template_file_path)(template_file_path)
+        if command in BACKENDS and doc.input_type in BACKENDS[command].input_types:
+            doc.backend = command
+        return doc
 
 
 class SVGDocument(TextDocument):
     """ A .svg template document model. See GenericDocument. """
     _template_file = 'badge_template.svg'
 
+    input_type = 'svg'
+    file_type = 'pdf'
+    backend = 'inkscape'
+    autoescape = True
+
+    # the filled content the fonts were last embedded in, so they are embedded only once
+    _fonts_embedded_in = None
+
     def fill(self, doc_contents):
         """ Fill the content of the document with the information in doc_contents.
-        This is different from the TextDocument fill function, because this will
-        check for symbools in the values of `doc_content` and replace them
-        to good XML codes before filling the template.
+        The XML special characters in the values printed by the template are
+        replaced by XML codes, `doc_contents` is not modified.
 
         Parameters
         ----------
@@ -217,74 +437,432 @@ class SVGDocument(TextDocument):
         filled_doc: str
             The content of the document with the template information filled.
         """
-        for key, content in doc_contents.items():
-            doc_contents[key] = replace_chars_for_svg_code(content)
-
+        self._doc_contents = doc_contents
         return super(SVGDocument, self).fill(doc_contents=doc_contents)
 
-    def render(self, file_path, **kwargs):
-        """ Save the content of the .svg file in the chosen rendered format.
+    def _get_layers(self):
+        """ Return the static background content and the dynamic overlay template of
+        this template, or None if it can not be split. See svg_utils.split_svg_layers.
+        """
+        if not hasattr(self, '_layers'):
+            self._layers = None
+            self._backgrounds = {}
+            source = self._template_env.loader.get_source(self._template_env,
+                                                          os.path.basename(self._template_file))[0]
+            try:
+                background, overlay = split_svg_layers(source)
+            except ValueError as exc:
+                log.warning('Could not split the template {} in a static background and a '
+                            'dynamic overlay, rendering the whole documents: {}'.format(self._template_file, exc))
+            else:
+                self._layers = (self._template_env.from_string(background).render(),
+                                self._template_env.from_string(overlay))
+        return self._layers
+
+    def embed_fonts(self, font_files):
+        """ Embed the fonts in `font_files` in the filled document, with only the
+        glyphs of its text if fontTools is installed. See svg_fonts.embed_fonts_in_svg_content.
+        """
+        self._check_filled()
+        if font_files and self.file_content_ is not self._fonts_embedded_in:
+            self.file_content_ = embed_fonts_in_svg_content(self.file_content_, font_files)
+            self._fonts_embedded_in = self.file_content_
 
-        Parameters
-        ----------
-        file_path: str
-            Path to the output file.
+    def render(self, file_path, static_background=False, embed_fonts=(), **kwargs):
+        """ Render the content of the document into `file_path`.
+        See TextDocument.render.
 
         Kwargs
         ------
-        file_type: str
-            Choices: 'png', 'pdf', 'svg'
-            Default: 'pdf'
+        static_background: bool
+            If True and the output file type is 'pdf', the elements of the template without
+            Jinja2 markup are rendered only once as a background, and only the other ones
+            are rendered for each document and stamped on a copy of the background.
+            The dynamic elements must not be covered by static ones.
+
+        embed_fonts: list of str
+            Paths to .ttf or .otf font files to embed in the document, see self.embed_fonts.
+        """
+        file_type = kwargs.get('file_type', self.file_type)
+        if static_background and file_type == 'pdf' and self._get_layers() is not None:
+            return self._render_layers(file_path, embed_fonts=embed_fonts, **kwargs)
+
+        self.embed_fonts(embed_fonts)
+        return super(SVGDocument, self).render(file_path, **kwargs)
+
+    def _render_layers(self, file_path, embed_fonts=(), **kwargs):
+        """ Render the dynamic overlay of the document and stamp it on the background. """
+        self._check_filled()
+        background, overlay_template = self._layers
+
+        options = {key: value for key, value in kwargs.items()
+                   if key not in ('file_type', 'cache_dir', 'cache_max_size')}
+        options['dpi'] = options.get('dpi', 150)
+        options['preferred'] = options.pop('backend', self.backend)
+
+        key = (options['preferred'], options['dpi'], options.get('support_unicode', False))
+        if key not in self._backgrounds:
+            background_file = get_tempfile(suffix='.pdf')
+            if embed_fonts:
+                background = embed_fonts_in_svg_content(background, embed_fonts)
+            export_content(background, background_file.name, self.input_type, file_type='pdf', **options)
+            # keep the file object, the file is removed when it is closed
+            self._backgrounds[key] = background_file
+
+        overlay = overlay_template.render(**self._doc_contents)
+        if embed_fonts:
+            overlay = embed_fonts_in_svg_content(overlay, embed_fonts)
+        with get_tempfile(suffix='.pdf') as overlay_file:
+            export_content(overlay, overlay_file.name, self.input_type, file_type='pdf', **options)
+            stamp_pdf(self._backgrounds[key].name, overlay_file.name, file_path)
+
+    def render_batch(self, jobs, **kwargs):
+        """ Fill all the documents and export them to PDF or PNG with
+        only one Inkscape call. See TextDocument.render_batch.
+        """
+        backend = self._get_batch_backend(**kwargs)
+        if backend is None:
+            return super(SVGDocument, self).render_batch(jobs, **kwargs)
+
+        options = {'file_type': kwargs.get('file_type', self.file_type),
+                   'dpi': kwargs.get('dpi', 150),
+                   'support_unicode': kwargs.get('support_unicode', False)}
+        cache = get_render_cache(kwargs.get('cache_dir'), kwargs.get('cache_max_size'))
+
+        errors = [None] * len(jobs)
+        with get_tempdir() as temp_dir:
+            exports = self._save_batch_files(jobs, temp_dir, backend, cache, errors, options,
+                                             embed_fonts=kwargs.get('embed_fonts'))
+            if exports:
+                self._export_batch_files(jobs, exports, cache, errors, options['file_type'])
+
+        return errors
+
+    def _get_batch_backend(self, static_background=False, **kwargs):
+        """ Return the Inkscape backend if it renders the documents with the
+        options in `kwargs`, None if they can not be exported in one call.
+        The static background documents are stamped one by one, see self.render.
+        """
+        if static_background:
+            return None
 
-        dpi: int
-            Dots-per-inch for the png and pdf.
-            Default: 150
+        try:
+            backend = select_backend(self.input_type, kwargs.get('file_type', self.file_type),
+                                     support_unicode=kwargs.get('support_unicode', False),
+                                     preferred=kwargs.get('backend', self.backend))
+        except ValueError:
+            return None
 
-        support_unicode: bool
-            Whether to allow unicode to be encoded in the PDF.
-            Default: False
-        """
-        temp = get_tempfile(suffix='.svg')
-        self.save_content(temp.name)
+        if backend.name != 'inkscape':
+            return None
+        return backend
 
-        file_type = kwargs.get('file_type', 'pdf')
-        dpi = kwargs.get('dpi', 150)
-        support_unicode = kwargs.get('support_unicode', False)
+    def _save_batch_files(self, jobs, temp_dir, backend, cache, errors, options, embed_fonts=()):
+        """ Fill the documents of `jobs` and save them in `temp_dir`, except the ones
+        fetched from the render `cache`. The errors are set in the `errors` list.
+
+        Returns
+        -------
+        exports: list of (int, tuple, str)
+            The position in `jobs`, the `inkscape_export_batch` job and the cache key
+            of each of the documents to export.
+        """
+        exports = []
+        for position, (doc_contents, file_path) in enumerate(jobs):
+            svg_path = os.path.join(temp_dir, '{}.svg'.format(position))
+            try:
+                self.fill(doc_contents)
+                self.embed_fonts(embed_fonts)
+            except Exception as exc:
+                errors[position] = 'fill: {}'.format(exc)
+                continue
+
+            fetched, cache_key = self._fetch_from_cache(cache, backend, file_path, options)
+            if fetched:
+                continue
+
+            try:
+                self.save_content(svg_path)
+            except Exception as exc:
+                errors[position] = 'fill: {}'.format(exc)
+                continue
+
+            exports.append((position, (svg_path, file_path, options['file_type'], options['dpi']), cache_key))
+        return exports
+
+    def _export_batch_files(self, jobs, exports, cache, errors, file_type):
+        """ Export the `exports` of self._save_batch_files with one Inkscape call,
+        and store them in the render `cache`. The errors are set in the `errors` list.
+        """
         try:
-            if file_type == 'svg':
-                shutil.copyfile(temp.name, file_path)
-            elif file_type == 'png':
-                svg2png(temp.name, file_path, dpi=dpi)
-            elif file_type == 'pdf':
-                svg2pdf(temp.name, file_path, dpi=dpi, support_unicode=support_unicode)
-        except:
-            log.exception(
-                'Error exporting file {} to {}'.format(file_path, file_type)
-            )
-            raise
+            exported = inkscape_export_batch([export_job for _, export_job, _ in exports],
+                                             chunk_size=len(exports))
+        except Exception as exc:
+            log.exception('Error exporting {} files to {}.'.format(len(exports), file_type))
+            exported = [False] * len(exports)
+            reason = str(exc)
+        else:
+            reason = 'Inkscape did not create the file.'
+
+        for (position, _, cache_key), success in zip(exports, exported):
+            if not success:
+                errors[position] = 'render: {}'.format(reason)
+            elif cache is not None:
+                cache.store(cache_key, jobs[position][1])
+
+    @classmethod
+    def get_doctype_for_template(cls, template_file_path):
+        """ Return SVGDOMDocument if the template in `template_file_path`
+        binds elements with `data-docstamp-field` attributes and does not have
+        Jinja2 markup, otherwise this class.
+        """
+        with open(template_file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+
+        if any(marker in content for marker in JINJA_MARKERS):
+            return cls
+        if SVGDOMDocument.field_attribute + '=' not in content:
+            return cls
+        return SVGDOMDocument
+
+
+class SVGDOMDocument(SVGDocument):
+    """ A .svg template document model filled without Jinja2. The template is
+    parsed once, and the values are set as the text of the elements bound to them
+    in a copy of the template for each document.
+
+    An element is bound to the value with the name in its `data-docstamp-field`
+    attribute. The value replaces the first text inside the element, e.g., the
+    placeholder text of the first `tspan` of a `text` element.
+    """
+    # the values are set as text, the XML serialization escapes them
+    autoescape = False
+
+    # name of the attribute to bind an element to a value
+    field_attribute = 'data-docstamp-field'
+
+    def _setup_template_file(self, template_file_path):
+        """ Parse the template and find the elements bound to the values.
+
+        Parameters
+        ----------
+        template_file_path: str
+            Document template file path.
+        """
+        self._template_file = template_file_path
+        self._template_env = get_environment_for(template_file_path, autoescape=True)
+        self.template = etree.parse(template_file_path).getroot()
+
+        # positions of the bound elements in the document order, by value name
+        self._bindings = {}
+        for position, element in enumerate(self.template.iter()):
+            if not isinstance(element.tag, str):
+                continue
+            name = element.get(self.field_attribute)
+            if name:
+                self._bindings.setdefault(name, []).append(position)
+
+    @classmethod
+    def get_doctype_for_template(cls, template_file_path):
+        return cls
+
+    def fill(self, doc_contents):
+        """ Fill a copy of the template with the information in doc_contents.
+
+        Parameters
+        ----------
+        doc_contents: dict
+            Set of values to set the template document.
+
+        Returns
+        -------
+        filled_doc: str
+            The content of the document with the template information filled.
+        """
+        positions = {}
+        for name, value in doc_contents.items():
+            for position in self._bindings.get(name, ()):
+                positions[position] = value
+
+        document = copy.deepcopy(self.template)
+        if positions:
+            elements = list(document.iter())
+            try:
+                for position, value in positions.items():
+                    _set_element_text(elements[position], '' if value is None else str(value))
+            except ValueError:
+                log.exception('Error filling Document for {}.'.format(doc_contents))
+                raise
+
+        self._doc_contents = doc_contents
+        self.file_content_ = etree.tostring(document, encoding='unicode')
+        return self.file_content_
+
+
+# characters that can not be in XML 1.0 documents.
+_xml_invalid_chars = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]')
+
+
+def _set_element_text(element, text):
+    """ Replace the first non-empty text inside `element`, or its text, by `text`
+    without the characters not allowed in XML.
+    """
+    text = _xml_invalid_chars.sub('', text)
+    for node in element.iter():
+        if isinstance(node.tag, str) and node.text and node.text.strip():
+            node.text = text
+            return
+    element.text = text
 
 
 class LateXDocument(TextDocument):
     """ A .tex template document model. See GenericDocument. """
+    input_type = 'tex'
+    file_type = 'pdf'
+    backend = 'pdflatex'
 
-    _render_function = staticmethod(tex2pdf)
+    # whether the preamble of the template has no Jinja2 markup, see has_static_preamble
+    _static_preamble = None
+
+    def has_static_preamble(self):
+        """ Return True if the preamble of the template has no Jinja2 markup,
+        so it is the same in all the documents and can be precompiled once.
+        """
+        if self._static_preamble is None:
+            with open(self._template_file, 'r', encoding='utf-8') as f:
+                content = f.read()
+            preamble = content[:content.find(BEGIN_DOCUMENT)]
+            self._static_preamble = not any(marker in preamble for marker in JINJA_MARKERS)
+            if not self._static_preamble:
+                log.warning('The preamble of the LaTeX template {} has template fields, it will not be '
+                            'precompiled.'.format(self._template_file))
+        return self._static_preamble
+
+    def _render_options(self, kwargs):
+        """ Return the rendering options `kwargs` for LaTeX. """
+        # the LaTeX command is chosen by the template, not by the unicode support
+        kwargs = dict(kwargs, file_type='pdf', support_unicode=False)
+        # a format file would be built for each different preamble
+        if kwargs.get('precompile_preamble') and not self.has_static_preamble():
+            kwargs['precompile_preamble'] = False
+        return kwargs
 
     def render(self, file_path, **kwargs):
         """ Save the content of the .text file in the PDF.
+        See TextDocument.render.
 
         Parameters
         ----------
         file_path: str
             Path to the output file.
         """
-        temp = get_tempfile(suffix='.tex')
-        self.save_content(temp.name)
+        return super(LateXDocument, self).render(file_path, **self._render_options(kwargs))
+
+    def render_batch(self, jobs, **kwargs):
+        """ Fill all the documents, join them as the pages of one document, compile
+        it with only one LaTeX call and split the result in one PDF file per job.
+        If the documents do not have the same preamble, or the joined document fails,
+        they are rendered one by one, so only the documents with errors fail.
+        See TextDocument.render_batch.
+        """
+        kwargs = self._render_options(kwargs)
+        backend = select_backend(self.input_type, 'pdf', preferred=kwargs.get('backend', self.backend))
+        if not isinstance(backend, LatexBackend) or len(jobs) < 2:
+            return super(LateXDocument, self).render_batch(jobs, **kwargs)
+
+        cache = get_render_cache(kwargs.get('cache_dir'), kwargs.get('cache_max_size'))
+        errors = [None] * len(jobs)
+        pending = self._fill_batch(jobs, backend, cache, errors, dpi=kwargs.get('dpi', 150))
+        if not pending:
+            return errors
+
+        positions = [position for position, _, _ in pending]
+        try:
+            joined_content = join_tex_documents([content for _, content, _ in pending])
+        except ValueError:
+            log.debug('Could not join the LaTeX documents, rendering them one by one.', exc_info=True)
+            return self._render_one_by_one(jobs, positions, errors, **kwargs)
 
+        file_paths = [jobs[position][1] for position in positions]
         try:
-            self._render_function(temp.name, file_path, output_format='pdf')
-        except:
-            log.exception('Error exporting file {} to PDF.'.format(file_path))
-            raise
+            self._render_joined(backend, joined_content, file_paths, **kwargs)
+        except Exception:
+            log.warning('Error rendering {} LaTeX documents in one call, rendering them '
+                        'one by one.'.format(len(pending)), exc_info=True)
+            return self._render_one_by_one(jobs, positions, errors, **kwargs)
+
+        if cache is not None:
+            for (_, _, cache_key), file_path in zip(pending, file_paths):
+                cache.store(cache_key, file_path)
+
+        return errors
+
+    def _fill_batch(self, jobs, backend, cache, errors, dpi=150):
+        """ Fill the documents of `jobs`, except the ones fetched from the render `cache`.
+        The errors are set in the `errors` list.
+
+        Returns
+        -------
+        pending: list of (int, str, str)
+            The position in `jobs`, the filled content and the cache key
+            of each of the documents to render.
+        """
+        pending = []
+        for position, (doc_contents, file_path) in enumerate(jobs):
+            try:
+                self.fill(doc_contents)
+            except Exception as exc:
+                errors[position] = 'fill: {}'.format(exc)
+                continue
+
+            fetched, cache_key = self._fetch_from_cache(cache, backend, file_path,
+                                                        {'file_type': 'pdf', 'dpi': dpi})
+            if not fetched:
+                pending.append((position, self.file_content_, cache_key))
+        return pending
+
+    def _render_joined(self, backend, joined_content, file_paths, **kwargs):
+        """ Compile the `joined_content` of join_tex_documents with `backend`
+        and split it in the PDF `file_paths`.
+        """
+        options = {key: value for key, value in kwargs.items()
+                   if key not in ('file_type', 'dpi', 'support_unicode', 'backend',
+                                  'cache_dir', 'cache_max_size')}
+        with get_tempdir() as temp_dir:
+            joined_path = os.path.join(temp_dir, 'joined.pdf')
+            # the page marks are written in the scratch folder
+            backend.export(joined_content, joined_path, scratch_dir=temp_dir, **options)
+            page_ranges = self._joined_page_ranges(joined_path, len(file_paths))
+            split_pdf(joined_path, page_ranges, file_paths)
+
+    def _render_one_by_one(self, jobs, positions, errors, **kwargs):
+        """ Render the `jobs` in `positions` one by one, and set their errors in `errors`.
+        Returns `errors`.
+        """
+        retry_errors = super(LateXDocument, self).render_batch([jobs[position] for position in positions],
+                                                               **kwargs)
+        for position, error in zip(positions, retry_errors):
+            errors[position] = error
+        return errors
+
+    @staticmethod
+    def _joined_page_ranges(joined_path, n_docs):
+        """ Return the page ranges of the `n_docs` documents in the PDF file `joined_path`,
+        compiled from `join_tex_documents`.
+        """
+        marks_file = os.path.join(os.path.dirname(joined_path), PAGE_MARKS_FILENAME)
+        if os.path.exists(marks_file):
+            page_ranges = read_page_marks(marks_file)
+            if len(page_ranges) != n_docs:
+                raise IOError('Found {} page marks for {} documents.'.format(len(page_ranges), n_docs))
+            return page_ranges
+
+        # without the marks, each document must have the same number of pages
+        n_pages = count_pdf_pages(joined_path)
+        if n_pages % n_docs:
+            raise IOError('Could not split {} pages in {} documents.'.format(n_pages, n_docs))
+        doc_pages = n_pages // n_docs
+        return [(idx * doc_pages, (idx + 1) * doc_pages) for idx in range(n_docs)]
 
 
 class PDFLateXDocument(LateXDocument):
@@ -292,4 +870,70 @@ class PDFLateXDocument(LateXDocument):
 
 
 class XeLateXDocument(LateXDocument):
-    _render_function = staticmethod(xetex2pdf)
+    backend = 'xelatex'
+
+
+class PDFFormDocument(TextDocument):
+    """ A .pdf template document model with form fields or named destinations.
+    It is filled in-process, the filled document is the content of the output PDF file.
+
+    The form fields named as the content values are set to these values, and the
+    fields with Jinja2 markup in their value are filled as templates.
+    The content values named as a named destination of the PDF are written at
+    that position.
+    """
+    input_type = 'pdf'
+    file_type = 'pdf'
+    backend = 'copy'
+
+    def _setup_template_file(self, template_file_path):
+        """ Setup self.template, the content of the PDF file, and its fields.
+
+        Parameters
+        ----------
+        template_file_path: str
+            Document template file path.
+        """
+        with open(template_file_path, 'rb') as f:
+            self.template = f.read()
+
+        self._template_file = template_file_path
+        self._template_env = get_environment_for(template_file_path)
+
+        self._field_names = []
+        self._field_templates = {}
+        for name, value in get_pdf_form_fields(io.BytesIO(self.template)).items():
+            if any(marker in value for marker in JINJA_MARKERS):
+                self._field_templates[name] = self._template_env.from_string(value)
+            else:
+                self._field_names.append(name)
+
+        self._anchor_names = get_pdf_anchors(io.BytesIO(self.template))
+
+    def fill(self, doc_contents):
+        """ Fill the form fields of the PDF document with the information in doc_contents.
+
+        Parameters
+        ----------
+        doc_contents: dict
+            Set of values to set the template document.
+
+        Returns
+        -------
+        filled_doc: bytes
+            The content of the filled PDF document.
+        """
+        field_values = {name: doc_contents[name] for name in self._field_names if name in doc_contents}
+        field_values.update((name, template.render(**doc_contents))
+                            for name, template in self._field_templates.items())
+        anchor_texts = {name: doc_contents[name] for name in self._anchor_names if name in doc_contents}
+
+        out = io.BytesIO()
+        try:
+            fill_pdf_form(io.BytesIO(self.template), out, field_values, anchor_texts)
+        except (PyPdfError, KeyError, ValueError):
+            log.exception('Error filling PDF form for {}.'.format(doc_contents))
+            raise
+
+        self.file_content_ = out.getvalue()
+        return self.file_content_
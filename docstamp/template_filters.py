@@ -0,0 +1,63 @@
+"""
+Jinja2 filters and globals registered in the environments of the document
+templates, to generate per-document assets, e.g., QR codes, while filling them.
+
+Example of a badge SVG template with a QR code of the contact of each attendee:
+
+    <g transform="translate(10, 40)">{{ vcard()|qrcode_svg(color='333333') }}</g>
+"""
+from collections.abc import Mapping
+
+import jinja2
+from markupsafe import Markup
+
+from docstamp.qrcode import qrcode_svg as _qrcode_svg
+from docstamp.vcard import create_vcard3_str
+
+# Jinja2 < 3.0 names it `contextfunction`
+pass_context = getattr(jinja2, 'pass_context', None) or jinja2.contextfunction
+
+# the parameters of `create_vcard3_str`
+VCARD_FIELDS = ('name', 'surname', 'displayname', 'email', 'org', 'title', 'url', 'note')
+
+
+def vcard_filter(fields, **kwargs):
+    """ Return the vCard 3.0 string of the values in the mapping `fields`,
+    see vcard.create_vcard3_str. The fields in `kwargs` take precedence.
+    The unknown fields are ignored and the missing ones left empty.
+    """
+    if not isinstance(fields, Mapping):
+        raise TypeError('The vcard filter expects a mapping of the vCard fields, '
+                        'got {}.'.format(type(fields).__name__))
+
+    values = dict(fields, **kwargs)
+    return create_vcard3_str(**{field: values.get(field) or '' for field in VCARD_FIELDS})
+
+
+@pass_context
+def vcard_global(context, fields=None, **kwargs):
+    """ Return the vCard 3.0 string of the values in `fields` and `kwargs`,
+    or of the template values of the document if `fields` is not given.
+    """
+    if fields is None:
+        fields = context.get_all()
+    return vcard_filter(fields, **kwargs)
+
+
+def qrcode_svg_filter(text, color='', box_size=10, error_correction='L'):
+    """ Return the QR code of `text` as an SVG element to be inlined in the
+    document, not escaped. See qrcode.qrcode_svg, it is cached.
+    """
+    return Markup(_qrcode_svg(str(text), color=color, box_size=box_size,
+                              error_correction=error_correction))
+
+
+TEMPLATE_FILTERS = {
+    'vcard': vcard_filter,
+    'qrcode_svg': qrcode_svg_filter,
+}
+
+TEMPLATE_GLOBALS = {
+    'vcard': vcard_global,
+    'qrcode_svg': qrcode_svg_filter,
+}
@@ -0,0 +1,123 @@
+"""
+Timers of the stages of a run, e.g., filling the templates, writing files or
+calling the rendering commands, to find where the time of a run goes.
+
+The stages are timed with `stage` only inside a `record_timings` block of the same
+thread, otherwise they cost nothing. The time of a stage does not include the time
+of the stages inside it, so the stage times of a document add up to its total time.
+"""
+import json
+import math
+import time
+import threading
+import contextlib
+from collections import OrderedDict
+
+_local = threading.local()
+
+
+@contextlib.contextmanager
+def record_timings():
+    """ Record the time of the stages run inside the block in this thread.
+
+    Yields
+    ------
+    timings: dict
+        Seconds by stage name, filled when the stages end.
+    """
+    previous = getattr(_local, 'timings', None), getattr(_local, 'stack', None)
+    timings = {}
+    _local.timings, _local.stack = timings, []
+    try:
+        yield timings
+    finally:
+        _local.timings, _local.stack = previous
+
+
+@contextlib.contextmanager
+def stage(name):
+    """ Add the time of the block to the stage `name` of the current `record_timings`. """
+    timings = getattr(_local, 'timings', None)
+    if timings is None:
+        yield
+        return
+
+    stack = _local.stack
+    # time of the stages inside this one
+    stack.append(0.0)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        timings[name] = timings.get(name, 0.0) + elapsed - stack.pop()
+        if stack:
+            stack[-1] += elapsed
+
+
+def percentile(sorted_values, q):
+    """ Return the `q` percentile of `sorted_values` by the nearest-rank method. """
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class RunReport(object):
+    """ Timings, counts and failures of the documents of a run.
+
+    Parameters
+    ----------
+    info: dict
+        Description of the run, e.g., the template and the options, written in the report.
+    """
+
+    def __init__(self, **info):
+        self.info = info
+        self.items = []
+        self.n_skipped = 0
+        self._start = time.time()
+        self._stage_times = {}
+
+    def add_item(self, idx, file_path, success, error=None, timings=None):
+        """ Add the result and the stage timings of one document. """
+        timings = timings or {}
+        self.items.append(OrderedDict([('idx', idx),
+                                       ('file_path', file_path),
+                                       ('success', success),
+                                       ('error', error),
+                                       ('seconds', sum(timings.values())),
+                                       ('timings', timings)]))
+        for name, seconds in timings.items():
+            self._stage_times.setdefault(name, []).append(seconds)
+
+    def stages(self):
+        """ Return the count, total, p50, p95 and max seconds of each stage. """
+        summary = OrderedDict()
+        for name in sorted(self._stage_times):
+            values = sorted(self._stage_times[name])
+            summary[name] = OrderedDict([('count', len(values)),
+                                         ('total', sum(values)),
+                                         ('p50', percentile(values, 50)),
+                                         ('p95', percentile(values, 95)),
+                                         ('max', values[-1])])
+        return summary
+
+    def to_dict(self):
+        n_failed = sum(1 for item in self.items if not item['success'])
+        return OrderedDict([('info', self.info),
+                            ('started', time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self._start))),
+                            ('wall_seconds', time.time() - self._start),
+                            ('counts', OrderedDict([('items', len(self.items)),
+                                                    ('rendered', len(self.items) - n_failed),
+                                                    ('failed', n_failed),
+                                                    ('skipped', self.n_skipped)])),
+                            ('stages', self.stages()),
+                            ('failures', [OrderedDict((key, item[key]) for key in ('idx', 'file_path', 'error'))
+                                          for item in self.items if not item['success']]),
+                            ('items', self.items)])
+
+    def write(self, file_path):
+        """ Write the report in `file_path` as JSON. """
+        with open(file_path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
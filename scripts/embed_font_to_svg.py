@@ -29,7 +29,8 @@ def create_argparser():
 
 def get_base64_encoding(bin_filepath):
     """Return the base64 encoding of the given binary file"""
-    return base64.b64encode(open(bin_filepath, 'r').read())
+    with open(bin_filepath, 'rb') as f:
+        return base64.b64encode(f.read()).decode('ascii')
 
 
 def remove_ext(filepath):
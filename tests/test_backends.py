@@ -0,0 +1,100 @@
+import pytest
+from click.testing import CliRunner
+
+from docstamp.backends import (BACKENDS, Backend, UnsupportedDocument, find_backends, select_backend,
+                               export_content)
+from docstamp.cli.cli import create
+from docstamp.template import TextDocument
+
+
+class FakeBackend(Backend):
+    """ Writes the backend name and the content as the output file. """
+    input_types = ('svg',)
+    output_types = ('pdf',)
+    auto_select = True
+
+    def __init__(self, name, cost=10, fallback=None, unsupported=False, available=True):
+        self.name, self.cost, self.fallback = name, cost, fallback
+        self.unsupported, self.available = unsupported, available
+
+    def is_available(self):
+        return self.available
+
+    def export(self, content, output_file, file_type='pdf', dpi=150, **kwargs):
+        if self.unsupported:
+            raise UnsupportedDocument('{} can not render it.'.format(self.name))
+        with open(output_file, 'w') as f:
+            f.write('{}:{}'.format(self.name, content))
+
+
+@pytest.fixture
+def backends(monkeypatch):
+    """ Replace the registered backends by fake ones. """
+    fakes = [FakeBackend('cheap', cost=1, fallback='fallback', unsupported=True),
+             FakeBackend('fallback', cost=20),
+             FakeBackend('middle', cost=5),
+             FakeBackend('missing', cost=0, available=False)]
+    monkeypatch.setattr('docstamp.backends.BACKENDS', {backend.name: backend for backend in fakes})
+    return fakes
+
+
+def names(backends):
+    return [backend.name for backend in backends]
+
+
+def test_find_backends_by_cost(backends):
+    assert names(find_backends('svg', 'pdf')) == ['cheap', 'middle', 'fallback']
+    assert find_backends('svg', 'png') == []
+    assert find_backends('svg', 'pdf', support_unicode=True) == []
+
+
+def test_find_backends_preferred_and_its_fallback_first(backends):
+    assert names(find_backends('svg', 'pdf', preferred='middle')) == ['middle', 'cheap', 'fallback']
+    assert names(find_backends('svg', 'pdf', preferred='cheap')) == ['cheap', 'fallback', 'middle']
+
+
+def test_select_backend_without_capable_backends(backends):
+    with pytest.raises(ValueError):
+        select_backend('tex', 'pdf')
+
+
+def test_export_content_falls_back(backends, tmp_path):
+    output_file = str(tmp_path / 'out.pdf')
+
+    backend = export_content('<svg/>', output_file, 'svg', preferred='cheap')
+
+    assert backend.name == 'fallback'
+    assert open(output_file).read() == 'fallback:<svg/>'
+
+
+def test_export_content_unsupported(backends, tmp_path):
+    with pytest.raises(UnsupportedDocument):
+        export_content('<svg/>', str(tmp_path / 'out.pdf'), 'svg', preferred='cheap',
+                       file_type='png')
+
+
+@pytest.mark.parametrize('file_type', ['pdf', 'png', 'svg', 'txt'])
+def test_text_documents_are_copied(tmp_path, file_type):
+    template = tmp_path / 'template.txt'
+    template.write_text('Hello {{ name }}')
+    doc = TextDocument.from_template_file(str(template))
+    doc.fill({'name': 'Ane'})
+
+    assert select_backend('txt', file_type) is BACKENDS['copy']
+    doc.render(str(tmp_path / 'out'), file_type=file_type)
+    assert (tmp_path / 'out').read_text() == 'Hello Ane'
+
+
+def test_create_text_documents(tmp_path):
+    template = tmp_path / 'badge.txt'
+    template.write_text('Hello {{ name }}')
+    csv = tmp_path / 'people.csv'
+    csv.write_text('name\nAne\nJon\n')
+    outdir = tmp_path / 'out'
+
+    result = CliRunner().invoke(create, ['-i', str(csv), '-t', str(template), '-o', str(outdir),
+                                         '-f', 'name'])
+
+    assert result.exit_code == 0, result.output
+    assert 'Rendered 2 of 2 documents.' in result.output
+    assert (outdir / 'badge_Ane.pdf').read_text() == 'Hello Ane'
@@ -0,0 +1,102 @@
+import os
+
+from click.testing import CliRunner
+from PyPDF2 import PdfReader, PdfWriter
+
+from docstamp.cli.cli import create, merge, impose
+
+
+def write_file(folder, name, content):
+    path = os.path.join(str(folder), name)
+    with open(path, 'w') as f:
+        f.write(content)
+    return path
+
+
+def create_args(tmp_path, *args):
+    template = write_file(tmp_path, 'template.txt', '{{ name }}')
+    input_file = write_file(tmp_path, 'input.csv', 'name,email\nAne,a@x.org\n,\nJon,j@x.org\n')
+    return ['-i', input_file, '-t', template, '-o', str(tmp_path / 'out'), '--otype', 'pdf'] + list(args)
+
+
+def test_create_with_index(tmp_path):
+    result = CliRunner().invoke(create, create_args(tmp_path, '--index', '0', '--index', '2'))
+
+    assert result.exit_code == 0
+    assert sorted(os.listdir(str(tmp_path / 'out'))) == ['template_0.pdf', 'template_2.pdf']
+
+
+def test_create_with_invalid_index(tmp_path):
+    result = CliRunner().invoke(create, create_args(tmp_path, '--index', '1', '--index', '7'))
+
+    assert result.exit_code == 2
+    assert 'index 1, 7' in result.output
+
+
+def test_create_restores_the_settings(tmp_path, monkeypatch):
+    monkeypatch.setenv('DOCSTAMP_COMMAND_TIMEOUT', '5')
+    monkeypatch.delenv('DOCSTAMP_CACHE_DIR', raising=False)
+    monkeypatch.delenv('DOCSTAMP_TEMPLATE_CACHE', raising=False)
+
+    args = create_args(tmp_path, '--command-timeout', '60', '--template-cache',
+                       '--cache-dir', str(tmp_path / 'cache'))
+    result = CliRunner().invoke(create, args)
+
+    assert result.exit_code == 0
+    assert os.environ['DOCSTAMP_COMMAND_TIMEOUT'] == '5'
+    assert 'DOCSTAMP_CACHE_DIR' not in os.environ
+    assert 'DOCSTAMP_TEMPLATE_CACHE' not in os.environ
+    assert os.path.isdir(str(tmp_path / 'cache' / 'templates'))
+
+
+def write_pdf(folder, name, n_pages):
+    writer = PdfWriter()
+    for _ in range(n_pages):
+        writer.add_blank_page(width=100, height=100)
+    path = os.path.join(str(folder), name)
+    with open(path, 'wb') as f:
+        writer.write(f)
+    return path
+
+
+def test_merge(tmp_path):
+    (tmp_path / 'folder').mkdir()
+    write_pdf(tmp_path / 'folder', 'b.pdf', 2)
+    write_pdf(tmp_path / 'folder', 'a.pdf', 1)
+    write_file(tmp_path / 'folder', 'notes.txt', 'not a PDF')
+    last = write_pdf(tmp_path, 'c.pdf', 1)
+    out = str(tmp_path / 'merged.pdf')
+
+    result = CliRunner().invoke(merge, ['-o', out, '-b', '--batch-size', '2', str(tmp_path / 'folder'), last])
+
+    assert result.exit_code == 0
+    reader = PdfReader(out)
+    assert len(reader.pages) == 4
+    assert [(item.title, reader.get_destination_page_number(item)) for item in reader.outline] == [
+        ('a', 0), ('b', 1), ('c', 3)]
+
+
+def test_impose(tmp_path):
+    template = write_file(tmp_path, 'badge.svg', '<svg xmlns="http://www.w3.org/2000/svg" width="90mm" '
+                                                 'height="60mm"><text>{{ name }}</text></svg>')
+    input_file = write_file(tmp_path, 'input.csv', 'name\n' + ''.join('N{}\n'.format(idx) for idx in range(10)))
+    outdir = tmp_path / 'sheets'
+
+    result = CliRunner().invoke(impose, ['-i', input_file, '-t', template, '-o', str(outdir), '--otype', 'svg',
+                                         '--paper', 'a4', '--margin', '10', '--crop-marks'])
+
+    assert result.exit_code == 0
+    # 2 columns and 4 rows in each A4 sheet
+    assert sorted(os.listdir(str(outdir))) == ['badge_sheet_0.svg', 'badge_sheet_1.svg']
+    first, second = [(outdir / name).read_text() for name in sorted(os.listdir(str(outdir)))]
+    assert all('>N{}<'.format(idx) in first for idx in range(8))
+    assert '>N8<' in second and '>N9<' in second and '>N7<' not in second
+
+
+def test_impose_only_svg_templates(tmp_path):
+    args = create_args(tmp_path)[:4]
+
+    result = CliRunner().invoke(impose, args)
+
+    assert result.exit_code == 2
+    assert 'Only SVG templates can be imposed.' in result.output
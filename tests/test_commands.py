@@ -0,0 +1,81 @@
+import os
+import sys
+import pickle
+
+import pytest
+
+from docstamp.commands import (run_command, run_commands, call_command, CommandError,
+                               CommandTimeoutError)
+from docstamp.svg_utils import rsvg_export_content
+
+
+def python_command(code):
+    return [sys.executable, '-c', code]
+
+
+@pytest.fixture
+def failing_binary(tmp_path):
+    """ Path to an executable that writes an error and exits with code 1. """
+    path = tmp_path / 'failing'
+    path.write_text('#!/bin/sh\necho "failed to render" >&2\nexit 1\n')
+    path.chmod(0o755)
+    return str(path)
+
+
+def test_run_command_output():
+    result = run_command(python_command('import sys; print(sys.stdin.read().upper())'), stdin_content=b'abc')
+
+    assert result.returncode == 0
+    assert result.stdout.strip() == b'ABC'
+
+
+def test_run_command_failure_is_logged(caplog):
+    result = run_command(python_command('import sys; sys.exit(3)'))
+
+    assert result.returncode == 3
+    assert 'exited with code 3' in caplog.text
+
+
+def test_run_command_failure_raises_with_check():
+    with pytest.raises(CommandError) as excinfo:
+        run_command(python_command('import sys; sys.stderr.write("bad input"); sys.exit(3)'), check=True)
+
+    assert excinfo.value.result.returncode == 3
+    assert 'bad input' in str(excinfo.value)
+
+
+def test_command_error_is_pickled_with_its_result():
+    with pytest.raises(CommandError) as excinfo:
+        run_command(python_command('import sys; sys.exit(3)'), check=True)
+
+    error = pickle.loads(pickle.dumps(excinfo.value))
+    assert str(error) == str(excinfo.value)
+    assert error.result.returncode == 3
+
+
+def test_call_command_failure_raises_with_check():
+    with pytest.raises(CommandError):
+        call_command(sys.executable, ['-c', 'import sys; sys.exit(1)'], check=True)
+
+
+def test_run_command_timeout():
+    with pytest.raises(CommandTimeoutError):
+        run_command(python_command('import time; time.sleep(10)'), timeout=0.2)
+
+
+def test_run_commands_returns_the_errors():
+    results = run_commands([python_command('pass'),
+                            python_command('import time; time.sleep(10)')], timeout=0.5)
+
+    assert results[0].returncode == 0
+    assert isinstance(results[1], CommandTimeoutError)
+
+
+def test_failed_render_command_raises(failing_binary, tmp_path):
+    output_file = str(tmp_path / 'out.pdf')
+
+    with pytest.raises(CommandError):
+        rsvg_export_content('<svg xmlns="http://www.w3.org/2000/svg"/>', output_file,
+                            rsvg_binpath=failing_binary)
+
+    assert not os.path.exists(output_file)
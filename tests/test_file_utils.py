@@ -0,0 +1,49 @@
+import os
+import shutil
+
+import pytest
+
+from docstamp import file_utils
+
+
+@pytest.fixture
+def no_rename(monkeypatch):
+    """ Make the first os.replace call fail, as between file systems. """
+    calls = []
+    replace = os.replace
+
+    def fake_replace(src, dst):
+        calls.append(src)
+        if len(calls) == 1:
+            raise OSError('Invalid cross-device link')
+        return replace(src, dst)
+
+    monkeypatch.setattr(file_utils.os, 'replace', fake_replace)
+
+
+def test_move_file_copies_it_if_it_can_not_be_renamed(tmp_path, no_rename):
+    src, dst = tmp_path / 'src.txt', tmp_path / 'out' / 'dst.txt'
+    src.write_text('content')
+    dst.parent.mkdir()
+
+    file_utils.move_file(str(src), str(dst))
+
+    assert not src.exists()
+    assert dst.read_text() == 'content'
+    assert os.listdir(str(dst.parent)) == ['dst.txt']
+
+
+def test_move_file_removes_the_partial_copy(tmp_path, no_rename, monkeypatch):
+    src, dst = tmp_path / 'src.txt', tmp_path / 'out' / 'dst.txt'
+    src.write_text('content')
+    dst.parent.mkdir()
+
+    def fail_copy(src, dst):
+        raise KeyboardInterrupt()
+
+    monkeypatch.setattr(shutil, 'copyfile', fail_copy)
+    with pytest.raises(KeyboardInterrupt):
+        file_utils.move_file(str(src), str(dst))
+
+    assert src.exists()
+    assert os.listdir(str(dst.parent)) == []
@@ -0,0 +1,86 @@
+import json
+import os
+
+from click.testing import CliRunner
+
+from docstamp.cli.cli import create
+from docstamp.journal import RenderJournal, JOURNAL_FILENAME, row_hash
+from docstamp.parallel import RenderResult
+
+
+def render(outdir, name, content):
+    file_path = os.path.join(outdir, name)
+    with open(file_path, 'w') as f:
+        f.write(content)
+    return file_path
+
+
+def test_journal_resume(tmp_path):
+    outdir, template = str(tmp_path), render(str(tmp_path), 'template.txt', '{{ name }}')
+    item = {'name': 'Ane'}
+    file_path = render(outdir, 'out.txt', 'Ane')
+
+    with RenderJournal(outdir, template, {'dpi': 150}) as journal:
+        journal.record(RenderResult(0, file_path, True, None), row_hash(item))
+
+    assert RenderJournal(outdir, template, {'dpi': 150}).is_done(row_hash(item), file_path)
+    assert not RenderJournal(outdir, template, {'dpi': 300}).is_done(row_hash(item), file_path)
+    assert not RenderJournal(outdir, template, {'dpi': 150}).is_done(row_hash({'name': 'Jon'}), file_path)
+
+
+def test_journal_keeps_the_last_entry_of_each_output(tmp_path):
+    outdir, template = str(tmp_path), render(str(tmp_path), 'template.txt', '{{ name }}')
+    file_paths = [render(outdir, 'out_{}.txt'.format(idx), str(idx)) for idx in range(3)]
+
+    for _ in range(4):
+        with RenderJournal(outdir, template, {'dpi': 150}) as journal:
+            for idx, file_path in enumerate(file_paths):
+                journal.record(RenderResult(idx, file_path, True, None), row_hash({'idx': idx}))
+
+    journal = RenderJournal(outdir, template, {'dpi': 150})
+    with open(os.path.join(outdir, JOURNAL_FILENAME)) as f:
+        # the header and one line per document
+        assert len(f.readlines()) == len(file_paths) + 1
+    assert all(journal.is_done(row_hash({'idx': idx}), file_path) for idx, file_path in enumerate(file_paths))
+
+
+def test_journal_is_replaced_when_the_options_change(tmp_path):
+    outdir, template = str(tmp_path), render(str(tmp_path), 'template.txt', '{{ name }}')
+    file_path = render(outdir, 'out.txt', 'Ane')
+
+    with RenderJournal(outdir, template, {'dpi': 150}) as journal:
+        journal.record(RenderResult(0, file_path, True, None), row_hash({'name': 'Ane'}))
+    with RenderJournal(outdir, template, {'dpi': 300}) as journal:
+        journal.record(RenderResult(0, file_path, True, None), row_hash({'name': 'Ane'}))
+
+    with open(os.path.join(outdir, JOURNAL_FILENAME)) as f:
+        lines = [json.loads(line) for line in f]
+    assert lines[0]['options'] == {'dpi': 300}
+    assert len(lines) == 2
+    assert 'options' not in lines[1]
+
+
+def test_journal_detects_modified_outputs(tmp_path):
+    outdir, template = str(tmp_path), render(str(tmp_path), 'template.txt', '{{ name }}')
+    file_path = render(outdir, 'out.txt', 'Ane')
+
+    with RenderJournal(outdir, template, {}) as journal:
+        journal.record(RenderResult(0, file_path, True, None), row_hash({}))
+    render(outdir, 'out.txt', 'Ane Jon')
+
+    assert not RenderJournal(outdir, template, {}).is_done(row_hash({}), file_path)
+
+
+def test_create_writes_the_journal_only_to_resume(tmp_path):
+    template = render(str(tmp_path), 'template.txt', '{{ name }}')
+    input_file = render(str(tmp_path), 'input.csv', 'name\nAne\nJon\n')
+    outdir = str(tmp_path / 'out')
+    args = ['-i', input_file, '-t', template, '-o', outdir, '-f', 'name', '--otype', 'pdf']
+
+    assert CliRunner().invoke(create, args).exit_code == 0
+    assert not os.path.exists(os.path.join(outdir, JOURNAL_FILENAME))
+
+    assert CliRunner().invoke(create, args + ['--resume']).exit_code == 0
+    result = CliRunner().invoke(create, args + ['--resume'])
+    assert result.exit_code == 0
+    assert 'Skipped 2 documents already rendered.' in result.output
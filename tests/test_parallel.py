@@ -0,0 +1,52 @@
+import os
+import multiprocessing
+
+import pytest
+
+from docstamp.backends import BACKENDS, Backend
+from docstamp.parallel import render_items
+
+# the test backend is registered in the worker processes by forking this one
+pytestmark = pytest.mark.skipif(multiprocessing.get_start_method() != 'fork',
+                                reason='The worker processes must be forked.')
+
+
+class CrashingBackend(Backend):
+    """ Writes the document content as the output file, and kills the
+    process if the content has 'CRASH'.
+    """
+    name = 'test-crashing'
+    input_types = ('svg',)
+    output_types = ('pdf',)
+    auto_select = False
+
+    def export(self, content, output_file, file_type='pdf', dpi=150, **kwargs):
+        if 'CRASH' in content:
+            os._exit(1)
+        with open(output_file, 'w') as f:
+            f.write(content)
+
+
+@pytest.fixture
+def template(tmp_path, monkeypatch):
+    monkeypatch.setitem(BACKENDS, CrashingBackend.name, CrashingBackend())
+    path = tmp_path / 'template.svg'
+    path.write_text('<svg xmlns="http://www.w3.org/2000/svg"><text>{{ name }}</text></svg>')
+    return str(path)
+
+
+@pytest.mark.parametrize('chunk_size', [0, 3])
+def test_render_items_with_a_crashed_worker(template, tmp_path, chunk_size):
+    names = ['Doc{}'.format(idx) for idx in range(100)]
+    names[5] = 'CRASH'
+    jobs = [(idx, {'name': name}, str(tmp_path / '{}.pdf'.format(idx))) for idx, name in enumerate(names)]
+
+    results = list(render_items(template, CrashingBackend.name, iter(jobs), n_jobs=2,
+                                chunk_size=chunk_size, backend=CrashingBackend.name))
+
+    assert sorted(result.idx for result in results) == list(range(len(jobs)))
+    failed = {result.idx: result.error for result in results if not result.success}
+    assert 'worker crashed' in failed[5]
+    # the documents after the crash are rendered in a new pool
+    assert all(result.success for result in results if result.idx >= 60)
+    assert all(os.path.exists(result.file_path) for result in results if result.success)
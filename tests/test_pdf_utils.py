@@ -0,0 +1,61 @@
+import os
+
+from PyPDF2 import PdfReader, PdfWriter
+
+from docstamp.pdf_utils import merge_pdfs, split_pdf, count_pdf_pages
+
+
+def write_pdfs(folder, n_pages):
+    """ Write a PDF file with each number of blank pages in `n_pages` and return their paths. """
+    paths = []
+    for idx, pages in enumerate(n_pages):
+        writer = PdfWriter()
+        for _ in range(pages):
+            writer.add_blank_page(width=100, height=100)
+        path = os.path.join(folder, 'in_{}.pdf'.format(idx))
+        with open(path, 'wb') as f:
+            writer.write(f)
+        paths.append(path)
+    return paths
+
+
+def read_bookmarks(pdf_filepath):
+    """ Return the title and the destination page index of the bookmarks of the PDF file. """
+    with open(pdf_filepath, 'rb') as pdf:
+        reader = PdfReader(pdf)
+        return [(dest.title, reader.get_destination_page_number(dest)) for dest in reader.outline]
+
+
+def test_merge_pdfs_bookmarks(tmp_path):
+    pdfs = write_pdfs(str(tmp_path), [1] * 7)
+    titles = ['Document {}'.format(idx) for idx in range(len(pdfs))]
+    out = str(tmp_path / 'merged.pdf')
+
+    merge_pdfs(pdfs, out, bookmarks=titles)
+
+    assert count_pdf_pages(out) == 7
+    assert read_bookmarks(out) == [(title, idx) for idx, title in enumerate(titles)]
+
+
+def test_merge_pdfs_bookmarks_in_batches(tmp_path):
+    # the intermediate files are merged again, with the bookmarks of their inputs
+    pages = [1, 2, 1, 3, 1, 1, 2]
+    pdfs = write_pdfs(str(tmp_path), pages)
+    titles = ['Document {}'.format(idx) for idx in range(len(pdfs))]
+    out = str(tmp_path / 'merged.pdf')
+
+    merge_pdfs(pdfs, out, bookmarks=titles, batch_size=2)
+
+    first_pages = [sum(pages[:idx]) for idx in range(len(pages))]
+    assert count_pdf_pages(out) == sum(pages)
+    assert read_bookmarks(out) == list(zip(titles, first_pages))
+
+
+def test_split_pdf(tmp_path):
+    merged = str(tmp_path / 'merged.pdf')
+    merge_pdfs(write_pdfs(str(tmp_path), [1, 2, 3]), merged)
+    outs = [str(tmp_path / 'out_{}.pdf'.format(idx)) for idx in range(3)]
+
+    split_pdf(merged, [(0, 1), (1, 3), (3, 6)], outs)
+
+    assert [count_pdf_pages(out) for out in outs] == [1, 2, 3]
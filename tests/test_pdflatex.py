@@ -0,0 +1,121 @@
+import hashlib
+import os
+
+import pytest
+from PyPDF2 import PdfWriter
+
+from docstamp import pdflatex
+from docstamp.backends import BACKENDS, LatexBackend
+from docstamp.pdf_utils import count_pdf_pages
+from docstamp.template import TextDocument, LateXDocument
+
+TEX_BODY = '\\begin{document}\n{{ name }}\n\\end{document}\n'
+
+
+def write_template(tmp_path, preamble):
+    path = tmp_path / 'template.tex'
+    path.write_text(preamble + TEX_BODY, encoding='utf-8')
+    return str(path)
+
+
+def test_static_preamble_is_precompiled(tmp_path):
+    doc = TextDocument.from_template_file(write_template(tmp_path, '\\documentclass{article}\n'))
+
+    assert isinstance(doc, LateXDocument)
+    assert doc.has_static_preamble()
+    assert doc._render_options({'precompile_preamble': True})['precompile_preamble']
+
+
+def test_preamble_with_fields_is_not_precompiled(tmp_path):
+    preamble = '\\documentclass{article}\n\\title{ {{- title -}} }\n'
+    doc = TextDocument.from_template_file(write_template(tmp_path, preamble))
+
+    assert not doc.has_static_preamble()
+    assert not doc._render_options({'precompile_preamble': True})['precompile_preamble']
+
+
+def test_least_recently_used_formats_are_evicted(tmp_path):
+    for idx in range(5):
+        fmt_file = tmp_path / 'pdflatex-{}.fmt'.format(idx)
+        fmt_file.write_bytes(b'fmt')
+        os.utime(str(fmt_file), (idx, idx))
+    (tmp_path / 'other.txt').write_text('keep')
+
+    pdflatex._evict_formats(str(tmp_path), 2)
+
+    assert sorted(os.listdir(str(tmp_path))) == ['other.txt', 'pdflatex-3.fmt', 'pdflatex-4.fmt']
+
+
+def test_cached_format_is_marked_as_used(tmp_path):
+    preamble = '\\documentclass{article}\n'
+    fmt_file = tmp_path / 'pdflatex-{}.fmt'.format(hashlib.sha256(preamble.encode('utf-8')).hexdigest())
+    fmt_file.write_bytes(b'fmt')
+    os.utime(str(fmt_file), (0, 0))
+
+    assert pdflatex.make_format(preamble, format_dir=str(tmp_path)) == str(fmt_file)
+    assert os.path.getmtime(str(fmt_file)) > 0
+
+
+class FakeLatexBackend(LatexBackend):
+    """ Writes a blank page per ROW of the content, fails if it has BAD. """
+    name = 'pdflatex'
+    binary = None
+
+    def __init__(self):
+        self.calls = []
+
+    def export(self, content, output_file, file_type='pdf', dpi=150, scratch_dir=None, **kwargs):
+        n_docs = content.count('ROW')
+        self.calls.append(n_docs)
+        if 'BAD' in content:
+            raise IOError('Undefined control sequence.')
+
+        writer = PdfWriter()
+        for _ in range(n_docs):
+            writer.add_blank_page(width=100, height=100)
+        with open(output_file, 'wb') as f:
+            writer.write(f)
+        if scratch_dir is not None:
+            with open(os.path.join(scratch_dir, pdflatex.PAGE_MARKS_FILENAME), 'w') as f:
+                f.write('\n'.join(str(idx) for idx in range(n_docs + 1)))
+
+
+@pytest.fixture
+def latex_backend(monkeypatch):
+    backend = FakeLatexBackend()
+    monkeypatch.setitem(BACKENDS, 'pdflatex', backend)
+    return backend
+
+
+def batch_jobs(tmp_path, names):
+    return [({'name': name}, str(tmp_path / '{}.pdf'.format(idx))) for idx, name in enumerate(names)]
+
+
+def test_latex_batch_is_compiled_in_one_call(tmp_path, latex_backend):
+    doc = TextDocument.from_template_file(write_template(tmp_path, '\\documentclass{article}\n'))
+    jobs = batch_jobs(tmp_path, ['ROW Ane', 'ROW Jon', 'ROW Miren'])
+
+    assert doc.render_batch(jobs) == [None, None, None]
+    assert latex_backend.calls == [3]
+    assert all(count_pdf_pages(file_path) == 1 for _, file_path in jobs)
+
+
+def test_latex_batch_with_errors_is_compiled_one_by_one(tmp_path, latex_backend):
+    doc = TextDocument.from_template_file(write_template(tmp_path, '\\documentclass{article}\n'))
+    jobs = batch_jobs(tmp_path, ['ROW Ane', 'ROW BAD', 'ROW Miren'])
+
+    errors = doc.render_batch(jobs)
+
+    assert errors[0] is None and errors[2] is None
+    assert 'Undefined control sequence' in errors[1]
+    assert latex_backend.calls == [3, 1, 1, 1]
+    assert not os.path.exists(jobs[1][1])
+
+
+def test_latex_batch_with_different_preambles_is_compiled_one_by_one(tmp_path, latex_backend):
+    preamble = '\\documentclass{ {{- name[4:] -}} }\n'
+    doc = TextDocument.from_template_file(write_template(tmp_path, preamble))
+    jobs = batch_jobs(tmp_path, ['ROW article', 'ROW report'])
+
+    assert doc.render_batch(jobs) == [None, None]
+    assert latex_backend.calls == [1, 1]
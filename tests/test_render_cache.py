@@ -0,0 +1,96 @@
+import os
+
+import pytest
+
+from docstamp.backends import BACKENDS, Backend, UnsupportedDocument
+from docstamp.render_cache import RenderCache
+from docstamp.template import TextDocument
+
+
+class CopyBackend(Backend):
+    """ Writes the document content as the output file and counts the calls. """
+    name = 'test-copy'
+    input_types = ('svg',)
+    output_types = ('pdf',)
+    auto_select = False
+
+    def __init__(self):
+        self.calls = 0
+
+    def export(self, content, output_file, file_type='pdf', dpi=150, **kwargs):
+        self.calls += 1
+        with open(output_file, 'w') as f:
+            f.write(content)
+
+
+class UnsupportedBackend(CopyBackend):
+    name = 'test-unsupported'
+    fallback = 'test-copy'
+
+    def export(self, content, output_file, file_type='pdf', dpi=150, **kwargs):
+        raise UnsupportedDocument('Can not render it.')
+
+
+@pytest.fixture
+def copy_backend(monkeypatch):
+    backend = CopyBackend()
+    monkeypatch.setitem(BACKENDS, backend.name, backend)
+    monkeypatch.setitem(BACKENDS, UnsupportedBackend.name, UnsupportedBackend())
+    return backend
+
+
+@pytest.fixture
+def document(tmp_path):
+    template = tmp_path / 'template.svg'
+    template.write_text('<svg xmlns="http://www.w3.org/2000/svg"><text>{{ name }}</text></svg>')
+    doc = TextDocument.from_template_file(str(template))
+    doc.fill({'name': 'Ane'})
+    return doc
+
+
+def render_twice(document, tmp_path, backend):
+    for idx in range(2):
+        document.render(str(tmp_path / '{}.pdf'.format(idx)), backend=backend,
+                        cache_dir=str(tmp_path / 'cache'))
+        assert 'Ane' in (tmp_path / '{}.pdf'.format(idx)).read_text()
+
+
+def test_render_cache(copy_backend, document, tmp_path):
+    render_twice(document, tmp_path, 'test-copy')
+
+    assert copy_backend.calls == 1
+
+
+def test_render_cache_skips_the_fallback_backends(copy_backend, document, tmp_path):
+    render_twice(document, tmp_path, 'test-unsupported')
+
+    assert copy_backend.calls == 2
+
+
+def test_render_cache_replaces_an_entry(tmp_path):
+    rendered = tmp_path / 'rendered.pdf'
+    rendered.write_bytes(b'x' * 100)
+    cache = RenderCache(str(tmp_path / 'cache'), max_size=1000)
+    cache.store('other', str(rendered))
+
+    for _ in range(3):
+        cache.store('key', str(rendered))
+
+    assert cache._size == cache.size() == 200
+    assert cache.fetch('key', str(tmp_path / 'out.pdf'))
+
+
+def test_render_cache_evicts_the_least_recently_used(tmp_path):
+    rendered = tmp_path / 'rendered.pdf'
+    rendered.write_bytes(b'x' * 100)
+    cache = RenderCache(str(tmp_path / 'cache'), max_size=350)
+    for key in ('first', 'second', 'third'):
+        cache.store(key, str(rendered))
+    os.utime(cache._path('first'), (0, 0))
+    os.utime(cache._path('second'), (0, 0))
+    cache.fetch('first', str(tmp_path / 'out.pdf'))
+
+    cache.store('fourth', str(rendered))
+
+    assert not cache.fetch('second', str(tmp_path / 'out.pdf'))
+    assert cache.size() == 300
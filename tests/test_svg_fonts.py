@@ -0,0 +1,92 @@
+import io
+import re
+import base64
+
+import pytest
+
+from docstamp import svg_fonts
+
+FontBuilder = pytest.importorskip('fontTools.fontBuilder').FontBuilder
+TTGlyphPen = pytest.importorskip('fontTools.pens.ttGlyphPen').TTGlyphPen
+TTFont = pytest.importorskip('fontTools.ttLib').TTFont
+
+CHARACTERS = 'ABCDEFGHIJ'
+
+
+@pytest.fixture
+def font_file(tmp_path):
+    """ Write a TrueType font with a square glyph for each of the CHARACTERS. """
+    glyph_names = ['.notdef'] + list(CHARACTERS)
+    builder = FontBuilder(1000, isTTF=True)
+    builder.setupGlyphOrder(glyph_names)
+    builder.setupCharacterMap({ord(char): char for char in CHARACTERS})
+
+    glyphs = {}
+    for name in glyph_names:
+        pen = TTGlyphPen(None)
+        pen.moveTo((100, 0))
+        pen.lineTo((100, 700))
+        pen.lineTo((500, 700))
+        pen.closePath()
+        glyphs[name] = pen.glyph()
+    builder.setupGlyf(glyphs)
+    builder.setupHorizontalMetrics({name: (600, 100) for name in glyph_names})
+    builder.setupHorizontalHeader(ascent=800, descent=-200)
+    builder.setupNameTable({'familyName': 'Docstamp Test', 'styleName': 'Regular'})
+    builder.setupOS2()
+    builder.setupPost()
+
+    path = str(tmp_path / 'DocstampTest.ttf')
+    builder.save(path)
+    svg_fonts._ENCODED_FONTS.clear()
+    return path
+
+
+def font_characters(content):
+    font = TTFont(io.BytesIO(content))
+    return {chr(code) for code in font.getBestCmap()}
+
+
+def embedded_font(svg_content):
+    encoding = re.search('base64,([^)]+)\\)', svg_content).group(1)
+    return base64.b64decode(encoding)
+
+
+def test_subset_font(font_file):
+    assert font_characters(svg_fonts.subset_font(font_file, 'CAB')) == set('ABC')
+
+
+def test_embed_fonts_in_svg_content_subsets_them(font_file):
+    svg = '<svg xmlns="http://www.w3.org/2000/svg"><style>text {}</style><text>BAD</text></svg>'
+
+    content = svg_fonts.embed_fonts_in_svg_content(svg, [font_file])
+
+    assert 'font-family: DocstampTest;' in content
+    assert font_characters(embedded_font(content)) == set('ABD')
+
+
+def test_embed_fonts_in_svg_content_without_subset(font_file):
+    svg = '<svg xmlns="http://www.w3.org/2000/svg"><text>BAD</text></svg>'
+
+    content = svg_fonts.embed_fonts_in_svg_content(svg, [font_file], subset=False)
+
+    assert font_characters(embedded_font(content)) == set(CHARACTERS)
+
+
+def test_encoded_fonts_are_cached_by_glyph_set(font_file, monkeypatch):
+    calls = []
+    subset_font = svg_fonts.subset_font
+    monkeypatch.setattr(svg_fonts, 'subset_font', lambda *args: calls.append(args) or subset_font(*args))
+
+    first = svg_fonts.get_encoded_font(font_file, text='ABBA')
+    assert svg_fonts.get_encoded_font(font_file, text='BA') == first
+    assert svg_fonts.get_encoded_font(font_file, text='ABC') != first
+    assert calls == [(font_file, 'AB'), (font_file, 'ABC')]
+
+
+def test_whole_font_is_embedded_without_fonttools(font_file, monkeypatch):
+    monkeypatch.setattr(svg_fonts, 'font_subset', None)
+
+    encoding = svg_fonts.get_encoded_font(font_file, text='AB')
+
+    assert font_characters(base64.b64decode(encoding)) == set(CHARACTERS)
@@ -0,0 +1,90 @@
+import re
+
+import pytest
+from PyPDF2 import PdfReader, PdfWriter
+
+from docstamp.backends import BACKENDS, Backend
+from docstamp.pdf_utils import _text_page, stamp_pdf
+from docstamp.svg_utils import split_svg_layers
+from docstamp.template import TextDocument
+
+SVG_TEMPLATE = ('<svg xmlns="http://www.w3.org/2000/svg" width="200" height="200">'
+                '<defs><style>text {font-size: 10px}</style></defs>'
+                '<rect width="200" height="200"/>'
+                '<text x="10" y="20">Static title</text>'
+                '<g id="card"><text x="10" y="50">{{ name }}</text><text x="10" y="80">Badge</text></g>'
+                '</svg>')
+
+
+def write_text_pdf(path, texts):
+    writer = PdfWriter()
+    writer.add_page(_text_page(200, 200, [(10, 10 + 30 * idx, text) for idx, text in enumerate(texts)], 10))
+    with open(path, 'wb') as f:
+        writer.write(f)
+    return path
+
+
+class TextPDFBackend(Backend):
+    """ Writes the texts of the SVG content in a PDF and counts the calls. """
+    name = 'test-text-pdf'
+    input_types = ('svg',)
+    output_types = ('pdf',)
+    auto_select = False
+
+    def __init__(self):
+        self.calls = 0
+
+    def export(self, content, output_file, file_type='pdf', dpi=150, **kwargs):
+        self.calls += 1
+        write_text_pdf(output_file, re.findall('<text[^>]*>([^<]*)</text>', content))
+
+
+@pytest.fixture
+def text_backend(monkeypatch):
+    backend = TextPDFBackend()
+    monkeypatch.setitem(BACKENDS, backend.name, backend)
+    return backend
+
+
+def test_split_svg_layers():
+    background, overlay = split_svg_layers(SVG_TEMPLATE)
+
+    assert 'Static title' in background and 'Badge' in background
+    assert '{{ name }}' not in background
+    # the dynamic elements, their parents and the shared styles
+    assert '{{ name }}' in overlay and '<g id="card">' in overlay and '<style>' in overlay
+    assert 'Static title' not in overlay and 'Badge' not in overlay and '<rect' not in overlay
+
+
+@pytest.mark.parametrize('template', ['<svg xmlns="http://www.w3.org/2000/svg"><text>Static</text></svg>',
+                                      '<svg xmlns="http://www.w3.org/2000/svg" width="{{ width }}"/>',
+                                      '{% for name in names %}<svg/>{% endfor %}'])
+def test_split_svg_layers_errors(template):
+    with pytest.raises(ValueError):
+        split_svg_layers(template)
+
+
+def test_stamp_pdf(tmp_path):
+    background = write_text_pdf(str(tmp_path / 'background.pdf'), ['Static title'])
+    overlay = write_text_pdf(str(tmp_path / 'overlay.pdf'), ['', 'Ane'])
+
+    stamp_pdf(background, overlay, str(tmp_path / 'out.pdf'))
+
+    text = PdfReader(str(tmp_path / 'out.pdf')).pages[0].extract_text()
+    assert 'Static title' in text and 'Ane' in text
+
+
+def test_render_static_background(tmp_path, text_backend):
+    template = tmp_path / 'template.svg'
+    template.write_text(SVG_TEMPLATE)
+    doc = TextDocument.from_template_file(str(template))
+
+    for name in ('Ane', 'Jon'):
+        doc.fill({'name': name})
+        doc.render(str(tmp_path / '{}.pdf'.format(name)), backend=text_backend.name, static_background=True)
+
+    # the background is rendered once, and an overlay for each document
+    assert text_backend.calls == 3
+    text = PdfReader(str(tmp_path / 'Jon.pdf')).pages[0].extract_text()
+    assert 'Static title' in text and 'Badge' in text and 'Jon' in text
+    assert 'Ane' not in text
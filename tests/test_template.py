@@ -0,0 +1,96 @@
+import pytest
+from PyPDF2 import PdfReader
+from PyPDF2.errors import PyPdfError
+
+from docstamp.template import TextDocument, SVGDocument, SVGDOMDocument, PDFFormDocument
+
+SVG_HEADER = '<svg xmlns="http://www.w3.org/2000/svg" width="90mm" height="60mm">'
+
+
+def write_template(tmp_path, content, name='template.svg'):
+    path = tmp_path / name
+    path.write_text(SVG_HEADER + content + '</svg>', encoding='utf-8')
+    return str(path)
+
+
+def test_svg_template_with_fields_is_filled_in_the_dom(tmp_path):
+    template = write_template(tmp_path, '<text id="name" data-docstamp-field="name"><tspan>Name</tspan></text>'
+                                        '<text id="company">Company</text>')
+
+    doc = TextDocument.from_template_file(template)
+    content = doc.fill({'name': 'Ane & <Jon>', 'company': 'ACPySS'})
+
+    assert type(doc) is SVGDOMDocument
+    assert '<tspan>Ane &amp; &lt;Jon&gt;</tspan>' in content
+    # the elements are not bound by their id
+    assert '>Company</text>' in content
+
+
+def test_svg_template_without_markup_is_rendered_as_it_is(tmp_path):
+    template = write_template(tmp_path, '<text id="name">Name</text>')
+
+    doc = TextDocument.from_template_file(template)
+
+    assert type(doc) is SVGDocument
+    assert '>Name</text>' in doc.fill({'name': 'Ane'})
+
+
+def test_svg_template_with_jinja_markup(tmp_path):
+    template = write_template(tmp_path, '<text data-docstamp-field="name">{{ name }}</text>')
+
+    doc = TextDocument.from_template_file(template)
+
+    assert type(doc) is SVGDocument
+    assert '>Ane &amp; Jon</text>' in doc.fill({'name': 'Ane & Jon'})
+
+
+def form_pdf(fields):
+    """ Return the content of a one page PDF file with a text field for each of the
+    `fields` (name, value) and a named destination 'email'.
+    """
+    refs = ' '.join('{} 0 R'.format(5 + idx) for idx in range(len(fields)))
+    objects = ['<< /Type /Catalog /Pages 2 0 R /AcroForm << /Fields [{}] >> '
+               '/Names << /Dests 4 0 R >> >>'.format(refs),
+               '<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+               '<< /Type /Page /Parent 2 0 R /MediaBox [0 0 200 200] /Annots [{}] >>'.format(refs),
+               '<< /Names [(email) [3 0 R /XYZ 10 150 0]] >>']
+    for idx, (name, value) in enumerate(fields):
+        objects.append('<< /Type /Annot /Subtype /Widget /FT /Tx /P 3 0 R /T ({}) /V ({}) '
+                       '/Rect [10 {} 190 {}] >>'.format(name, value, 10 + 30 * idx, 30 + 30 * idx))
+
+    content = '%PDF-1.4\n'
+    offsets = []
+    for obj_id, obj in enumerate(objects, 1):
+        offsets.append(len(content))
+        content += '{} 0 obj\n{}\nendobj\n'.format(obj_id, obj)
+    xref = len(content)
+    content += 'xref\n0 {}\n0000000000 65535 f \n'.format(len(objects) + 1)
+    content += ''.join('{:010d} 00000 n \n'.format(offset) for offset in offsets)
+    content += 'trailer\n<< /Size {} /Root 1 0 R >>\nstartxref\n{}\n%%EOF\n'.format(len(objects) + 1, xref)
+    return content.encode('latin-1')
+
+
+def test_pdf_form_is_filled(tmp_path):
+    template = tmp_path / 'form.pdf'
+    template.write_bytes(form_pdf([('name', ''), ('greeting', 'Hello {{ name }}')]))
+
+    doc = TextDocument.from_template_file(str(template))
+    doc.fill({'name': 'Ane', 'email': 'ane@acpyss.org'})
+    doc.render(str(tmp_path / 'out.pdf'))
+
+    reader = PdfReader(str(tmp_path / 'out.pdf'))
+    assert type(doc) is PDFFormDocument
+    assert {name: field.get('/V') for name, field in reader.get_fields().items()} == {
+        'name': 'Ane', 'greeting': 'Hello Ane'}
+    assert reader.trailer['/Root']['/AcroForm']['/NeedAppearances']
+    assert 'ane@acpyss.org' in reader.pages[0].extract_text()
+
+
+def test_pdf_form_fill_error(tmp_path):
+    template = tmp_path / 'form.pdf'
+    template.write_bytes(form_pdf([('name', '')]))
+    doc = TextDocument.from_template_file(str(template))
+    doc.template = doc.template[:100]
+
+    with pytest.raises(PyPdfError):
+        doc.fill({'name': 'Ane'})